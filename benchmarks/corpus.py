@@ -0,0 +1,204 @@
+"""
+Generate synthetic documentation sites and serve them over HTTP.
+
+A site is a tree of pages like the ones in tests/documents: each page has
+a title, a header that links to every top-level section, and a
+".main-content" element with an introduction, several H2 sections of
+paragraphs, lists and code blocks, and links to its child pages. The
+text mixes words from the test documents with the literal terms and
+synonyms of the Redis Labs sites, so parsing, escaping and searching do
+the same kind of work as they do for the real sites.
+
+Generation is deterministic for a given seed.
+"""
+import os
+import random
+import re
+import threading
+from dataclasses import dataclass
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Tuple
+
+from bs4 import BeautifulSoup
+
+from sitesearch.sites.redis_labs import LITERAL_TERMS, SYNONYMS
+
+TEST_DOCS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "tests", "documents")
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+  <head>
+    <meta charset="utf-8">
+    <title>{title} | Synthetic Documentation Center</title>
+    <link href="/css/style.css" rel="stylesheet">
+    <script src="/js/site.js"></script>
+  </head>
+  <body>
+    <header id="header">
+      <nav class="shortcuts">
+        <ul>{nav}</ul>
+      </nav>
+    </header>
+    <article>
+      <div class="main-content">
+        <div class="main-content-left">
+          <h1>{title}</h1>
+          {body}
+        </div>
+        <div class="main-content-right">
+          <h4>Page Contents</h4>
+          <ul>{toc}</ul>
+        </div>
+      </div>
+    </article>
+    <footer><p>Copyright &copy; Synthetic Docs</p></footer>
+  </body>
+</html>
+"""
+
+
+@dataclass
+class Corpus:
+    """A generated site on disk."""
+    root: str
+    paths: List[str]  # The URL path of every page, like "/topic-1/topic-9/".
+    vocabulary: List[str]  # Words used in the pages, most frequent first.
+    bytes: int
+
+
+def load_vocabulary() -> List[str]:
+    """Get the words of the test documents, most frequent first."""
+    counts = {}
+    for filename in sorted(os.listdir(TEST_DOCS_DIR)):
+        with open(os.path.join(TEST_DOCS_DIR, filename), encoding="utf-8") as f:
+            text = BeautifulSoup(f.read(), "html.parser").get_text()
+        for word in re.findall(r"[A-Za-z][a-z]{2,}", text):
+            word = word.lower()
+            counts[word] = counts.get(word, 0) + 1
+    return sorted(counts, key=lambda w: (-counts[w], w))
+
+
+class TextGenerator:
+    """Make sentences with a Zipf-like word distribution."""
+    def __init__(self, rng: random.Random, vocabulary: List[str]):
+        self.rng = rng
+        self.vocabulary = vocabulary
+        self.weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+        self.special = list(LITERAL_TERMS) + sorted(
+            synonym for group in SYNONYMS for synonym in group.synonyms)
+
+    def words(self, n: int) -> List[str]:
+        words = self.rng.choices(self.vocabulary, self.weights, k=n)
+        # Sprinkle in terms that the escaper and synonyms special-case.
+        for i in range(0, n, 12):
+            words[self.rng.randrange(i, min(i + 12, n))] = self.rng.choice(self.special)
+        return words
+
+    def title(self) -> str:
+        return " ".join(self.words(self.rng.randint(2, 6))).capitalize()
+
+    def sentence(self) -> str:
+        return " ".join(self.words(self.rng.randint(8, 24))).capitalize() + "."
+
+    def paragraph(self) -> str:
+        return " ".join(self.sentence() for _ in range(self.rng.randint(2, 6)))
+
+
+def page_tree(num_pages: int, fanout: int) -> List[Tuple[str, str]]:
+    """Lay out `num_pages` pages as a tree. Returns (path, parent path) pairs."""
+    pages = [("/", "")]
+    queue = ["/"]
+    while len(pages) < num_pages:
+        parent = queue.pop(0)
+        for i in range(fanout):
+            if len(pages) == num_pages:
+                break
+            path = f"{parent}topic-{len(pages)}/"
+            pages.append((path, parent))
+            queue.append(path)
+    return pages
+
+
+def render_page(text: TextGenerator, title: str, sections: int,
+                nav: str, children: List[Tuple[str, str]]) -> str:
+    rng = text.rng
+    body = [f"<p>{text.paragraph()}</p>"]
+    toc = []
+
+    for i in range(sections):
+        section_title = text.title()
+        anchor = f"section-{i}"
+        toc.append(f'<li><a href="#{anchor}">{section_title}</a></li>')
+        # Some section titles are links, like on the real sites.
+        if rng.random() < 0.2:
+            body.append(f'<h2 id="{anchor}"><a href="#{anchor}">{section_title}</a></h2>')
+        else:
+            body.append(f'<h2 id="{anchor}">{section_title}</h2>')
+        for _ in range(rng.randint(1, 4)):
+            body.append(f"<p>{text.paragraph()}</p>")
+        if rng.random() < 0.5:
+            items = "".join(f"<li>{text.sentence()}</li>" for _ in range(rng.randint(2, 6)))
+            body.append(f"<ul>{items}</ul>")
+        if rng.random() < 0.3:
+            code = " ".join(text.words(rng.randint(5, 15)))
+            body.append(f"<pre><code>$ redis-cli {code}</code></pre>")
+
+    if children:
+        links = "".join(f'<li><a href="{path}">{child_title}</a></li>'
+                        for path, child_title in children)
+        body.append(f"<h2>In this section</h2><ul>{links}</ul>")
+
+    return PAGE_TEMPLATE.format(title=title, nav=nav, body="\n".join(body), toc="".join(toc))
+
+
+def generate_corpus(root: str, num_pages: int, sections: int = 4,
+                    fanout: int = 8, seed: int = 0) -> Corpus:
+    """Write a site of `num_pages` pages to the directory `root`."""
+    rng = random.Random(seed)
+    vocabulary = load_vocabulary()
+    text = TextGenerator(rng, vocabulary)
+    tree = page_tree(num_pages, fanout)
+    titles = {path: text.title() for path, _ in tree}
+
+    children = {path: [] for path, _ in tree}
+    for path, parent in tree[1:]:
+        children[parent].append((path, titles[path]))
+
+    nav = "".join(f'<li><a href="{path}">{titles[path]}</a></li>' for path, _ in children["/"])
+    total_bytes = 0
+
+    for path, _ in tree:
+        html = render_page(text, titles[path], rng.randint(0, sections * 2),
+                           nav, children[path])
+        directory = os.path.join(root, path.strip("/"))
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "index.html"), "w", encoding="utf-8") as f:
+            f.write(html)
+        total_bytes += len(html.encode("utf-8"))
+
+    return Corpus(root=root, paths=[path for path, _ in tree],
+                  vocabulary=vocabulary, bytes=total_bytes)
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """Serve files without logging every request, and count the pages we serve."""
+    pages_served = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def end_headers(self):
+        if self.path.endswith("/"):
+            type(self).pages_served += 1
+        super().end_headers()
+
+
+def serve_corpus(corpus: Corpus, port: int = 0) -> ThreadingHTTPServer:
+    """Serve a corpus from a background thread. Call shutdown() to stop."""
+    handler = type("CorpusHandler", (QuietHandler, ), {})
+    server = ThreadingHTTPServer(("127.0.0.1", port), partial(handler, directory=corpus.root))
+    server.handler_class = handler
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,61 @@
+"""
+Compare TokenEscaper with the single-alternation regex it replaced.
+
+Run from the root of the repository:
+
+    python -m benchmarks.escaper
+"""
+import os
+import re
+import timeit
+
+from sitesearch.query_parser import TokenEscaper
+from sitesearch.sites.redis_labs import LITERAL_TERMS
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "tests", "documents")
+QUERIES = ("active-active", "redis-cli cluster", "v6.2.8 release", "json*",
+           "how do I configure append-only persistence?")
+
+
+class AlternationEscaper(TokenEscaper):
+    """The previous TokenEscaper: one alternation of every literal term."""
+    def __init__(self, literal_terms):
+        self.literal_terms_re = re.compile("|".join(literal_terms), re.IGNORECASE)
+
+
+def page_bodies():
+    for filename in sorted(os.listdir(DOCS_DIR)):
+        with open(os.path.join(DOCS_DIR, filename), encoding='utf-8') as f:
+            yield f.read()
+
+
+def bench(label, escaper, inputs, number):
+    seconds = timeit.timeit(lambda: [escaper.escape(i) for i in inputs], number=number)
+    per_call = seconds / (number * len(inputs)) * 1e6
+    print(f"{label:<30} {per_call:>10.1f} us/call")
+    return per_call
+
+
+def main():
+    bodies = list(page_bodies())
+    escapers = {
+        "alternation": AlternationEscaper(LITERAL_TERMS),
+        "trie": TokenEscaper(LITERAL_TERMS)
+    }
+
+    for text in (*QUERIES, *bodies):
+        assert escapers["trie"].escape(text) == escapers["alternation"].escape(text)
+
+    results = {}
+    for name, escaper in escapers.items():
+        results[name] = (bench(f"{name} (queries)", escaper, QUERIES, 20000),
+                         bench(f"{name} (page bodies)", escaper, bodies, 20))
+
+    for i, kind in enumerate(("queries", "page bodies")):
+        speedup = results["alternation"][i] / results["trie"][i]
+        print(f"Speedup on {kind}: {speedup:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
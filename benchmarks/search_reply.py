@@ -0,0 +1,77 @@
+"""
+Compare decoding FT.SEARCH replies with parse_search_reply() and with
+redisearch.Result, each followed by transform_documents().
+
+Run from the root of the repository:
+
+    python -m benchmarks.search_reply
+"""
+import json
+import timeit
+
+from redisearch import Result
+
+from sitesearch.query_parser import RETURN_FIELDS
+from sitesearch.results import parse_search_reply
+from sitesearch.sites.redis_labs import DOCS_PROD
+from sitesearch.transformer import transform_documents
+
+QUERY = "persistence"
+NUMS = (30, 100)
+
+
+def search_reply(num, with_scores=False):
+    """Build a reply like the one to a search for RETURN_FIELDS."""
+    reply = [num * 10]
+    for i in range(num):
+        hierarchy = [f"Section {i % 7}", f"Page {i}"]
+        values = {
+            "title": f"Data <b>persistence</b> with Redis Enterprise Software {i}",
+            "section_title": "Append only file (AOF) vs snapshot (RDB)",
+            "body": "Now that you know the available options, to assist in making a "
+                    "decision on which option is right for your use case... "
+                    "<b>Persistence</b> is used to recover from a catastrophic failure... ",
+            "url": f"{DOCS_PROD.url}/rs/concepts/data-access/persistence-{i}/",
+            "hierarchy": json.dumps(hierarchy),
+            "display_hierarchy": json.dumps(hierarchy)
+        }
+        reply.append(f"sitesearch:doc:{i}")
+        if with_scores:
+            reply.append(str(1.0 / (i + 1)))
+        reply.append([item for name in RETURN_FIELDS for item in (name, values[name])])
+    return reply
+
+
+def redisearch_result(reply, with_scores):
+    return Result(reply, True, has_payload=False, with_scores=with_scores)
+
+
+def bench(label, decode, reply, with_scores, number):
+    def run():
+        transform_documents(decode(reply, with_scores).docs, DOCS_PROD, QUERY)
+
+    seconds = timeit.timeit(run, number=number)
+    per_call = seconds / number * 1e6
+    print(f"{label:<40} {per_call:>10.1f} us/search")
+    return per_call
+
+
+def main():
+    for num in NUMS:
+        for with_scores in (False, True):
+            reply = search_reply(num, with_scores)
+            expected = transform_documents(
+                redisearch_result(reply, with_scores).docs, DOCS_PROD, QUERY)
+            assert transform_documents(
+                parse_search_reply(reply, with_scores).docs, DOCS_PROD, QUERY) == expected
+
+            scores = " WITHSCORES" if with_scores else ""
+            before = bench(f"redisearch.Result num={num}{scores}",
+                           redisearch_result, reply, with_scores, 2000)
+            after = bench(f"parse_search_reply num={num}{scores}",
+                          parse_search_reply, reply, with_scores, 2000)
+            print(f"Speedup: {before / after:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
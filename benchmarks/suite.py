@@ -0,0 +1,318 @@
+"""
+Benchmark parsing, indexing and searching a synthetic documentation site.
+
+Run from the root of the repository, with Redis Stack (or Redis with
+RediSearch) running wherever REDIS_HOST and REDIS_PORT point:
+
+    python -m benchmarks.suite --pages 1000 --output results.json
+
+The suite generates a site (see benchmarks/corpus.py), serves it from a
+local HTTP server, and then:
+
+1. Parses every page with DocumentParser, without Redis.
+2. Crawls and indexes the site with Indexer.index(), measuring pages/sec,
+   docs/sec, the peak RSS of the process (and of any parser processes),
+   and the bytes per document of the crawl state the indexer keeps.
+3. Sends a realistic mix of queries to the /search handler in-process,
+   measuring latency percentiles, throughput, and the mean time of each
+   stage from the Server-Timing header.
+
+To load-test a running API instead, pass its URL and a site it serves:
+
+    python -m benchmarks.suite --search-url http://localhost:8080 \\
+        --site https://docs.redis.com/latest
+
+The results are printed as JSON (and written to --output), so runs can be
+compared. Generation and the query mix are deterministic for a --seed.
+"""
+import asyncio
+import dataclasses
+import json
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import click
+import httpx
+
+from benchmarks.corpus import Corpus, generate_corpus, load_vocabulary, serve_corpus
+from sitesearch.config import AppConfiguration
+from sitesearch.errors import ParseError
+from sitesearch.indexer import DocumentParser, Indexer
+from sitesearch.models import SiteConfiguration
+from sitesearch.sites.redis_labs import DOCS_PROD, LITERAL_TERMS
+
+# The share of each kind of query in the query mix. Most searches come
+# from the search box as the user types, so they're prefix queries.
+QUERY_MIX = (
+    ("prefix", 0.45),
+    ("word", 0.25),
+    ("two_words", 0.15),
+    ("literal_term", 0.10),
+    ("landing_page", 0.05),
+)
+
+# Only the most common words of the corpus make it into queries.
+QUERY_VOCABULARY_SIZE = 500
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """The peak resident set size of this process (or its children) in MB."""
+    rss = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, and macOS reports bytes.
+    return rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def rate(count: int, seconds: float) -> float:
+    return count / seconds if seconds else 0.0
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def query_mix(vocabulary: List[str], num: int, seed: int) -> List[str]:
+    """Make `num` queries, in the proportions of QUERY_MIX."""
+    rng = random.Random(seed)
+    words = vocabulary[:QUERY_VOCABULARY_SIZE]
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    landing_pages = sorted(DOCS_PROD.landing_pages)
+    kinds = [kind for kind, _ in QUERY_MIX]
+    shares = [share for _, share in QUERY_MIX]
+    queries = []
+
+    for kind in rng.choices(kinds, shares, k=num):
+        if kind == "prefix":
+            word = rng.choices(words, weights)[0]
+            queries.append(f"{word[:rng.randint(2, len(word))]}*")
+        elif kind == "word":
+            queries.append(rng.choices(words, weights)[0])
+        elif kind == "two_words":
+            queries.append(" ".join(rng.choices(words, weights, k=2)))
+        elif kind == "literal_term":
+            queries.append(rng.choice(LITERAL_TERMS))
+        else:
+            queries.append(rng.choice(landing_pages))
+
+    return queries
+
+
+def corpus_site(url: str) -> SiteConfiguration:
+    """A site configuration like the docs site's, for a corpus served at `url`."""
+    return dataclasses.replace(DOCS_PROD, url=url, allowed_domains=("127.0.0.1", ), deny=())
+
+
+def bench_parse(corpus: Corpus, site: SiteConfiguration) -> Dict[str, Any]:
+    parser = DocumentParser(site)
+    pages = []
+    for path in corpus.paths:
+        with open(f"{corpus.root}{path}index.html", encoding="utf-8") as f:
+            pages.append((f"{site.url}{path}", f.read()))
+
+    docs = errors = 0
+    start = time.perf_counter()
+    for url, html in pages:
+        try:
+            docs += len(parser.parse(url, html))
+        except ParseError:
+            errors += 1
+    seconds = time.perf_counter() - start
+
+    return {
+        "pages": len(pages),
+        "docs": docs,
+        "errors": errors,
+        "seconds": seconds,
+        "pages_per_second": rate(len(pages), seconds),
+        "docs_per_second": rate(docs, seconds),
+    }
+
+
+def bench_index(indexer: Indexer, server) -> Dict[str, Any]:
+    start = time.perf_counter()
+    indexer.index(force=True, incremental=False)
+    seconds = time.perf_counter() - start
+    pages = server.handler_class.pages_served
+    docs = len(indexer.seen_ids)
+    memory = indexer.memory_report()
+
+    return {
+        "pages": pages,
+        "docs": docs,
+        "seconds": seconds,
+        "pages_per_second": rate(pages, seconds),
+        "docs_per_second": rate(docs, seconds),
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_children_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+        "crawl_state_bytes": memory["bytes"],
+        "crawl_state_bytes_per_doc": memory["bytes_per_document"],
+    }
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """Get the duration of every stage in a Server-Timing header, in ms."""
+    stages = {}
+    for metric in header.split(","):
+        name, *params = metric.strip().split(";")
+        for param in params:
+            if param.startswith("dur="):
+                stages[name] = float(param[4:])
+    return stages
+
+
+async def bench_search(client: httpx.AsyncClient, site_url: str, queries: List[str],
+                       concurrency: int, warmup: int) -> Dict[str, Any]:
+    """Send the first `warmup` queries, then measure sending the rest."""
+    latencies: List[float] = []
+    stage_totals: Dict[str, float] = {}
+    errors = 0
+
+    async def run(queue: List[str], record: bool):
+        nonlocal errors
+        while queue:
+            q = queue.pop()
+            start = time.perf_counter()
+            response = await client.get("/search", params={"q": q, "site": site_url})
+            elapsed = time.perf_counter() - start
+            if not record:
+                continue
+            latencies.append(elapsed)
+            if response.status_code != 200:
+                errors += 1
+            for stage, ms in parse_server_timing(response.headers.get("Server-Timing", "")).items():
+                stage_totals[stage] = stage_totals.get(stage, 0) + ms
+
+    async with client:
+        warmup_queue = queries[:warmup][::-1]
+        await asyncio.gather(*[run(warmup_queue, False) for _ in range(concurrency)])
+
+        queue = queries[warmup:][::-1]
+        start = time.perf_counter()
+        await asyncio.gather(*[run(queue, True) for _ in range(concurrency)])
+        seconds = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "concurrency": concurrency,
+        "seconds": seconds,
+        "requests_per_second": rate(len(latencies), seconds),
+        "latency_ms": {
+            "mean": (sum(latencies) / len(latencies) if latencies else 0) * 1000,
+            "p50": percentile(latencies, 0.5) * 1000,
+            "p90": percentile(latencies, 0.9) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "max": (latencies[-1] if latencies else 0) * 1000,
+        },
+        "server_stages_mean_ms": {
+            stage: total / len(latencies) for stage, total in stage_totals.items()
+        },
+    }
+
+
+def search_app(site: SiteConfiguration, cache: bool):
+    """Create the search API in this process, able to search `site`."""
+    # The API needs API_KEY and the rest of its environment to import.
+    from sitesearch.api import search
+    from sitesearch.api.app import create_app
+
+    search.config.sites = {**search.config.sites, site.url: site}
+    if not cache:
+        search.result_cache.max_size = 0
+        search.shared_cache.ttl = 0
+    return create_app()
+
+
+def clean_up(indexer: Indexer, config: AppConfiguration):
+    """Delete the index and every key we created for the synthetic site."""
+    if indexer.search_index_exists():
+        indexer.redis.execute_command("FT.DROPINDEX", indexer.index_name, "DD")
+    for key in indexer.redis.scan_iter(match=f"{config.key_prefix}:*{indexer.site.url}*"):
+        indexer.redis.delete(key)
+
+
+@click.command()
+@click.option("--pages", default=500, help="The number of pages in the synthetic site.")
+@click.option("--sections", default=4, help="The average number of H2 sections per page.")
+@click.option("--fanout", default=8, help="The number of child pages per page.")
+@click.option("--queries", default=2000, help="The number of searches to send.")
+@click.option("--concurrency", default=16, help="The number of searches in flight at once.")
+@click.option("--warmup", default=100, help="Searches to send before measuring.")
+@click.option("--seed", default=0, help="Seed for the synthetic site and query mix.")
+@click.option("--cache/--no-cache", default=False, help="Use the search result caches.")
+@click.option("--keep", is_flag=True, help="Keep the synthetic site's index afterward.")
+@click.option("--search-url", default=None, help="Load-test a running search API instead.")
+@click.option("--site", default=None, help="The site to search with --search-url.")
+@click.option("--output", type=click.Path(), default=None, help="Also write the results here.")
+def main(pages, sections, fanout, queries, concurrency, warmup, seed, cache, keep,
+         search_url, site, output):
+    """Benchmark parsing, indexing and searching a synthetic site."""
+    results: Dict[str, Any] = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "pages": pages, "sections": sections, "fanout": fanout, "queries": queries,
+            "concurrency": concurrency, "warmup": warmup, "seed": seed, "cache": cache,
+            "search_url": search_url, "site": site,
+        },
+    }
+
+    if search_url:
+        if not site:
+            raise click.BadOptionUsage("site", "Give the --site to search with --search-url.")
+        mix = query_mix(load_vocabulary(), queries + warmup, seed)
+        client = httpx.AsyncClient(base_url=search_url)
+        results["search"] = asyncio.run(
+            bench_search(client, site, mix, concurrency, warmup))
+    else:
+        results.update(run_local(pages, sections, fanout, queries, concurrency,
+                                 warmup, seed, cache, keep))
+
+    text = json.dumps(results, indent=2)
+    click.echo(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+
+
+def run_local(pages: int, sections: int, fanout: int, queries: int, concurrency: int,
+              warmup: int, seed: int, cache: bool, keep: bool) -> Dict[str, Any]:
+    """Generate, serve, parse, index and search a synthetic site."""
+    results: Dict[str, Any] = {}
+    root = tempfile.mkdtemp(prefix="sitesearch-corpus-")
+    corpus = generate_corpus(root, pages, sections, fanout, seed)
+    results["corpus"] = {"pages": len(corpus.paths), "bytes": corpus.bytes, "root": root}
+
+    server = serve_corpus(corpus)
+    site = corpus_site(f"http://127.0.0.1:{server.server_address[1]}")
+    config = AppConfiguration()
+    indexer: Optional[Indexer] = None
+
+    try:
+        results["parse"] = bench_parse(corpus, site)
+        indexer = Indexer(site, config)
+        results["index"] = bench_index(indexer, server)
+
+        mix = query_mix(corpus.vocabulary, queries + warmup, seed)
+        client = httpx.AsyncClient(app=search_app(site, cache), base_url="http://benchmark")
+        results["search"] = asyncio.run(
+            bench_search(client, site.url, mix, concurrency, warmup))
+    finally:
+        server.shutdown()
+        if indexer is not None and not keep:
+            clean_up(indexer, config)
+
+    return results
+
+
+if __name__ == '__main__':
+    main()
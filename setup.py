@@ -28,6 +28,8 @@ setuptools.setup(
     entry_points={
         'console_scripts': [
             'index=sitesearch.commands.index:index',
+            'reindex=sitesearch.commands.reindex:reindex',
+            'rescore=sitesearch.commands.rescore:rescore',
             'search=sitesearch.commands.search:search',
             'drop_index=sitesearch.commands.drop_index:drop_index',
             'clear_old_indexes=sitesearch.commands.clear_indexes:clear_indexes',
@@ -2,7 +2,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from sitesearch.config import AppConfiguration
-from sitesearch.api import search, indexer, health, job
+from sitesearch.api import search, suggest, indexer, health, job, metrics
 
 
 def create_app(config=None):
@@ -36,8 +36,10 @@ def create_app(config=None):
     )
 
     app.include_router(search.router)
+    app.include_router(suggest.router)
     app.include_router(indexer.router)
     app.include_router(health.router)
     app.include_router(job.router)
+    app.include_router(metrics.router)
 
     return app
@@ -1,26 +1,184 @@
+import asyncio
 import logging
+import time
+from typing import Any, Dict
 
-from fastapi import APIRouter, HTTPException, Response, status
+import aioredis
+from fastapi import APIRouter, HTTPException, Response, Security, status
+from fastapi.responses import JSONResponse
 
 from newrelic import agent
-from redis.exceptions import ResponseError
 
-from sitesearch.connections import get_redis_connection
+from sitesearch.api.authentication import get_api_key
+from sitesearch.config import get_config
+from sitesearch.connections import get_connection_manager
 
-redis_client = get_redis_connection()
+connections = get_connection_manager()
+redis_client = connections.primary
+config = get_config()
 log = logging.getLogger(__name__)
 router = APIRouter()
 
+# Every readiness check must finish within this many seconds.
+READINESS_TIMEOUT_SECONDS = 0.5
+
+# Load balancers probe often, so we reuse a readiness report for this long.
+READINESS_CACHE_SECONDS = 2
+
+# A replica that hasn't heard from its primary for longer than this is stale.
+MAX_REPLICA_LAG_SECONDS = 10
+
+REPLICA_ROLES = {'slave', 'replica'}
+
 
 @router.get("/health")
 async def health():
     """This service is considered unhealthy if it can't ping Redis."""
     agent.ignore_transaction(flag=True)
     try:
-        redis_client.ping()
-    except ResponseError as e:
+        await asyncio.wait_for(redis_client.ping(), READINESS_TIMEOUT_SECONDS)
+    except (aioredis.exceptions.RedisError, asyncio.TimeoutError) as e:
         # Connection to Redis is probably down, so this node isn't healthy.
-        log.error("Response error: %s", e)
+        log.error("Redis error: %s", e)
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                             detail="Cannot reach Redis") from e
     return Response(status_code=status.HTTP_200_OK)
+
+
+async def check_ping(client) -> Dict[str, Any]:
+    """Measure the round-trip latency to Redis."""
+    start = time.perf_counter()
+    await client.ping()
+    return {"ok": True, "latency_ms": (time.perf_counter() - start) * 1000}
+
+
+async def check_site(client, url: str) -> Dict[str, Any]:
+    """Check that a site's index alias resolves to an index with documents."""
+    index_alias = config.keys.index_alias(url)
+    raw_info = await client.execute_command("FT.INFO", index_alias)
+    info = dict(zip(raw_info[::2], raw_info[1::2]))
+    num_docs = int(float(info.get("num_docs", 0)))
+    return {"ok": num_docs > 0, "num_docs": num_docs}
+
+
+async def check_replication(client) -> Dict[str, Any]:
+    """
+    Check that a Redis we search isn't a stale replica.
+
+    A primary is always fine. A replica must be connected to its primary
+    and have heard from it recently.
+    """
+    info = await client.info("replication")
+    role = info.get("role")
+    report = {"ok": True, "role": role}
+
+    if role in REPLICA_ROLES:
+        link_up = info.get("master_link_status") == "up"
+        lag = info.get("master_last_io_seconds_ago", -1)
+        report.update(link_status=info.get("master_link_status"),
+                      lag_seconds=lag,
+                      ok=link_up and 0 <= lag <= MAX_REPLICA_LAG_SECONDS)
+
+    return report
+
+
+async def run_check(check) -> Dict[str, Any]:
+    """Run a readiness check within the time budget, reporting any failure."""
+    try:
+        return await asyncio.wait_for(check, READINESS_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        return {"ok": False, "error": "timeout"}
+    except (aioredis.exceptions.RedisError, ValueError) as e:
+        return {"ok": False, "error": str(e)}
+
+
+async def check_target(client) -> Dict[str, Any]:
+    """Check that a Redis we may search answers, is current, and has every site."""
+    urls = list(config.sites)
+    ping, replication, *sites = await asyncio.gather(
+        run_check(check_ping(client)),
+        run_check(check_replication(client)),
+        *[run_check(check_site(client, url)) for url in urls])
+
+    site_reports = dict(zip(urls, sites))
+    return {
+        "ok": ping["ok"] and replication["ok"] and all(s["ok"] for s in site_reports.values()),
+        "redis": ping,
+        "replication": replication,
+        "sites": site_reports
+    }
+
+
+class ReadinessReport:
+    """
+    The latest readiness report, shared by concurrent probes.
+
+    Probes within READINESS_CACHE_SECONDS of the last check get the same
+    report, and concurrent probes wait for a single check to finish.
+    """
+    def __init__(self, max_age: float = READINESS_CACHE_SECONDS, clock=time.monotonic):
+        self.max_age = max_age
+        self.clock = clock
+        self.report = None
+        self.checked_at = 0.0
+        self.lock = None
+
+    async def get(self) -> Dict[str, Any]:
+        # Create the lock on the event loop that serves requests.
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            if self.report is None or self.clock() - self.checked_at > self.max_age:
+                self.report = await self.check()
+                self.checked_at = self.clock()
+        return self.report
+
+    async def check(self) -> Dict[str, Any]:
+        """
+        Check the primary and every read replica.
+
+        Searches read from the replicas and fall back to the primary, so
+        we're ready if any of them is healthy. We stop sending reads to
+        an unhealthy replica until it has had time to recover.
+        """
+        router = connections.reads
+        primary, *replicas = await asyncio.gather(
+            check_target(redis_client),
+            *[check_target(replica.client) for replica in router.replicas])
+
+        replica_reports = {}
+        for replica, report in zip(router.replicas, replicas):
+            if not report["ok"]:
+                router.mark_down(replica)
+            replica_reports[replica.name] = report
+
+        primary_ok = primary.pop("ok")
+        return {
+            "ready": primary_ok or any(r["ok"] for r in replica_reports.values()),
+            **primary,
+            "replicas": replica_reports
+        }
+
+
+readiness = ReadinessReport()
+
+
+@router.get("/ready")
+async def ready():
+    """
+    This service is ready to serve searches if the primary or a read
+    replica answers quickly, has documents in every site's index, and
+    isn't a stale replica. The top-level checks are the primary's, and
+    `replicas` has the checks of each replica.
+    """
+    agent.ignore_transaction(flag=True)
+    report = await readiness.get()
+    status_code = status.HTTP_200_OK if report["ready"] \
+        else status.HTTP_503_SERVICE_UNAVAILABLE
+    return JSONResponse(status_code=status_code, content=report)
+
+
+@router.get("/connections", dependencies=[Security(get_api_key)])
+async def connection_stats():
+    """Get statistics for this worker's Redis connection pools and read replicas."""
+    return connections.stats()
@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Response, Security
+
+from sitesearch.api.authentication import get_api_key
+from sitesearch.metrics import CONTENT_TYPE, render_metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", dependencies=[Security(get_api_key)])
+async def metrics():
+    """Get this worker's search latency histograms in the Prometheus text format."""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
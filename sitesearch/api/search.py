@@ -1,23 +1,60 @@
+import asyncio
 import logging
 import time
-from typing import Optional
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import newrelic
 import aioredis
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, Query, Security, status
+from fastapi.responses import UJSONResponse
+from pydantic import BaseModel
 
-from redisearch import Result
 from sitesearch import indexer
+from sitesearch.api.authentication import get_api_key
+from sitesearch.cache import IndexGenerations, SearchResultCache, SharedResultCache
 from sitesearch.config import get_config
-from sitesearch.connections import get_async_redis_connection
+from sitesearch.cursor import SearchCursor, page_digest
+from sitesearch.metrics import NULL_TIMER, StageTimer
+from sitesearch.models import SearchDocument, SiteConfiguration
+from sitesearch.connections import get_connection_manager
 from sitesearch.query_parser import parse
-from sitesearch.transformer import transform_documents
+from sitesearch.results import SearchHit, SearchResults, parse_search_reply
+from sitesearch.transformer import transform_results
 
-redis_client = get_async_redis_connection()
+connections = get_connection_manager()
+redis_client = connections.primary
+# Searches may go to read replicas.
+read_client = connections.reads
 log = logging.getLogger(__name__)
 
 DEFAULT_NUM = 30
 MAX_NUM = 100
+MAX_BATCH_SIZE = 100
+
+# A page of the site has a document for each of its sections, and a search
+# returns one result per page. To fill a page of results with distinct
+# pages, we fetch this many documents per result...
+OVERFETCH_FACTOR = 3
+
+# ...and, if that isn't enough, fetch again with twice as many documents,
+# up to this many fetches of at most MAX_FETCH_NUM documents.
+MAX_FETCHES = 3
+MAX_FETCH_NUM = 1000
+
+# How a search was answered, for the Server-Timing header and metrics:
+# from this worker's result cache, from the shared result cache, by
+# searching the index on a cache miss, or by searching with caches off.
+CACHE_LOCAL = "local"
+CACHE_SHARED = "shared"
+CACHE_MISS = "miss"
+CACHE_DISABLED = "disabled"
+
+# How long a federated search waits for each site.
+FEDERATED_SITE_TIMEOUT_SECONDS = 1.0
+
+# How often to check whether a site's search index has changed.
+GENERATION_CHECK_SECONDS = 1
 
 # Until we can get MINPREFIX set to 1 on Redis Cluster, map
 # single-character queries to two-character queries. Use a
@@ -53,12 +90,197 @@ SINGLE_CHAR_MAP = {
 
 router = APIRouter()
 config = get_config()
+result_cache = SearchResultCache(config.search_cache_size,
+                                 config.search_cache_ttl)
+shared_cache = SharedResultCache(redis_client, config.keys,
+                                 config.shared_search_cache_ttl, read_client)
+generations = IndexGenerations(read_client, config.keys,
+                               GENERATION_CHECK_SECONDS)
+
+
+def expand_single_char_query(q: str) -> str:
+    """Map single-character prefix queries to two-character queries."""
+    if len(q) == 2 and q[1] == '*':
+        char = q[0]
+        if char in SINGLE_CHAR_MAP:
+            q = f"{SINGLE_CHAR_MAP[q[0]]}*"
+    return q
+
+
+async def query_index(search_site: SiteConfiguration, q: str, section: str,
+                      start: int, num: int, with_scores: bool = False,
+                      timer: StageTimer = NULL_TIMER) -> Optional[SearchResults]:
+    """
+    Search a site's index.
+
+    Returns None if the search failed.
+    """
+    with timer.stage("parse"):
+        index_alias = config.keys.index_alias(search_site.url)
+        query = await parse(index_alias, q, section, start, num, search_site)
+        if with_scores:
+            query.append("WITHSCORES")
+
+    start_time = time.time()
+    try:
+        with timer.stage("redis"):
+            raw_result = await read_client.execute_command("FT.SEARCH", *query)
+    except (aioredis.exceptions.ResponseError, UnicodeDecodeError) as e:
+        log.error("Search q failed: %s", e)
+        return None
+
+    with timer.stage("decode"):
+        result = parse_search_reply(raw_result, with_scores)
+    end_time = time.time()
+    newrelic.agent.record_custom_metric('search/q_ms', (end_time - start_time) * 1000)
+
+    return result
+
+
+@dataclass
+class Pages:
+    """The first document of each page a search found."""
+    total: int
+    docs: List[SearchHit]
+    # The cursor for the next search for more results, or None if there
+    # are no more.
+    next_start: Optional[str]
+
+
+def collapse_pages(docs: List[SearchHit], pages_seen: Set[int], num: int) -> Tuple[List[SearchHit], int]:
+    """
+    Collapse search results to the first document of each page.
+
+    Skips documents for the pages whose digests are in `pages_seen` and
+    adds the pages we keep. Returns at most `num` documents, and the number
+    of results we went through to find them: the results up to the last
+    document we kept, and any results for pages we've seen that follow it.
+    """
+    collapsed = []
+    consumed = 0
+    for doc in docs:
+        digest = page_digest(doc.url)
+        if digest not in pages_seen:
+            if len(collapsed) == num:
+                break
+            pages_seen.add(digest)
+            collapsed.append(doc)
+        consumed += 1
+    return collapsed, consumed
+
+
+def fetch_num(num: int) -> int:
+    """How many documents to fetch for `num` distinct pages."""
+    return min(num * OVERFETCH_FACTOR, MAX_FETCH_NUM)
+
+
+def find_landing_page(search_site: SiteConfiguration, q: str) -> Optional[SearchDocument]:
+    """Find the landing page we show before the results of a query, if any."""
+    return search_site.landing_page(q.replace('*', ''))
+
+
+def landing_page_digests(landing_page: Optional[SearchDocument]) -> Set[int]:
+    """We always show the landing page first, so skip its documents."""
+    return {page_digest(landing_page.url)} if landing_page else set()
+
+
+async def query_pages(search_site: SiteConfiguration, q: str, section: str,
+                      start: SearchCursor, num: int, landing_page: Optional[SearchDocument],
+                      with_scores: bool = False, timer: StageTimer = NULL_TIMER,
+                      first_result: Optional[SearchResults] = None) -> Optional[Pages]:
+    """
+    Search a site's index for `num` distinct pages, continuing from `start`.
+
+    We over-fetch, and fetch again if a page of results has so many
+    sections of the same pages that we don't find `num` distinct pages.
+    If we already have the result of the first fetch, pass it as
+    `first_result`.
+
+    Returns None if the search failed.
+    """
+    pages_seen = set(start.pages) | landing_page_digests(landing_page)
+    docs: List[SearchHit] = []
+    offset = start.offset
+    limit = fetch_num(num)
+    result = first_result
+
+    for _ in range(MAX_FETCHES):
+        if result is None:
+            result = await query_index(search_site, q, section, offset, limit, with_scores, timer)
+            if result is None:
+                return None
+
+        collapsed, consumed = collapse_pages(result.docs, pages_seen, num - len(docs))
+        docs += collapsed
+        offset += consumed
+        total = result.total
+        if len(docs) == num or len(result.docs) < limit:
+            break
+        limit = min(limit * 2, MAX_FETCH_NUM)
+        result = None
+
+    if offset < total:
+        pages = start.pages + tuple(page_digest(doc.url) for doc in docs)
+        next_start = SearchCursor(offset, pages).encode()
+    else:
+        next_start = None
+    return Pages(total=total, docs=docs, next_start=next_start)
+
+
+async def search_index(search_site: SiteConfiguration, q: str, section: str,
+                       start: SearchCursor, num: int,
+                       timer: StageTimer = NULL_TIMER) -> Optional[Dict[str, Any]]:
+    """
+    Search a site's index and transform the results for the response.
+
+    Returns None if the search failed.
+    """
+    with timer.stage("landing_page"):
+        landing_page = find_landing_page(search_site, q)
+
+    pages = await query_pages(search_site, q, section, start, num, landing_page, timer=timer)
+    if pages is None:
+        return None
+
+    with timer.stage("transform"):
+        docs = transform_results(pages.docs, landing_page)
+    return {"total": pages.total, "results": docs, "next_start": pages.next_start}
+
+
+def search_params(q: str, from_url: Optional[str], start: Optional[str],
+                  num: Optional[int], site: Optional[str]) -> Tuple[SiteConfiguration, str, str, SearchCursor, int]:
+    """
+    Apply defaults and limits to the params of a search.
+
+    Returns the site to search, the query, the section to boost, the
+    cursor to start from, and the number of results.
+    """
+    from_url = from_url if from_url else ''
+    try:
+        cursor = SearchCursor.decode(start) if start else SearchCursor()
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="The start param must be a number or the next_start of an earlier search.")
+    num = num if isinstance(num, int) else DEFAULT_NUM
+    site_url = site if site else config.default_search_site.url
+    q = expand_single_char_query(q)
+
+    # Return an error if a site URL was given but it's invalid.
+    if site_url and site_url not in config.sites:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="You must specify a valid search site.")
+
+    search_site = config.sites.get(site_url)
+    section = indexer.get_section(site_url, from_url)
+    num = min(num, MAX_NUM)
+
+    return search_site, q, section, cursor, num
 
 
-@router.get("/search")
+@router.get("/search", response_class=UJSONResponse)
 async def search(q: str,
                  from_url: Optional[str] = None,
-                 start: Optional[int] = None,
+                 start: Optional[str] = None,
                  num: Optional[int] = None,
                  site: Optional[str] = None):
     """
@@ -73,55 +295,268 @@ async def search(q: str,
                   on top-level hierarchy. E.g. https://example.com/search?q=python&from_url=https://example.com/technology
                   This query will boost documents whose URLs start with https://example.com/technology.
 
-        start: For pagination. Controls the number of the document in the result
-               to start with. Defaults to 0. E.g. https://example.com/search?q=python&start=20
+        start: For pagination. To get the next page of results, pass the
+               "next_start" of the previous response, which is an opaque cursor.
+               Leave it out to get the first page. A number is still accepted
+               as the number of the document to start with.
+               E.g. https://example.com/search?q=python&start=cAAAAHg...
 
-        num: For pagination. Controls the number of documents to return, starting from
-             `start`. https://example.com/search?q=python&start=20&num=20
+        num: For pagination. Controls the number of results to return, starting from
+             `start`. https://example.com/search?q=python&start=cAAAAHg...&num=20
 
         site_url: The site to search. Used when sitesearch is indexing multiple sites.
                   If this isn't specified, the query searches the default site specified in
                   AppConfiguration. E.g. https://example.com/search?q=python&site_url=https://docs.redislabs.com
+
+    We return one result per page of the site, and as many results as `num`
+    unless the search runs out of pages. "total" is the number of matching
+    documents (which includes every matching section of a page), and
+    "next_start" is the `start` of the next page of results, or null if
+    there are no more. The cursor remembers the pages we've returned, so
+    no page comes back on a later page of results. Paging by a numeric
+    `start` instead can show a page again, because a page of results
+    consumes more than `num` documents.
+
+    The Server-Timing header of the response says how long each stage of
+    the search took, and whether a result cache answered it.
+    """
+    timer = StageTimer()
+    search_site, q, section, start, num = search_params(q, from_url, start, num, site)
+
+    cache_key = None
+    cached = None
+    with timer.stage("cache"):
+        if result_cache.enabled or shared_cache.enabled:
+            generation = await generations.get(search_site.url)
+            cache_key = (search_site.url, generation, q.strip(), section, start.encode(), num)
+
+        if result_cache.enabled:
+            cached = result_cache.get(cache_key)
+
+    if cached is not None:
+        return timed_response(cached, timer, search_site, CACHE_LOCAL)
+
+    searched = False
+
+    async def run_search():
+        nonlocal searched
+        searched = True
+        return await search_index(search_site, q, section, start, num, timer)
+
+    if shared_cache.enabled:
+        response = await shared_cache.get_or_compute(search_site.url, generation,
+                                                     cache_key, run_search)
+    else:
+        response = await run_search()
+
+    if searched:
+        cache = CACHE_MISS if cache_key else CACHE_DISABLED
+    else:
+        cache = CACHE_SHARED
+
+    if response is None:
+        # Don't cache failed searches.
+        return timed_response({
+            "total": 0,
+            "results": transform_results([], find_landing_page(search_site, q)),
+            "next_start": None
+        }, timer, search_site, cache)
+
+    if result_cache.enabled:
+        result_cache.set(cache_key, response)
+
+    return timed_response(response, timer, search_site, cache)
+
+
+def timed_response(content: Dict[str, Any], timer: StageTimer,
+                   search_site: SiteConfiguration, cache: str) -> UJSONResponse:
+    """
+    Serialize a search response, then add its Server-Timing header and
+    count its timings in the search histograms.
+    """
+    with timer.stage("serialize"):
+        response = UJSONResponse(content)
+    timer.stop()
+    response.headers["Server-Timing"] = timer.server_timing(cache)
+    timer.observe(search_site.url, cache)
+    return response
+
+
+async def search_site_scored(search_site: SiteConfiguration, q: str, from_url: str,
+                             num: int) -> Dict[str, Any]:
+    """
+    Search one site for a federated search.
+
+    Every result gets a score between 0 and 1: its RediSearch score divided
+    by the site's top score, because scores from different indexes aren't
+    comparable. A site's landing page scores 1.
+    """
+    section = indexer.get_section(search_site.url, from_url)
+    landing_page = find_landing_page(search_site, q)
+    pages = await query_pages(search_site, q, section, SearchCursor(), num, landing_page,
+                              with_scores=True)
+    if pages is None:
+        return {"total": 0, "results": [], "error": "search failed"}
+
+    top_score = max((doc.score for doc in pages.docs), default=0) or 1
+    scores = {doc.url: doc.score / top_score for doc in pages.docs}
+
+    results = transform_results(pages.docs, landing_page)
+    for doc in results:
+        doc["site"] = search_site.url
+        doc["score"] = scores.get(doc["url"], 1.0)
+
+    return {"total": pages.total, "results": results}
+
+
+@router.get("/search/federated", response_class=UJSONResponse)
+async def federated_search(q: str,
+                           site: List[str] = Query(None),
+                           from_url: Optional[str] = None,
+                           start: Optional[int] = None,
+                           num: Optional[int] = None):
+    """
+    Search several sites at once and merge the results.
+
+    GET params:
+
+        q: The search key.
+
+        site: A site to search. Repeat this param to search several sites,
+              or pass "all" to search every site. Defaults to all sites.
+
+        from_url, num: The same as for /search.
+
+        start: The number of merged results to skip. Results from every
+              site are merged by score, one result per URL, before we
+              apply `start` and `num`.
+
+    We search the sites concurrently. A site that doesn't answer within
+    FEDERATED_SITE_TIMEOUT_SECONDS is left out of the results, and its
+    entry in "sites" says so.
     """
     from_url = from_url if from_url else ''
     start = start if isinstance(start, int) else 0
-    num = num if isinstance(num, int) else DEFAULT_NUM
-    site_url = site if site else config.default_search_site.url
-    q_len = len(q)
+    num = min(num if isinstance(num, int) else DEFAULT_NUM, MAX_NUM)
+    q = expand_single_char_query(q)
 
-    if q_len == 2 and q[1] == '*':
-        char = q[0]
-        if char in SINGLE_CHAR_MAP:
-            q = f"{SINGLE_CHAR_MAP[q[0]]}*"
+    site_urls = site if site and "all" not in site else list(config.sites)
+    if any(site_url not in config.sites for site_url in site_urls):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="You must specify valid search sites.")
+    site_urls = list(dict.fromkeys(site_urls))
 
-    # Return an error if a site URL was given but it's invalid.
-    if site_url and site_url not in config.sites:
+    async def search_with_timeout(site_url: str) -> Dict[str, Any]:
+        try:
+            return await asyncio.wait_for(
+                search_site_scored(config.sites[site_url], q, from_url, start + num),
+                FEDERATED_SITE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            log.error("Federated search timed out for site %s", site_url)
+            return {"total": 0, "results": [], "error": "timeout"}
+
+    site_results = await asyncio.gather(*[search_with_timeout(url) for url in site_urls])
+
+    merged = sorted((doc for result in site_results for doc in result["results"]),
+                    key=lambda doc: doc["score"], reverse=True)
+    results = []
+    urls_seen = set()
+    for doc in merged:
+        if doc["url"] not in urls_seen:
+            urls_seen.add(doc["url"])
+            results.append(doc)
+
+    sites = {}
+    for site_url, result in zip(site_urls, site_results):
+        sites[site_url] = {"total": result["total"]}
+        if "error" in result:
+            sites[site_url]["error"] = result["error"]
+
+    return UJSONResponse({
+        "total": sum(result["total"] for result in site_results),
+        "results": results[start:start + num],
+        "sites": sites
+    })
+
+
+class SearchRequest(BaseModel):
+    """One search in a batch, with the same params as /search."""
+    q: str
+    site: Optional[str] = None
+    from_url: Optional[str] = None
+    start: Optional[str] = None
+    num: Optional[int] = None
+
+
+@router.post("/search/batch", response_class=UJSONResponse)
+async def batch_search(searches: List[SearchRequest]):
+    """
+    Run many searches with one request.
+
+    POST a JSON list of searches, each with the same params as /search.
+    We send every FT.SEARCH to Redis in one pipeline, and respond with a
+    list of results in the same order. A search that failed has an "error"
+    instead of results.
+
+    Like /search, each search returns one result per page. A search whose
+    first fetch has so many sections of the same pages that it doesn't
+    find `num` pages fetches again on its own, after the pipeline.
+    """
+    if len(searches) > MAX_BATCH_SIZE:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                            detail="You must specify a valid search site.")
+                            detail=f"You can run at most {MAX_BATCH_SIZE} searches at once.")
 
-    search_site = config.sites.get(site_url)
-    section = indexer.get_section(site_url, from_url)
-    num = min(num, MAX_NUM)
-    index_alias = config.keys.index_alias(search_site.url)
-    query = await parse(index_alias, q, section, start, num, search_site)
+    responses: List[Optional[Dict[str, Any]]] = [None] * len(searches)
+    pending = []
+    pipeline = read_client.pipeline(transaction=False)
+
+    for i, search_request in enumerate(searches):
+        try:
+            search_site, q, section, start, num = search_params(
+                search_request.q, search_request.from_url, search_request.start,
+                search_request.num, search_request.site)
+        except HTTPException as e:
+            responses[i] = {"error": e.detail}
+            continue
+
+        index_alias = config.keys.index_alias(search_site.url)
+        query = await parse(index_alias, q, section, start.offset, fetch_num(num), search_site)
+        pipeline.execute_command("FT.SEARCH", *query)
+        pending.append((i, search_site, q, section, start, num))
 
-    start = time.time()
+    start_time = time.time()
     try:
-        raw_result = await redis_client.execute_command("FT.SEARCH", *query)
-    except (aioredis.exceptions.ResponseError, UnicodeDecodeError) as e:
-        log.error("Search q failed: %s", e)
-        total = 0
-        docs = []
-    else:
-        result = Result(raw_result,
-                        True,
-                        duration=(time.time() - start) * 1000.0,
-                        has_payload=False,
-                        with_scores=False)
-        total = result.total
-        docs = result.docs
-    end = time.time()
-    newrelic.agent.record_custom_metric('search/q_ms', end - start)
+        raw_results = await pipeline.execute(raise_on_error=False) if pending else []
+    except (aioredis.exceptions.ConnectionError, aioredis.exceptions.TimeoutError,
+            UnicodeDecodeError) as e:
+        log.error("Batch search failed: %s", e)
+        raw_results = [e] * len(pending)
+    newrelic.agent.record_custom_metric('search/batch_ms', (time.time() - start_time) * 1000)
+
+    async def collect(i, search_site, q, section, start, num, raw_result):
+        if isinstance(raw_result, Exception):
+            log.error("Search q failed: %s", raw_result)
+            responses[i] = {"error": "Search failed"}
+            return
+        landing_page = find_landing_page(search_site, q)
+        pages = await query_pages(search_site, q, section, start, num, landing_page,
+                                  first_result=parse_search_reply(raw_result))
+        if pages is None:
+            responses[i] = {"error": "Search failed"}
+            return
+        responses[i] = {
+            "total": pages.total,
+            "results": transform_results(pages.docs, landing_page),
+            "next_start": pages.next_start
+        }
+
+    await asyncio.gather(*[collect(*search, raw_result)
+                           for search, raw_result in zip(pending, raw_results)])
+
+    return UJSONResponse(responses)
+
 
-    docs = transform_documents(docs, search_site, q)
-    return {"total": total, "results": docs}
+@router.get("/search/cache", dependencies=[Security(get_api_key)])
+async def search_cache():
+    """Get hit and miss counts for this worker's search result caches."""
+    return {"local": result_cache.stats(), "shared": shared_cache.stats()}
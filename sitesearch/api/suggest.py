@@ -0,0 +1,63 @@
+import logging
+from typing import Optional
+
+import aioredis
+from fastapi import APIRouter, HTTPException, status
+
+from sitesearch.config import get_config
+from sitesearch.connections import get_connection_manager
+
+read_client = get_connection_manager().reads
+log = logging.getLogger(__name__)
+config = get_config()
+router = APIRouter()
+
+DEFAULT_NUM = 5
+MAX_NUM = 20
+
+
+@router.get("/suggest")
+async def suggest(q: str,
+                  num: Optional[int] = None,
+                  site: Optional[str] = None):
+    """
+    Get autocomplete suggestions for a partial query.
+
+    Suggestions come from the titles and section titles in a site's index,
+    so this is much cheaper than a prefix search for every keystroke.
+
+    GET params:
+
+        q: The partial query. E.g. https://example.com/suggest?q=pyth
+
+        num: The number of suggestions to return. Defaults to 5.
+
+        site: The site to get suggestions for. If this isn't specified, we
+              use the default site specified in AppConfiguration.
+    """
+    num = min(num if isinstance(num, int) else DEFAULT_NUM, MAX_NUM)
+    site_url = site if site else config.default_search_site.url
+
+    if site_url not in config.sites:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="You must specify a valid search site.")
+
+    prefix = q.replace('*', '').strip()
+    if not prefix or num < 1:
+        return {"results": []}
+
+    try:
+        raw_result = await read_client.execute_command(
+            "FT.SUGGET", config.keys.suggestions(site_url), prefix,
+            "WITHPAYLOADS", "MAX", num)
+    except aioredis.exceptions.ResponseError as e:
+        log.error("Suggest failed: %s", e)
+        raw_result = None
+
+    raw_result = raw_result or []
+    return {
+        "results": [{
+            "text": text,
+            "url": url or ""
+        } for text, url in zip(raw_result[::2], raw_result[1::2])]
+    }
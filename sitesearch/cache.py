@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from sitesearch.keys import Keys
+from sitesearch.transformer import json_default
+
+log = logging.getLogger(__name__)
+
+# How long one API worker may hold the lock to compute a shared cache
+# entry before another worker gives up waiting and computes it too.
+SHARED_CACHE_LOCK_MS = 2000
+SHARED_CACHE_WAIT_SECONDS = 0.02
+SHARED_CACHE_WAIT_ATTEMPTS = 10
+
+
+class SearchResultCache:
+    """
+    An in-process LRU cache of search results.
+
+    Entries expire `ttl` seconds after we add them. The cache doesn't know
+    anything about the search index, so callers should include the index
+    generation (see IndexGenerations) in every key. When the indexer
+    switches an alias to a new index, the generation changes and entries
+    for the old index stop matching.
+
+    A `max_size` of 0 disables the cache.
+    """
+    def __init__(self,
+                 max_size: int,
+                 ttl: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        if not self.enabled:
+            return
+        self._entries[key] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "max_size": self.max_size
+        }
+
+
+class IndexGenerations:
+    """
+    Track the generation number of each site's search index.
+
+    The indexer increments a site's generation whenever it points the
+    site's index alias at a new index. Reading the counter costs a round
+    trip to Redis, so we only check it again after `refresh_interval`
+    seconds.
+    """
+    def __init__(self,
+                 redis_client,
+                 keys: Keys,
+                 refresh_interval: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self.redis = redis_client
+        self.keys = keys
+        self.refresh_interval = refresh_interval
+        self.clock = clock
+        self._generations: Dict[str, Tuple[float, str]] = {}
+
+    async def get(self, url: str) -> str:
+        now = self.clock()
+        checked_at, generation = self._generations.get(url, (None, None))
+
+        if checked_at is None or now - checked_at >= self.refresh_interval:
+            generation = await self.redis.get(self.keys.index_generation(url)) or "0"
+            self._generations[url] = (now, generation)
+
+        return generation
+
+
+class SharedResultCache:
+    """
+    A cache of search results in Redis, shared by every API worker.
+
+    Keys include the index generation, so entries for an old index stop
+    matching when the indexer moves the alias, and expire after `ttl`
+    seconds. We never have to scan for them.
+
+    Misses are single-flight: concurrent misses for the same key in one
+    worker wait on the same computation, and a short-lived lock in Redis
+    keeps workers on other nodes waiting for the result instead of running
+    the same search.
+
+    We write entries and locks with `redis_client`, and read entries with
+    `read_client` (a ReadRouter, say), if given.
+
+    A `ttl` of 0 disables the cache.
+    """
+    def __init__(self, redis_client, keys: Keys, ttl: int, read_client=None):
+        self.redis = redis_client
+        self.reads = read_client or redis_client
+        self.keys = keys
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def key(self, url: str, generation: str, cache_key: Tuple) -> str:
+        digest = hashlib.md5(json.dumps(cache_key).encode("utf-8")).hexdigest()
+        return self.keys.search_cache(url, generation, digest)
+
+    async def get_or_compute(self, url: str, generation: str, cache_key: Tuple,
+                             compute: Callable[[], Awaitable[Optional[Any]]]) -> Optional[Any]:
+        """
+        Get a cached value, or compute and cache it.
+
+        `compute` should return None if the value should not be cached.
+        """
+        key = self.key(url, generation, cache_key)
+
+        cached = await self.reads.get(key)
+        if cached is not None:
+            self.hits += 1
+            return json.loads(cached)
+
+        self.misses += 1
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            return await asyncio.shield(in_flight)
+
+        future = asyncio.get_event_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await self._compute(key, compute)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            del self._in_flight[key]
+            # Nobody may be waiting on the future, so retrieve the exception
+            # to keep asyncio from logging it.
+            if future.done() and not future.cancelled():
+                future.exception()
+
+    async def _compute(self, key: str, compute):
+        lock = self.keys.search_cache_lock(key)
+        locked = await self.redis.set(lock, 1, nx=True, px=SHARED_CACHE_LOCK_MS)
+
+        if not locked:
+            # Another worker is running this search. Wait for its result.
+            for _ in range(SHARED_CACHE_WAIT_ATTEMPTS):
+                await asyncio.sleep(SHARED_CACHE_WAIT_SECONDS)
+                cached = await self.reads.get(key)
+                if cached is not None:
+                    return json.loads(cached)
+
+        try:
+            value = await compute()
+            if value is not None:
+                await self.redis.set(key, json.dumps(value, default=json_default), ex=self.ttl)
+        finally:
+            if locked:
+                await self.redis.delete(lock)
+
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "ttl": self.ttl}
@@ -11,8 +11,12 @@ log = logging.getLogger(__name__)
 
 
 @click.argument('site')
+@click.option('--full', is_flag=True, default=False,
+              help="Crawl and parse every page, even if it hasn't changed")
+@click.option('--record', type=click.Path(dir_okay=False), default=None,
+              help="Append every page we fetch to this snapshot file as a new crawl (implies --full)")
 @click.command()
-def index(site: str):
+def index(site: str, full: bool, record: str):
     """Index the app's configured sites in RediSearch."""
     site = config.sites.get(site)
 
@@ -21,4 +25,4 @@ def index(site: str):
         raise click.BadArgumentUsage(
             f"The site you gave does not exist. Valid sites: {valid_sites}")
 
-    tasks.index(site, force=True)
+    tasks.index(site, force=True, incremental=not full, record=record)
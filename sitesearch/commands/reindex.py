@@ -0,0 +1,29 @@
+import logging
+
+import click
+
+from sitesearch import tasks
+from sitesearch.config import AppConfiguration
+
+
+config = AppConfiguration()
+log = logging.getLogger(__name__)
+
+
+@click.argument('snapshot', type=click.Path(exists=True, dir_okay=False))
+@click.argument('site')
+@click.option('--force', is_flag=True, default=False,
+              help="Reindex even if the site is being indexed")
+@click.command()
+def reindex(site: str, snapshot: str, force: bool):
+    """Index a site from a snapshot recorded with `index --record`, without crawling."""
+    site = config.sites.get(site)
+
+    if site is None:
+        valid_sites = ", ".join(config.sites.keys())
+        raise click.BadArgumentUsage(
+            f"The site you gave does not exist. Valid sites: {valid_sites}")
+
+    if not tasks.reindex_from_snapshot(site, snapshot, force=force):
+        raise click.ClickException(
+            "The site is being indexed. Try again when it's done, or pass --force.")
@@ -0,0 +1,28 @@
+import json
+import logging
+
+import click
+
+from sitesearch import tasks
+from sitesearch.config import AppConfiguration
+
+
+config = AppConfiguration()
+log = logging.getLogger(__name__)
+
+
+@click.argument('site')
+@click.option('--dry-run', is_flag=True, default=False,
+              help="Report how scores would change without writing them")
+@click.command()
+def rescore(site: str, dry_run: bool):
+    """Score a site's indexed documents again with its current scorers."""
+    site = config.sites.get(site)
+
+    if site is None:
+        valid_sites = ", ".join(config.sites.keys())
+        raise click.BadArgumentUsage(
+            f"The site you gave does not exist. Valid sites: {valid_sites}")
+
+    report = tasks.rescore(site, dry_run=dry_run)
+    click.echo(json.dumps(report.to_dict(), indent=2))
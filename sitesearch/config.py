@@ -15,6 +15,37 @@ KEY_PREFIX = os.environ.get('KEY_PREFIX', DEFAULT_PREFIX)
 ENV = os.environ.get('ENV')
 IS_DEV = ENV in ('development', 'test')
 
+# The indexer writes documents to Redis in pipelined batches. A batch
+# is flushed when it reaches either of these limits.
+INDEX_BATCH_SIZE = int(os.environ.get('INDEX_BATCH_SIZE', 500))
+INDEX_BATCH_BYTES = int(os.environ.get('INDEX_BATCH_BYTES', 1024 * 1024 * 4))
+
+# If STREAM_INDEXING is "true", the indexer writes documents to Redis while
+# it crawls, holding at most INDEX_QUEUE_SIZE documents in memory, and
+# fixes up their hierarchies after the crawl. New documents are searchable
+# before their hierarchies are complete; documents already in the index
+# keep theirs until the crawl finishes. Otherwise, the indexer holds every
+# document until the crawl finishes.
+STREAM_INDEXING = os.environ.get('STREAM_INDEXING', 'false').lower() == 'true'
+INDEX_QUEUE_SIZE = int(os.environ.get('INDEX_QUEUE_SIZE', 2000))
+
+# The number of processes the indexer uses to parse HTML. If this is 0,
+# the indexer parses pages in the crawler process.
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', 0))
+
+# The number of extra RQ jobs that help crawl a site, sharing a crawl
+# frontier in Redis. If this is 0, one job crawls each site alone.
+CRAWL_WORKERS = int(os.environ.get('CRAWL_WORKERS', 0))
+
+# Each API worker caches search results in memory. Set the size to 0 to
+# disable the cache.
+SEARCH_CACHE_SIZE = int(os.environ.get('SEARCH_CACHE_SIZE', 1000))
+SEARCH_CACHE_TTL = float(os.environ.get('SEARCH_CACHE_TTL', 60))
+
+# All API workers share a second cache of search results in Redis. Set
+# the TTL to 0 to disable it.
+SHARED_SEARCH_CACHE_TTL = int(os.environ.get('SHARED_SEARCH_CACHE_TTL', 300))
+
 # The front-end is currently querying with this URL. Temporarily allow it
 # as an alternate for the configured URL.
 ALTERNATE_DOCS_URL = "https://docs.redis.com/latest"
@@ -41,7 +72,16 @@ class AppConfiguration:
                  is_dev: bool = IS_DEV,
                  key_prefix: str = KEY_PREFIX,
                  env: str = ENV,
-                 sites: Optional[Dict[str, SiteConfiguration]] = DEV_SITES):
+                 sites: Optional[Dict[str, SiteConfiguration]] = DEV_SITES,
+                 index_batch_size: int = INDEX_BATCH_SIZE,
+                 index_batch_bytes: int = INDEX_BATCH_BYTES,
+                 stream_indexing: bool = STREAM_INDEXING,
+                 index_queue_size: int = INDEX_QUEUE_SIZE,
+                 parse_workers: int = PARSE_WORKERS,
+                 crawl_workers: int = CRAWL_WORKERS,
+                 search_cache_size: int = SEARCH_CACHE_SIZE,
+                 search_cache_ttl: float = SEARCH_CACHE_TTL,
+                 shared_search_cache_ttl: int = SHARED_SEARCH_CACHE_TTL):
 
         self.default_search_site = default_search_site
         self.is_dev = is_dev
@@ -49,6 +89,15 @@ class AppConfiguration:
         self.keys = Keys(key_prefix)
         self.sites = sites
         self.env = env
+        self.index_batch_size = index_batch_size
+        self.index_batch_bytes = index_batch_bytes
+        self.stream_indexing = stream_indexing
+        self.index_queue_size = index_queue_size
+        self.parse_workers = parse_workers
+        self.crawl_workers = crawl_workers
+        self.search_cache_size = search_cache_size
+        self.search_cache_ttl = search_cache_ttl
+        self.shared_search_cache_ttl = shared_search_cache_ttl
 
         if not IS_DEV:
             self.sites = PROD_SITES
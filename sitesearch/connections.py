@@ -1,6 +1,11 @@
 import os
 import logging
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
+import aioredis
 from dotenv import load_dotenv
 from aioredis import Redis as AsyncRedis
 from redis import Redis
@@ -13,6 +18,23 @@ REDIS_HOST = os.environ.get('REDIS_HOST')
 REDIS_PORT = os.environ.get('REDIS_PORT', 6379)
 RETRY_COUNT = 3
 
+# Settings for the API's async connection pools.
+REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 50))
+# How long a request waits for a free connection before failing.
+REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT', 1))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 1))
+REDIS_CONNECT_TIMEOUT = float(os.environ.get('REDIS_CONNECT_TIMEOUT', 1))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', 30))
+
+# Replicas to send search reads to, as a comma-separated list of host:port.
+REDIS_READ_REPLICAS = os.environ.get('REDIS_READ_REPLICAS', '')
+
+# After a replica fails, we send its reads to the primary for this long.
+REPLICA_RETRY_SECONDS = 5
+
+# How much each new latency sample moves a replica's average latency.
+LATENCY_SMOOTHING = 0.2
+
 log = logging.getLogger(__name__)
 
 
@@ -52,3 +74,231 @@ def get_search_connection(index: str,
 def get_rq_redis_client():
     """The rq library expects to read raw strings."""
     return get_redis_connection(decode_responses=False)
+
+
+def parse_replicas(replicas: str) -> List[Tuple[str, int]]:
+    """Parse a comma-separated list of host:port pairs."""
+    parsed = []
+    for replica in replicas.split(','):
+        replica = replica.strip()
+        if not replica:
+            continue
+        host, _, port = replica.partition(':')
+        parsed.append((host, int(port or 6379)))
+    return parsed
+
+
+class InstrumentedConnectionPool(aioredis.BlockingConnectionPool):
+    """
+    A connection pool that keeps statistics about its connections.
+
+    When every connection is checked out, requests wait up to `timeout`
+    seconds for one. We count how often that happens and for how long, and
+    how often we couldn't get a connection at all.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requests = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.failures = 0
+
+    async def get_connection(self, command_name, *keys, **options):
+        self.requests += 1
+        if self.pool.empty():
+            self.waits += 1
+        start = time.perf_counter()
+        try:
+            return await super().get_connection(command_name, *keys, **options)
+        except aioredis.exceptions.ConnectionError:
+            self.failures += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_connections": self.max_connections,
+            # Free slots in the queue are connections (or placeholders for
+            # connections) that nobody has checked out.
+            "checked_out": self.max_connections - self.pool.qsize(),
+            "open": len(self._connections),
+            "requests": self.requests,
+            "waits": self.waits,
+            "failures": self.failures,
+            "wait_ms": self.wait_seconds * 1000,
+            "max_wait_ms": self.max_wait_seconds * 1000
+        }
+
+
+@dataclass
+class Replica:
+    """A read replica and what we know about how it's doing."""
+    name: str
+    client: Any
+    outstanding: int = 0
+    latency: float = 0.0
+    failures: int = 0
+    down_until: float = 0.0
+
+
+class ReadRouter:
+    """
+    Send reads to the replica with the fewest outstanding requests.
+
+    Ties go to the replica with the lowest average latency. If a replica
+    fails to answer, we retry the read on the primary and stop sending reads
+    to that replica for `retry_seconds`. Without replicas, every read goes
+    to the primary.
+    """
+    def __init__(self, primary, replicas: List[Replica],
+                 retry_seconds: float = REPLICA_RETRY_SECONDS,
+                 clock=time.monotonic):
+        self.primary = primary
+        self.replicas = replicas
+        self.retry_seconds = retry_seconds
+        self.clock = clock
+        self.fallbacks = 0
+
+    def choose(self) -> Optional[Replica]:
+        now = self.clock()
+        available = [r for r in self.replicas if r.down_until <= now]
+        return min(available, key=lambda r: (r.outstanding, r.latency), default=None)
+
+    async def route(self, send: Callable[[Any], Awaitable[Any]]):
+        """Call `send` with the client a read should go to, and await it."""
+        replica = self.choose()
+        if replica is None:
+            return await send(self.primary)
+
+        replica.outstanding += 1
+        start = self.clock()
+        try:
+            result = await send(replica.client)
+        except (aioredis.exceptions.ConnectionError, aioredis.exceptions.TimeoutError) as e:
+            log.warning("Replica %s failed, reading from the primary: %s", replica.name, e)
+            replica.failures += 1
+            self.mark_down(replica)
+            self.fallbacks += 1
+            return await send(self.primary)
+        finally:
+            replica.outstanding -= 1
+
+        elapsed = self.clock() - start
+        replica.latency += (elapsed - replica.latency) * LATENCY_SMOOTHING
+        return result
+
+    async def execute_command(self, *args, **options):
+        return await self.route(lambda client: client.execute_command(*args, **options))
+
+    async def get(self, name: str):
+        return await self.execute_command("GET", name)
+
+    def mark_down(self, replica: Replica):
+        """Stop sending reads to a replica for `retry_seconds`."""
+        replica.down_until = self.clock() + self.retry_seconds
+
+    def pipeline(self, transaction: bool = True) -> 'RoutedPipeline':
+        """Start a pipeline of reads, which we route when it executes."""
+        return RoutedPipeline(self, transaction)
+
+    def stats(self) -> Dict[str, Any]:
+        now = self.clock()
+        return {
+            "fallbacks": self.fallbacks,
+            "replicas": {
+                r.name: {
+                    "available": r.down_until <= now,
+                    "outstanding": r.outstanding,
+                    "latency_ms": r.latency * 1000,
+                    "failures": r.failures
+                } for r in self.replicas
+            }
+        }
+
+
+class RoutedPipeline:
+    """
+    A pipeline of reads that a ReadRouter routes like a single command.
+
+    We hold on to the commands until the pipeline executes, so that if
+    the replica we chose fails, we can send them to the primary.
+    """
+    def __init__(self, router: ReadRouter, transaction: bool = True):
+        self.router = router
+        self.transaction = transaction
+        self.commands: List[Tuple[tuple, Dict[str, Any]]] = []
+
+    def execute_command(self, *args, **options) -> 'RoutedPipeline':
+        self.commands.append((args, options))
+        return self
+
+    def __len__(self):
+        return len(self.commands)
+
+    async def execute(self, raise_on_error: bool = True) -> List[Any]:
+        async def send(client):
+            pipeline = client.pipeline(transaction=self.transaction)
+            for args, options in self.commands:
+                pipeline.execute_command(*args, **options)
+            return await pipeline.execute(raise_on_error=raise_on_error)
+
+        return await self.router.route(send)
+
+
+class ConnectionManager:
+    """
+    The async Redis clients the API shares.
+
+    `primary` is a client for the Redis we write to. `reads` routes search
+    reads to the configured replicas, falling back to the primary.
+    """
+    def __init__(self,
+                 host: str = REDIS_HOST,
+                 port: int = REDIS_PORT,
+                 password: str = REDIS_PASSWORD,
+                 replicas: List[Tuple[str, int]] = None,
+                 max_connections: int = REDIS_MAX_CONNECTIONS,
+                 pool_timeout: float = REDIS_POOL_TIMEOUT,
+                 socket_timeout: float = REDIS_SOCKET_TIMEOUT,
+                 connect_timeout: float = REDIS_CONNECT_TIMEOUT,
+                 health_check_interval: int = REDIS_HEALTH_CHECK_INTERVAL):
+        if replicas is None:
+            replicas = parse_replicas(REDIS_READ_REPLICAS)
+
+        def make_pool(host: str, port: int) -> InstrumentedConnectionPool:
+            return InstrumentedConnectionPool(max_connections=max_connections,
+                                              timeout=pool_timeout,
+                                              host=host,
+                                              port=port,
+                                              password=password,
+                                              decode_responses=True,
+                                              retry_on_timeout=True,
+                                              socket_timeout=socket_timeout,
+                                              socket_connect_timeout=connect_timeout,
+                                              health_check_interval=health_check_interval)
+
+        self.pools: Dict[str, InstrumentedConnectionPool] = {"primary": make_pool(host, port)}
+        self.primary = AsyncRedis(connection_pool=self.pools["primary"])
+
+        read_replicas = []
+        for replica_host, replica_port in replicas:
+            name = f"{replica_host}:{replica_port}"
+            self.pools[name] = make_pool(replica_host, replica_port)
+            read_replicas.append(Replica(name, AsyncRedis(connection_pool=self.pools[name])))
+        self.reads = ReadRouter(self.primary, read_replicas)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pools": {name: pool.stats() for name, pool in self.pools.items()},
+            "reads": self.reads.stats()
+        }
+
+
+@lru_cache(maxsize=None)
+def get_connection_manager() -> ConnectionManager:
+    """Get the connection manager the API's routers share."""
+    return ConnectionManager()
@@ -0,0 +1,85 @@
+"""
+Cursors for paging through search results.
+
+A search returns one result per page of the site, but the index has a
+document for each section of a page, so the Nth result isn't at any
+offset we can compute from N. A cursor holds what we need to carry on
+where the last response stopped: the offset of the next document to
+read, and the pages we've already returned, whose other sections we
+skip.
+
+Clients treat cursors as opaque: they pass the "next_start" of one
+response as the "start" of the next request. Clients that page by
+offset, which is all that "start" used to be, still can: a number is a
+cursor with no pages.
+
+A cursor only remembers the last MAX_PAGES pages, so it stays small
+however deep a client pages. Deep enough in the results, a section of a
+page we returned long before can come back.
+"""
+import base64
+import binascii
+import hashlib
+import struct
+from typing import Iterable
+
+# Cursors start with this, so they're never mistaken for an offset.
+CURSOR_PREFIX = "c"
+
+# The number of pages a cursor remembers: three pages of the most results
+# a search returns.
+MAX_PAGES = 300
+
+
+def page_digest(url: str) -> int:
+    """
+    Return a 32-bit digest of a page URL.
+
+    A cursor keeps a digest of the pages it has returned. A collision
+    would, at worst, leave a page out of the rest of the results.
+    """
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=4).digest(), "big")
+
+
+class SearchCursor:
+    """
+    Where to continue a search: a document offset, and the digests of the
+    pages we returned, in the order we returned them.
+    """
+    __slots__ = ('offset', 'pages')
+
+    def __init__(self, offset: int = 0, pages: Iterable[int] = ()):
+        self.offset = offset
+        self.pages = tuple(pages)[-MAX_PAGES:]
+
+    def __eq__(self, other):
+        return isinstance(other, SearchCursor) and \
+            (self.offset, self.pages) == (other.offset, other.pages)
+
+    def __repr__(self):
+        return f"SearchCursor({self.offset!r}, pages={len(self.pages)})"
+
+    def encode(self) -> str:
+        packed = struct.pack(f">I{len(self.pages)}I", self.offset, *self.pages)
+        return CURSOR_PREFIX + base64.urlsafe_b64encode(packed).decode("ascii").rstrip("=")
+
+    @classmethod
+    def decode(cls, token: str) -> 'SearchCursor':
+        """
+        Decode a cursor that encode() made, or an offset.
+
+        Raises ValueError if `token` is neither.
+        """
+        if token.isdigit():
+            return cls(int(token))
+        if not token.startswith(CURSOR_PREFIX):
+            raise ValueError(f"Bad search cursor: {token!r}")
+        token = token[len(CURSOR_PREFIX):]
+        try:
+            packed = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        except (binascii.Error, ValueError) as e:
+            raise ValueError(f"Bad search cursor: {token!r}") from e
+        if not packed or len(packed) % 4:
+            raise ValueError(f"Bad search cursor: {token!r}")
+        offset, *pages = struct.unpack(f">{len(packed) // 4}I", packed)
+        return cls(offset, pages)
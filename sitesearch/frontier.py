@@ -0,0 +1,406 @@
+"""
+Share the crawl of one site between several workers.
+
+In a distributed crawl, one indexing job -- the coordinator -- starts a
+CrawlFrontier in Redis and seeds it with the site's start URL. Helper
+jobs (see tasks.crawl()) join the crawl, and every worker's spider takes
+page URLs from the frontier and adds the links it finds back to it.
+
+The frontier is a list of URLs to crawl, a duplicate filter, and a sorted
+set of the URLs that workers are crawling, scored by when they took them.
+A worker that dies leaves its URLs in flight, so workers put URLs that
+have been in flight too long back in the frontier. The crawl is over when
+the frontier is empty and nothing is in flight. The coordinator then
+waits for the other workers to finish writing, and swaps the new index in.
+
+A worker doesn't write to Redis for every link it finds. It buffers the
+links of a page, and its manifest entry, until it has handled the page,
+and then sends them, and takes the page out of flight, in one round trip.
+
+All of a crawl's keys share the {crawl} hash tag, so our scripts work
+with Redis Cluster. Workers keep the keys alive with their heartbeats, so
+if every worker dies, the keys expire.
+"""
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from redis import Redis
+from scrapy import Request
+from w3lib.url import canonicalize_url
+
+from sitesearch.keys import Keys
+
+# How long a URL can be in flight before we give it to another worker.
+IN_FLIGHT_TIMEOUT = 60 * 5
+# How long a worker can go without a heartbeat before we consider it dead.
+WORKER_TIMEOUT = 60 * 2
+HEARTBEAT_SECONDS = 10
+# How long a crawl's keys outlive the last write or heartbeat of its workers.
+KEYS_TTL = 60 * 10
+# How often, at most, a scheduler with nothing to do asks Redis whether
+# the crawl is still going.
+DRAIN_CHECK_SECONDS = 1.0
+# How long a helper waits for the coordinator to start the crawl.
+START_TIMEOUT = 60
+# The number of URLs a worker takes from the frontier at once.
+POP_BATCH_SIZE = 16
+
+# Requests that we don't share with other workers, like those for
+# sitemaps, are in flight as "local:<worker ID> <URL>".
+LOCAL_PREFIX = "local:"
+
+# The request meta key that holds a request's in-flight entry.
+FRONTIER_ENTRY = "frontier_entry"
+
+ADD_SCRIPT = """
+local added = 0
+for i = 2, #ARGV, 2 do
+    if redis.call('SADD', KEYS[1], ARGV[i]) == 1 or ARGV[1] == '1' then
+        redis.call('LPUSH', KEYS[2], ARGV[i + 1])
+        added = added + 1
+    end
+end
+return added
+"""
+
+POP_SCRIPT = """
+local entries = {}
+for i = 1, tonumber(ARGV[1]) do
+    local entry = redis.call('RPOP', KEYS[1])
+    if not entry then
+        break
+    end
+    redis.call('ZADD', KEYS[2], ARGV[2], entry)
+    entries[#entries + 1] = entry
+end
+return entries
+"""
+
+REQUEUE_SCRIPT = """
+local stalled = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, entry in ipairs(stalled) do
+    redis.call('ZREM', KEYS[1], entry)
+    if string.sub(entry, 1, string.len(ARGV[2])) ~= ARGV[2] then
+        redis.call('RPUSH', KEYS[2], entry)
+    end
+end
+return #stalled
+"""
+
+log = logging.getLogger(__name__)
+
+
+def frontier_entry(url: str, lastmod: str = "") -> str:
+    """Encode a URL, and its sitemap lastmod date if it has one, for the frontier."""
+    return f"{url} {lastmod}" if lastmod else url
+
+
+def parse_frontier_entry(entry: str) -> Tuple[str, str]:
+    url, _, lastmod = entry.partition(" ")
+    return url, lastmod
+
+
+def url_fingerprint(url: str) -> str:
+    """Fingerprint a URL like Scrapy's duplicate filter, ignoring its fragment."""
+    return hashlib.md5(canonicalize_url(url).encode("utf-8")).hexdigest()
+
+
+class CrawlFrontier:
+    """The URLs that the workers of a distributed crawl of a site share."""
+    def __init__(self, redis_client: Redis, keys: Keys, site_url: str,
+                 worker_id: Optional[str] = None):
+        self.redis = redis_client
+        # Before we moved it out of the site's index prefix, RediSearch
+        # indexed the crawl state as a document.
+        self.legacy_state_key = f"{keys.index_prefix(site_url)}:{{crawl}}:state"
+        self.worker_id = worker_id or uuid.uuid4().hex
+        self.frontier_key = keys.crawl_frontier(site_url)
+        self.seen_key = keys.crawl_seen(site_url)
+        self.in_flight_key = keys.crawl_in_flight(site_url)
+        self.workers_key = keys.crawl_workers(site_url)
+        self.state_key = keys.crawl_state(site_url)
+        self.manifest_key = keys.page_manifest_new(site_url)
+        self.add_script = self.redis.register_script(ADD_SCRIPT)
+        self.pop_script = self.redis.register_script(POP_SCRIPT)
+        self.requeue_script = self.redis.register_script(REQUEUE_SCRIPT)
+        self.stop_heartbeat = threading.Event()
+        # Entries to add, by whether to add them even if a worker has seen
+        # them, and page manifest entries to write, until the next flush().
+        self.buffered_entries: Dict[bool, List[str]] = {False: [], True: []}
+        self.buffered_pages: Dict[str, str] = {}
+
+    @property
+    def all_keys(self) -> Tuple[str, ...]:
+        return (self.frontier_key, self.seen_key, self.in_flight_key,
+                self.workers_key, self.state_key)
+
+    def start(self, index_name: str, incremental: bool, urls: Iterable[str] = (),
+              local_urls: Iterable[str] = ()):
+        """
+        Start a crawl, replacing any crawl of the site that came before.
+
+        Helpers take `urls` from the frontier right away. `local_urls` are
+        URLs that only the coordinator requests, like a sitemap's, which
+        we count as in flight so that helpers wait for the pages they lead to.
+        """
+        self.redis.delete(*self.all_keys, self.legacy_state_key)
+        for url in local_urls:
+            self.add_local(url)
+        self.add(urls, dont_filter=True)
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.hset(self.state_key, mapping={
+            "index_name": index_name,
+            "incremental": int(incremental),
+            "coordinator": self.worker_id,
+        })
+        self.expire(pipeline)
+        pipeline.execute()
+
+    def expire(self, pipeline):
+        """Make every key of the crawl expire KEYS_TTL from now."""
+        for key in self.all_keys:
+            pipeline.expire(key, KEYS_TTL)
+
+    def state(self) -> Dict[str, str]:
+        return self.redis.hgetall(self.state_key)
+
+    def wait_for_start(self, index_name: str, timeout: float = START_TIMEOUT,
+                       poll_seconds: float = 1.0) -> Optional[Dict[str, str]]:
+        """Wait for the coordinator to start the crawl that builds `index_name`."""
+        deadline = time.monotonic() + timeout
+        while True:
+            state = self.state()
+            if state.get("index_name") == index_name:
+                return state
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(poll_seconds)
+
+    def add(self, entries: Iterable[str], dont_filter: bool = False, client=None) -> int:
+        """Add frontier entries whose URLs no worker has seen yet."""
+        args = []
+        for entry in entries:
+            url, _ = parse_frontier_entry(entry)
+            args += [url_fingerprint(url), entry]
+        if not args:
+            return 0
+        return self.add_script(keys=[self.seen_key, self.frontier_key],
+                               args=["1" if dont_filter else "0", *args],
+                               client=client)
+
+    def add_later(self, entry: str, dont_filter: bool = False):
+        """Buffer a frontier entry until the next flush()."""
+        self.buffered_entries[dont_filter].append(entry)
+
+    def record_page_later(self, url: str, entry: str):
+        """Buffer a page's manifest entry, for the coordinator, until the next flush()."""
+        self.buffered_pages[url] = entry
+
+    @property
+    def has_buffered(self) -> bool:
+        return bool(self.buffered_pages or any(self.buffered_entries.values()))
+
+    def flush(self, done: Optional[str] = None):
+        """
+        Write what we buffered, and then take `done`, if given, out of
+        flight, in one round trip.
+        """
+        if not self.has_buffered and done is None:
+            return
+        pipeline = self.redis.pipeline(transaction=False)
+        for dont_filter, entries in self.buffered_entries.items():
+            self.add(entries, dont_filter, client=pipeline)
+        if self.buffered_pages:
+            pipeline.hset(self.manifest_key, mapping=self.buffered_pages)
+        if done is not None:
+            pipeline.zrem(self.in_flight_key, done)
+        # We may have created keys since the last heartbeat.
+        self.expire(pipeline)
+        self.buffered_entries = {False: [], True: []}
+        self.buffered_pages = {}
+        pipeline.execute()
+
+    def pop(self, count: int = POP_BATCH_SIZE) -> List[str]:
+        """Take up to `count` entries from the frontier and mark them in flight."""
+        return self.pop_script(keys=[self.frontier_key, self.in_flight_key],
+                               args=[count, time.time()])
+
+    def see(self, url: str) -> bool:
+        """Mark a URL as seen. Returns False if a worker has seen it already."""
+        return bool(self.redis.sadd(self.seen_key, url_fingerprint(url)))
+
+    def add_local(self, url: str) -> str:
+        """Mark a request that only this worker makes as in flight."""
+        entry = f"{LOCAL_PREFIX}{self.worker_id} {url}"
+        self.redis.zadd(self.in_flight_key, {entry: time.time()})
+        return entry
+
+    def done(self, entry: str):
+        self.redis.zrem(self.in_flight_key, entry)
+
+    def requeue_stalled(self, timeout: float = IN_FLIGHT_TIMEOUT) -> int:
+        """Put URLs that have been in flight for too long back in the frontier."""
+        requeued = self.requeue_script(keys=[self.in_flight_key, self.frontier_key],
+                                       args=[time.time() - timeout, LOCAL_PREFIX])
+        if requeued:
+            log.warning("Requeued %d stalled URLs", requeued)
+        return requeued
+
+    def is_drained(self) -> bool:
+        """Check whether there is nothing left to crawl or being crawled."""
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.llen(self.frontier_key)
+        pipeline.zcard(self.in_flight_key)
+        return not any(pipeline.execute())
+
+    def register(self):
+        """Count this worker as part of the crawl until deregister()."""
+        self.stop_heartbeat.clear()
+        self.heartbeat()
+        threading.Thread(target=self.keep_alive, daemon=True).start()
+
+    def heartbeat(self):
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.zadd(self.workers_key, {self.worker_id: time.time()})
+        self.expire(pipeline)
+        pipeline.execute()
+
+    def keep_alive(self):
+        while not self.stop_heartbeat.wait(HEARTBEAT_SECONDS):
+            self.heartbeat()
+
+    def deregister(self):
+        self.stop_heartbeat.set()
+        self.redis.zrem(self.workers_key, self.worker_id)
+
+    def other_workers(self, timeout: float = WORKER_TIMEOUT) -> int:
+        """Count the other workers that are still alive."""
+        workers = self.redis.zrangebyscore(self.workers_key, time.time() - timeout, "+inf")
+        return len([w for w in workers if w != self.worker_id])
+
+    def clear(self):
+        self.redis.delete(*self.all_keys)
+
+
+class FrontierScheduler:
+    """
+    A Scrapy scheduler that shares page requests through a CrawlFrontier.
+
+    Requests for pages -- those with the spider's `parse` callback -- go
+    to the frontier, and we make requests for the pages we take from it.
+    Other requests, like those for sitemaps, stay with this worker, but
+    count as in flight so the crawl doesn't end while we make them.
+
+    We report pending requests until the crawl is over, so Scrapy keeps
+    the spider open while other workers might still add URLs. The
+    coordinator also waits for the other workers to finish.
+    """
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.spider = None
+        self.frontier: Optional[CrawlFrontier] = None
+        self.local: deque = deque()
+        self.taken: deque = deque()
+        self.checked_at = 0.0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def open(self, spider):
+        self.spider = spider
+        self.frontier = spider.frontier
+
+    def close(self, reason):
+        pass
+
+    def __len__(self):
+        return len(self.local) + len(self.taken)
+
+    def request_failed(self, entry: str, failure):
+        self.frontier.done(entry)
+
+    def enqueue_request(self, request: Request) -> bool:
+        if FRONTIER_ENTRY in request.meta:
+            # A retry. It's still in flight, so we keep it.
+            self.local.append(request)
+            return True
+
+        if request.callback == self.spider.parse:
+            # FrontierMiddleware adds the links of a page once we've
+            # handled it. We won't know until then if another worker saw
+            # them first.
+            entry = frontier_entry(request.url, request.cb_kwargs.get("lastmod", ""))
+            self.frontier.add_later(entry, dont_filter=request.dont_filter)
+            return True
+
+        if not request.dont_filter and not self.frontier.see(request.url):
+            return False
+        entry = self.frontier.add_local(request.url)
+        self.local.append(request.replace(
+            errback=request.errback or partial(self.request_failed, entry),
+            meta={**request.meta, FRONTIER_ENTRY: entry}))
+        return True
+
+    def next_request(self) -> Optional[Request]:
+        if self.local:
+            return self.local.popleft()
+        if not self.taken:
+            # Links we haven't added yet might be all that's left to crawl.
+            self.frontier.flush()
+            self.taken.extend(self.frontier.pop())
+        if not self.taken:
+            return None
+
+        entry = self.taken.popleft()
+        url, lastmod = parse_frontier_entry(entry)
+        return self.spider.page_request(url, lastmod,
+                                        errback=partial(self.request_failed, entry),
+                                        meta={FRONTIER_ENTRY: entry})
+
+    def has_pending_requests(self) -> bool:
+        if self.local or self.taken:
+            return True
+
+        # While the crawl is going, we only need to ask Redis now and then.
+        now = time.monotonic()
+        if now - self.checked_at < DRAIN_CHECK_SECONDS:
+            return True
+
+        self.frontier.flush()
+        self.frontier.requeue_stalled()
+        pending = not self.frontier.is_drained() or \
+            (self.spider.coordinator and self.frontier.other_workers() > 0)
+        if pending:
+            self.checked_at = now
+        return pending
+
+
+class FrontierMiddleware:
+    """
+    A spider middleware that, once we've handled a page, adds its links to
+    the frontier and takes it out of flight.
+    """
+    def process_spider_output(self, response, result, spider):
+        try:
+            yield from result
+        finally:
+            # The scheduler has buffered the requests for the page's links.
+            spider.frontier.flush(response.meta.get(FRONTIER_ENTRY))
+
+    async def process_spider_output_async(self, response, result, spider):
+        """Newer versions of Scrapy give us asynchronous output."""
+        try:
+            async for output in result:
+                yield output
+        finally:
+            spider.frontier.flush(response.meta.get(FRONTIER_ENTRY))
+
+    def process_spider_exception(self, response, exception, spider):
+        spider.frontier.flush(response.meta.get(FRONTIER_ENTRY))
@@ -0,0 +1,358 @@
+"""
+HTML backends for DocumentParser.
+
+A backend parses the HTML of a page and extracts the raw text that
+DocumentParser indexes: the page title, the text of the page's main
+content, and the title and text of every section of the content. A
+section starts at an H2 element (or an H3, if the content has no H2s) and
+runs until the next H2 sibling.
+
+DocumentParser hashes the text a backend extracts into document IDs, so
+every backend must extract exactly the same text from the same page. The
+BeautifulSoup backend defines the expected output.
+"""
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import lxml.html
+from bs4 import BeautifulSoup, UnicodeDammit, element
+from lxml import etree
+
+log = logging.getLogger(__name__)
+
+Html = Union[str, bytes]
+
+# get_text() only includes these strings...
+TEXT_STRINGS = (element.NavigableString, element.CData)
+
+# ...so it leaves the text inside these elements out.
+NON_TEXT_TAGS = {'script', 'style', 'template'}
+
+# BeautifulSoup collapses strings of these characters, except inside these
+# elements.
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+
+
+@dataclass
+class ParsedHtml:
+    """The raw text DocumentParser needs from a page."""
+    title: Optional[str]
+    body: str
+    sections: List[Tuple[str, str]]  # (section title, section text)
+
+
+class HtmlBackend(ABC):
+    """Extracts a ParsedHtml from the HTML of a page."""
+    name: str
+
+    @abstractmethod
+    def parse(self, html: Html, content_classes: Optional[Sequence[str]]) -> ParsedHtml:
+        """Parse a page, keeping only the content inside `content_classes`, if given."""
+
+
+def _collapse(text: str, preserve_whitespace: bool = False) -> str:
+    """
+    Collapse whitespace-only text like BeautifulSoup does.
+
+    BeautifulSoup replaces a string that contains nothing but whitespace
+    with a single newline (or a single space, if it has no newlines),
+    except inside <pre> and <textarea>.
+    """
+    if preserve_whitespace or text.strip(ASCII_SPACES):
+        return text
+    return "\n" if "\n" in text else " "
+
+
+# A section is a list of pieces, one per sibling that follows its heading:
+# (whether the sibling is an element, the strings of the sibling).
+Piece = Tuple[bool, List[str]]
+
+
+def _join_section(pieces: List[Piece]) -> str:
+    """
+    Join the siblings of a section into its text.
+
+    Sections were originally extracted by joining the HTML of the siblings
+    with newlines and parsing the result again, so the strings between two
+    sibling elements become a single string -- which BeautifulSoup
+    collapses if it's nothing but whitespace. We keep doing that so that
+    the text, and the document IDs we hash from it, stay the same.
+    """
+    text: List[str] = []
+    run: List[str] = []
+    after_element = False
+
+    for is_element, strings in pieces:
+        if is_element:
+            run_text = "\n".join(run)
+            if after_element:
+                run_text = "\n" + run_text
+            if after_element or run:
+                text.append(_collapse(run_text + "\n"))
+            text.extend(strings)
+            run = []
+            after_element = True
+        else:
+            run.append("".join(strings))
+
+    if run:
+        run_text = "\n".join(run)
+        text.append(_collapse("\n" + run_text if after_element else run_text))
+
+    return "".join(text)
+
+
+class BeautifulSoupBackend(HtmlBackend):
+    """
+    Parse pages with BeautifulSoup and Python's built-in html.parser.
+
+    We walk the tree of the page's content once, collecting the text of the
+    page and of every section as we go.
+    """
+    name = 'html.parser'
+
+    def parse(self, html: Html, content_classes: Optional[Sequence[str]]) -> ParsedHtml:
+        soup = BeautifulSoup(html, 'html.parser')
+        content = soup
+
+        try:
+            title = soup.title.string
+        except AttributeError:
+            title = None
+
+        # Use the first content class we find on the page. (i.e., main
+        # page content).
+        if content_classes:
+            for content_class in content_classes:
+                main_content = soup.select(content_class)
+                if main_content:
+                    content = main_content[0]
+                    break
+
+        headings = content.find_all('h2')
+
+        # Some pages use h3s for section titles...
+        if not headings:
+            headings = content.find_all('h3')
+
+        section_titles = []
+        for tag in headings:
+            # Sometimes we stick the title in as a link...
+            if tag.string is None:
+                tag = tag.find("a")
+            section_titles.append(tag.get_text() if tag else "")
+
+        section_pieces: List[List[Piece]] = [[] for _ in headings]
+        # Tags hash by their contents, so we look headings up by identity.
+        heading_index = {id(h): i for i, h in enumerate(headings)}
+        body: List[str] = []
+
+        self.walk(content, [], body, section_pieces, heading_index)
+
+        sections = [
+            (section_title, _join_section(pieces))
+            for section_title, pieces in zip(section_titles, section_pieces)
+        ]
+
+        return ParsedHtml(title=title, body="".join(body), sections=sections)
+
+    def walk(self, tag: element.Tag, outer: List[List[str]], body: List[str],
+             section_pieces: List[List[Piece]], heading_index: Dict[int, int]):
+        """
+        Collect the text inside `tag`.
+
+        `outer` holds the strings of the section pieces that `tag` belongs
+        to. Among the children of `tag`, a heading starts a section that
+        collects every following sibling until the next H2.
+        """
+        open_sections: List[int] = []
+
+        def add_pieces(is_element: bool) -> List[List[str]]:
+            pieces = []
+            for i in open_sections:
+                strings: List[str] = []
+                section_pieces[i].append((is_element, strings))
+                pieces.append(strings)
+            return pieces
+
+        for child in tag.children:
+            if isinstance(child, element.Tag):
+                if child.name == 'h2':
+                    open_sections = []
+                pieces = add_pieces(True)
+                self.walk(child, outer + pieces, body, section_pieces, heading_index)
+                if id(child) in heading_index:
+                    open_sections.append(heading_index[id(child)])
+                continue
+
+            # Sections used to be extracted by re-parsing the HTML of the
+            # siblings of their heading, which turned sibling comments
+            # into section text, so a sibling string of any type counts.
+            for strings in add_pieces(False):
+                strings.append(str(child))
+
+            # Like get_text(), we leave out comments, the contents of
+            # <script> and <style>, and so on.
+            if type(child) in TEXT_STRINGS:
+                body.append(child)
+                for strings in outer:
+                    strings.append(child)
+
+
+def _is_element(node) -> bool:
+    """lxml represents comments and processing instructions as elements, too."""
+    return isinstance(node.tag, str)
+
+
+def _lxml_string(elem) -> Optional[str]:
+    """Return an element's only string, like BeautifulSoup's Tag.string."""
+    children = list(elem)
+    if len(children) == 0:
+        return elem.text
+    if len(children) == 1 and not elem.text and not children[0].tail:
+        child = children[0]
+        return _lxml_string(child) if _is_element(child) else child.text
+    return None
+
+
+def _lxml_text(elem, preserve_whitespace: bool = False) -> Iterator[str]:
+    """Yield the strings of an element, like BeautifulSoup's get_text()."""
+    if not _is_element(elem) or elem.tag in NON_TEXT_TAGS:
+        return
+    inner_preserve = preserve_whitespace or elem.tag in PRESERVE_WHITESPACE_TAGS
+    if elem.text:
+        yield _collapse(elem.text, inner_preserve)
+    for child in elem:
+        yield from _lxml_text(child, inner_preserve)
+        if child.tail:
+            yield _collapse(child.tail, inner_preserve)
+
+
+class LxmlBackend(HtmlBackend):
+    """
+    Parse pages with lxml, which is much faster than html.parser.
+
+    We walk the tree of the page's content once, collecting the text of the
+    page and of every section as we go. A section collects the text of the
+    siblings that follow its heading, so when we walk into one of those
+    siblings, its text goes to the page and to every section it belongs to.
+    """
+    name = 'lxml'
+
+    def parse(self, html: Html, content_classes: Optional[Sequence[str]]) -> ParsedHtml:
+        root = self.parse_document(html)
+        content = root
+
+        if content_classes:
+            for content_class in content_classes:
+                main_content = root.cssselect(content_class)
+                if main_content:
+                    content = main_content[0]
+                    break
+
+        title_elem = next(root.iter('title'), None)
+        title = _lxml_string(title_elem) if title_elem is not None else None
+
+        headings = list(content.iterdescendants('h2'))
+        if not headings:
+            headings = list(content.iterdescendants('h3'))
+
+        section_titles = []
+        for heading in headings:
+            if _lxml_string(heading) is None:
+                link = next(heading.iterdescendants('a'), None)
+                section_titles.append("".join(_lxml_text(link)) if link is not None else "")
+            else:
+                section_titles.append("".join(_lxml_text(heading)))
+
+        section_pieces: List[List[Piece]] = [[] for _ in headings]
+        heading_index: Dict[etree._Element, int] = {h: i for i, h in enumerate(headings)}
+        body: List[str] = []
+
+        self.walk(content, [], body, section_pieces, heading_index, False)
+
+        sections = [
+            (section_title, _join_section(pieces))
+            for section_title, pieces in zip(section_titles, section_pieces)
+        ]
+
+        return ParsedHtml(title=title, body="".join(body), sections=sections)
+
+    def parse_document(self, html: Html):
+        if isinstance(html, bytes):
+            # Detect the encoding the same way BeautifulSoup does.
+            html = UnicodeDammit(html, is_html=True).unicode_markup
+        try:
+            return lxml.html.document_fromstring(html)
+        except ValueError:
+            # lxml refuses strings that declare an encoding.
+            return lxml.html.document_fromstring(html.encode('utf-8'))
+
+    def walk(self, elem, outer: List[List[str]], body: List[str],
+             section_pieces: List[List[Piece]],
+             heading_index: Dict[etree._Element, int],
+             preserve_whitespace: bool):
+        """
+        Collect the text inside `elem`.
+
+        `outer` holds the strings of the section pieces that `elem` belongs
+        to. Among the children of `elem`, a heading starts a section that
+        collects every following sibling until the next H2.
+        """
+        if elem.tag in NON_TEXT_TAGS:
+            return
+
+        preserve_whitespace = preserve_whitespace or elem.tag in PRESERVE_WHITESPACE_TAGS
+        open_sections: List[int] = []
+
+        def add_text(text: str, sections: List[List[str]]):
+            text = _collapse(text, preserve_whitespace)
+            body.append(text)
+            for strings in sections:
+                strings.append(text)
+
+        def add_pieces(is_element: bool) -> List[List[str]]:
+            pieces = []
+            for i in open_sections:
+                strings: List[str] = []
+                section_pieces[i].append((is_element, strings))
+                pieces.append(strings)
+            return pieces
+
+        if elem.text:
+            add_text(elem.text, outer)
+
+        for child in elem:
+            if _is_element(child):
+                if child.tag == 'h2':
+                    open_sections = []
+                pieces = add_pieces(True)
+                self.walk(child, outer + pieces, body, section_pieces,
+                          heading_index, preserve_whitespace)
+                if child in heading_index:
+                    open_sections.append(heading_index[child])
+            elif child.text:
+                # BeautifulSoup's html.parser backend treats the text of a
+                # comment that's a sibling of a heading as section text.
+                for strings in add_pieces(False):
+                    strings.append(child.text)
+
+            if child.tail:
+                add_text(child.tail, outer + add_pieces(False))
+
+
+HTML_BACKENDS: Dict[str, HtmlBackend] = {
+    backend.name: backend
+    for backend in (BeautifulSoupBackend(), LxmlBackend())
+}
+
+
+def get_html_backend(name: str) -> HtmlBackend:
+    try:
+        return HTML_BACKENDS[name]
+    except KeyError as e:
+        valid = ", ".join(HTML_BACKENDS)
+        raise ValueError(f"Unknown HTML parser {name}. Valid parsers: {valid}") from e
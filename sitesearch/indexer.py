@@ -3,36 +3,66 @@ import json
 import hashlib
 import logging
 import multiprocessing
+import re
+import sys
 import time
-from dataclasses import asdict
-from queue import Queue
-from threading import Thread
-from typing import Dict, List, Callable, Set
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, as_completed, wait
+from dataclasses import asdict, replace
+from queue import Empty, Queue
+from threading import Lock, Thread
+from typing import Dict, Iterable, Iterator, List, Callable, Optional, Pattern, Set, Tuple
 from redis import ResponseError
 
 import redis.exceptions
-from redisearch.query import Query
 import scrapy
-from bs4 import BeautifulSoup, element
 from redisearch import Client, IndexDefinition
 from scrapy import signals
 from scrapy.linkextractors import LinkExtractor
 from scrapy.crawler import CrawlerProcess
+from scrapy.http import XmlResponse
 from scrapy.signalmanager import dispatcher
+from scrapy.utils.gz import gunzip, gzip_magic_number
+from scrapy.utils.sitemap import Sitemap
+from twisted.internet import defer
 
 from sitesearch.keys import Keys
+from sitesearch.cluster_aware_rq import ClusterAwareQueue
 from sitesearch.config import AppConfiguration
-from sitesearch.connections import get_search_connection
+from sitesearch.connections import get_rq_redis_client, get_search_connection
 from sitesearch.errors import ParseError
-from sitesearch.models import SearchDocument, SiteConfiguration, TYPE_PAGE, TYPE_SECTION
-from sitesearch.query_parser import TokenEscaper
+from sitesearch.frontier import CrawlFrontier
+from sitesearch.html_parsers import get_html_backend
+from sitesearch.models import PageManifestEntry, SearchDocument, SiteConfiguration, TYPE_PAGE, TYPE_SECTION
+from sitesearch.query_parser import get_escaper
+from sitesearch.scorers import score_document
+from sitesearch.snapshot import SnapshotPage, SnapshotWriter, read_snapshot
+from sitesearch.transformer import unescape
 
 ROOT_PAGE = "Redis Labs Documentation"
-MAX_THREADS = multiprocessing.cpu_count() * 5
+# Each writer thread keeps one pipeline in flight, so a few threads are
+# enough to overlap network round trips with building the next batch.
+WRITER_THREADS = 4
 DEBOUNCE_SECONDS = 60 * 5  # Five minutes
 SYNUPDATE_COMMAND = 'FT.SYNUPDATE'
 TWO_HOURS = 60*60*2
 INDEXING_LOCK_TIMEOUT = 60*60*2
+INDEXING_TIMEOUT = 60*60  # One hour
+# Landing pages are what we want people to find first, so their
+# suggestions outrank every document, whose scores are at most 1.0.
+LANDING_PAGE_SUGGESTION_SCORE = 2.0
+SUGGESTION_FIELDS = ("title", "section_title", "hierarchy", "url", "__score")
+# The fields of a document that depend on its hierarchy.
+HIERARCHY_FIELDS = ("hierarchy", "display_hierarchy", "__score")
+
+# Delete the index lock only if it still holds our token. A forced job
+# takes the lock over, and the job it took the lock from mustn't release it.
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
 SECTION_ID = "{url}:section:{hash}"
 PAGE_ID = "{url}:page:{hash}"
 
@@ -76,12 +106,108 @@ class DebounceError(Exception):
     """The indexing debounce threshold was not met"""
 
 
-def next_element(elem):
-    """Get sibling elements until we exhaust them."""
-    while elem is not None:
-        elem = elem.next_sibling
-        if hasattr(elem, 'name'):
-            return elem
+def document_size(doc: SearchDocument) -> int:
+    """Roughly estimate the number of bytes a document adds to a write batch."""
+    return len(doc.body) + len(doc.title) + len(doc.section_title) + len(doc.url)
+
+
+def document_from_hash(fields: Dict[str, str]) -> SearchDocument:
+    """Rebuild a SearchDocument from the fields of its Hash."""
+    try:
+        hierarchy = json.loads(fields.get('hierarchy') or "[]")
+    except ValueError:
+        hierarchy = []
+    return SearchDocument(doc_id=fields['doc_id'],
+                          title=fields['title'],
+                          section_title=fields['section_title'],
+                          hierarchy=hierarchy,
+                          url=fields['url'],
+                          body=fields['body'],
+                          type=fields['type'],
+                          s=fields['s'],
+                          position=int(fields.get('position') or 0))
+
+
+def doc_id_digest(doc_id: str) -> int:
+    """Return a 64-bit digest of a document ID."""
+    return int.from_bytes(hashlib.blake2b(doc_id.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class DocIdSet:
+    """
+    A set of document IDs that only keeps a 64-bit digest of each ID.
+
+    A document ID is a page URL plus an MD5 hex digest, so it's often
+    more than 100 characters long, while a digest is a small int. We only
+    need to know whether we've seen an ID. A collision would, at worst,
+    keep one stale document in the index until the next run.
+    """
+    __slots__ = ('digests', )
+
+    def __init__(self, doc_ids: Iterable[str] = ()):
+        self.digests: Set[int] = set()
+        self.update(doc_ids)
+
+    def add(self, doc_id: str):
+        self.digests.add(doc_id_digest(doc_id))
+
+    def update(self, doc_ids: Iterable[str]):
+        self.digests.update(map(doc_id_digest, doc_ids))
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id_digest(doc_id) in self.digests
+
+    def __len__(self) -> int:
+        return len(self.digests)
+
+
+def object_bytes(*objects) -> int:
+    """
+    Estimate the memory that objects, and everything they refer to, use.
+
+    An object referred to more than once, like an interned string, only
+    counts once.
+    """
+    seen = set()
+    stack = list(objects)
+    total = 0
+
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, '__slots__'):
+            stack.extend(getattr(obj, name) for name in obj.__slots__ if hasattr(obj, name))
+
+    return total
+
+
+def page_url(url: str) -> str:
+    """Normalize a page URL the way we store it in documents and `seen_urls`."""
+    return url.split('?')[0].rstrip('/')
+
+
+def url_is_allowed(url: str, site_url: str, allow: List[Pattern], deny: List[Pattern]) -> bool:
+    """Check a URL against a site's allow and deny patterns."""
+    if not url.startswith(site_url):
+        return False
+    if allow and not any(p.search(url) for p in allow):
+        return False
+    return not any(p.search(url) for p in deny)
+
+
+def response_header(response, name: str) -> str:
+    """Get a response header as a string, or an empty string if it's missing."""
+    value = response.headers.get(name)
+    return value.decode('latin-1') if value else ""
 
 
 def get_section(root_url: str, url: str) -> str:
@@ -109,7 +235,8 @@ class DocumentParser:
         self.root_url = site_config.url
         self.validators = site_config.validators
         self.content_classes = site_config.content_classes
-        self.escaper = TokenEscaper(site_config.literal_terms)
+        self.escaper = get_escaper(site_config.literal_terms)
+        self.html_backend = get_html_backend(site_config.html_parser)
 
     def prepare_text(self, text: str, strip_symbols: bool = False) -> str:
         base = text.strip().strip("\n").replace("\n", " ")
@@ -117,36 +244,20 @@ class DocumentParser:
             base = base.replace("#", " ")
         return self.escaper.escape(base)
 
-    def extract_parts(self, doc,
-                      h2s: List[element.Tag]) -> List[SearchDocument]:
+    def extract_parts(self, doc: SearchDocument,
+                      sections: List[Tuple[str, str]]) -> List[SearchDocument]:
         """
-        Extract SearchDocuments from H2 elements in a SearchDocument.
+        Extract SearchDocuments from the sections of a page.
 
-        Given a list of H2 elements in a page, we extract the HTML content for
-        that "part" of the page by grabbing all of the sibling elements and
-        converting them to text.
+        The HTML backend gives us the raw title and text of every section
+        (everything from one H2 up to the next); we clean them up and build
+        one SearchDocument per section.
         """
         docs = []
 
-        for i, tag in enumerate(h2s):
-            origin = tag
-
-            # Sometimes we stick the title in as a link...
-            if tag and tag.string is None:
-                tag = tag.find("a")
-
-            part_title = tag.get_text() if tag else ""
-
-            page = []
-            elem = next_element(origin)
-
-            while elem and elem.name != 'h2':
-                page.append(str(elem))
-                elem = next_element(elem)
-
+        for i, (part_title, body) in enumerate(sections):
             part_title = self.prepare_text(part_title)
-            body = self.prepare_text(
-                BeautifulSoup('\n'.join(page), 'html.parser').get_text())
+            body = self.prepare_text(body)
 
             doc_id = section_id(doc.url, i, body, doc.title, part_title)
 
@@ -172,32 +283,16 @@ class DocumentParser:
         that we index with the entire content of the page.
         """
         docs = []
-        soup = BeautifulSoup(html, 'html.parser')
-        content = soup
+        page = self.html_backend.parse(html, self.content_classes)
         safe_url = url.split('?')[0].rstrip('/')
 
-        try:
-            title = self.prepare_text(soup.title.string.split("|")[0], True)
-        except AttributeError as e:
-            raise ParseError("Failed -- missing title") from e
-
-        # Use the first content class we find on the page. (i.e., main
-        # page content).
-        if self.content_classes:
-            for content_class in self.content_classes:
-                main_content = soup.select(content_class)
-                if main_content:
-                    content = main_content[0]
-                    break
-
-        s = get_section(self.root_url, url)
-        h2s = content.find_all('h2')
-
-        # Some pages use h3s for section titles...
-        if not h2s:
-            h2s = content.find_all('h3')
+        if page.title is None:
+            raise ParseError("Failed -- missing title")
+        title = self.prepare_text(page.title.split("|")[0], True)
 
-        body = self.prepare_text(content.get_text(), True)
+        # Every page in a section of the site shares the same string.
+        s = sys.intern(get_section(self.root_url, url))
+        body = self.prepare_text(page.body, True)
         doc_id = page_id(safe_url, body, title)
 
         doc = SearchDocument(doc_id=doc_id,
@@ -214,8 +309,8 @@ class DocumentParser:
 
         # If there are headers, break up the document and index each header
         # as a separate document.
-        if h2s:
-            docs += self.extract_parts(doc, h2s)
+        if page.sections:
+            docs += self.extract_parts(doc, page.sections)
 
         return docs
 
@@ -232,6 +327,52 @@ class DocumentParser:
             v(doc)
 
 
+# The DocumentParser used by a parser process. See start_parser_pool().
+_process_doc_parser: Optional[DocumentParser] = None
+
+
+def _init_parser_process(site_config: SiteConfiguration, doc_parser_class):
+    global _process_doc_parser
+    _process_doc_parser = doc_parser_class(site_config)
+
+
+def parse_page(url: str, html: bytes) -> List[SearchDocument]:
+    """Parse a page in a parser process."""
+    return _process_doc_parser.parse(url, html)
+
+
+def start_parser_pool(site_config: SiteConfiguration, workers: int,
+                      doc_parser_class=DocumentParser) -> ProcessPoolExecutor:
+    """
+    Start a pool of processes that parse pages for a site.
+
+    Parsing HTML is CPU-bound, so parsing on the reactor thread limits a
+    crawl to one core. We use the "spawn" start method because forking a
+    process that runs Twisted and our writer threads isn't safe.
+    """
+    return ProcessPoolExecutor(max_workers=workers,
+                               mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_parser_process,
+                               initargs=(site_config, doc_parser_class))
+
+
+def deferred_from_future(future: Future) -> defer.Deferred:
+    """Wrap a concurrent.futures Future in a Deferred that fires on the reactor."""
+    from twisted.internet import reactor
+    d = defer.Deferred()
+
+    def done(f: Future):
+        try:
+            result = f.result()
+        except Exception as e:
+            reactor.callFromThread(d.errback, e)
+        else:
+            reactor.callFromThread(d.callback, result)
+
+    future.add_done_callback(done)
+    return d
+
+
 class DocumentationSpiderBase(scrapy.Spider):
     """
     A base class for spiders. Each base class should define the `url`
@@ -251,45 +392,246 @@ class DocumentationSpiderBase(scrapy.Spider):
     scraper will send them in as arguments to LinkExtractor when
     extracting links on a page, allowing fine-grained control of URL
     patterns to exclude or allow.
+
+    If `site_config.sitemap_url` is defined, the spider doesn't follow
+    links. Instead, it requests every page listed in the sitemap (and in
+    any sitemaps nested in a sitemap index) that `allow` and `deny` let
+    through, all at once.
+
+    If `parse_pool` is set, the spider parses pages in that process pool
+    instead of on the reactor thread.
+
+    Along with the SearchDocuments for a page, the spider yields a
+    PageManifestEntry. If `manifest` holds an entry from a past crawl, the
+    spider makes a conditional request for the page, and if the page has
+    not changed, yields the old entry with `changed` set to False instead
+    of parsing the page again. In sitemap mode, a page whose sitemap
+    `lastmod` matches the manifest entry isn't requested at all.
+
+    If `snapshot` is set, the spider records every page it fetches to it.
+
+    If `frontier` is set, the spider is one of several workers crawling
+    the site together, and FrontierScheduler shares its page requests with
+    the others. Only the `coordinator` requests the sitemap, and the start
+    URL is already in the frontier.
     """
     name: str = "documentation"
     doc_parser_class = DocumentParser
 
+    # We send conditional requests, so the server may tell us a page
+    # hasn't changed since we last crawled it.
+    handle_httpstatus_list = [304]
+
     # Sub-classes should override these fields.
     url: str = None
     site_config: SiteConfiguration
 
+    # Pages we crawled during the last indexing run, keyed by URL. If this
+    # is empty, we crawl and parse every page.
+    manifest: Dict[str, PageManifestEntry] = {}
+
+    # If set, we parse pages in these worker processes (see
+    # start_parser_pool()) instead of on the reactor thread.
+    parse_pool: Optional[ProcessPoolExecutor] = None
+    max_pending_parses: int = 0
+
+    # If set, we record every page we fetch to this snapshot.
+    snapshot: Optional[SnapshotWriter] = None
+
+    # If set, we share page requests with other workers through this
+    # frontier. See sitesearch/frontier.py.
+    frontier: Optional[CrawlFrontier] = None
+    coordinator: bool = True
+
     def __init__(self, *args, **kwargs):
         self.url = self.site_config.url
         self.doc_parser = self.doc_parser_class(self.site_config)
+        if self.parse_pool is not None:
+            self.parse_slots = defer.DeferredSemaphore(self.max_pending_parses)
         super().__init__(*args, **kwargs)
         self.extractor = LinkExtractor(allow=self.site_config.allow,
                                        deny=self.site_config.deny)
+        self.allow = [re.compile(pattern) for pattern in self.site_config.allow]
+        self.deny = [re.compile(pattern) for pattern in self.site_config.deny]
+
+    @property
+    def sitemap_mode(self) -> bool:
+        return bool(self.site_config.sitemap_url)
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """Build conditional request headers from a page's manifest entry."""
+        headers = {}
+        entry = self.manifest.get(url)
+        if entry:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def page_request(self, url: str, lastmod: str = "", **kwargs) -> scrapy.Request:
+        """Request a page, conditionally if it's in the manifest."""
+        return scrapy.Request(url,
+                              callback=self.parse,
+                              headers=self.conditional_headers(url),
+                              cb_kwargs={'lastmod': lastmod} if lastmod else {},
+                              **kwargs)
+
+    def start_requests(self):
+        if self.frontier is not None and not (self.coordinator and self.sitemap_mode):
+            return
+
+        if self.sitemap_mode:
+            yield scrapy.Request(self.site_config.sitemap_url,
+                                 callback=self.parse_sitemap,
+                                 dont_filter=True)
+            return
+
+        for url in self.start_urls:
+            yield scrapy.Request(url,
+                                 callback=self.parse,
+                                 headers=self.conditional_headers(url),
+                                 dont_filter=True)
+
+    def is_allowed(self, url: str) -> bool:
+        """Check a URL against the site's allow and deny patterns."""
+        return url_is_allowed(url, self.url, self.allow, self.deny)
+
+    def sitemap_body(self, response) -> Optional[bytes]:
+        """Get the XML of a sitemap, which may be gzipped."""
+        if gzip_magic_number(response):
+            return gunzip(response.body)
+        if isinstance(response, XmlResponse) \
+                or response.url.endswith(('.xml', '.xml.gz')):
+            return response.body
+        return None
+
+    def parse_sitemap(self, response):
+        """
+        Request the pages in a sitemap, or the sitemaps in a sitemap index.
+
+        A page whose `lastmod` is the same as the last time we indexed it
+        hasn't changed, so we reuse its manifest entry without requesting it.
+        """
+        body = self.sitemap_body(response)
+        if body is None:
+            log.error("Not a sitemap: %s", response.url)
+            return
 
-    def follow_links(self, response):
+        sitemap = Sitemap(body)
+
+        if sitemap.type == 'sitemapindex':
+            for nested in sitemap:
+                yield scrapy.Request(nested['loc'], callback=self.parse_sitemap)
+            return
+
+        for page in sitemap:
+            url = page['loc']
+            if not self.is_allowed(url):
+                continue
+
+            lastmod = page.get('lastmod', "")
+            entry = self.manifest.get(url)
+            if entry and lastmod and entry.lastmod == lastmod:
+                yield replace(entry, changed=False)
+                continue
+
+            yield self.page_request(url, lastmod)
+
+    def extract_links(self, response) -> List[str]:
+        if self.sitemap_mode:
+            return []
         try:
-            links = [
-                l for l in self.extractor.extract_links(response)
+            return [
+                l.url for l in self.extractor.extract_links(response)
                 if l.url.startswith(self.url)
             ]
         except AttributeError:  # Usually means this page isn't text -- could be a a PDF, etc.
-            links = []
-        yield from response.follow_all(links, callback=self.parse)
+            return []
 
-    def parse(self, response, **kwargs):
-        docs_for_page = []
-        if not response.url.startswith(self.url):
+    def follow_links(self, response, links: Iterable[str]):
+        if self.sitemap_mode:
             return
+        for url in links:
+            yield response.follow(url,
+                                  callback=self.parse,
+                                  headers=self.conditional_headers(url))
+
+    def parse(self, response, lastmod: str = "", **kwargs):
+        if not response.url.startswith(self.url):
+            return []
+
+        if self.snapshot is not None and response.status == 200:
+            self.snapshot.write(response.url, dict(response.headers.to_unicode_dict()),
+                                response.body)
+
+        entry = self.manifest.get(response.url)
+        content_hash = hashlib.md5(response.body).hexdigest()
+
+        # The page hasn't changed since the last crawl, so its documents are
+        # already in the index and its links are the same as last time.
+        if entry and (response.status == 304
+                      or entry.content_hash == content_hash):
+            return [
+                replace(entry, changed=False, lastmod=lastmod),
+                *self.follow_links(response, entry.links)
+            ]
+
+        if response.status == 304:
+            log.error("Not modified, but missing from the manifest: %s",
+                      response.url)
+            return []
+
+        if self.parse_pool is not None:
+            return self.parse_in_pool(response, content_hash, lastmod)
 
         try:
             docs_for_page = self.doc_parser.parse(response.url, response.body)
         except ParseError as e:
             log.error("Document parser error -- %s: %s", e, response.url)
-        else:
-            for doc in docs_for_page:
-                yield doc
+            docs_for_page = []
 
-        yield from self.follow_links(response)
+        return self.page_output(response, content_hash, docs_for_page, lastmod)
+
+    async def parse_in_pool(self, response, content_hash: str, lastmod: str):
+        """
+        Parse a page in the parser process pool.
+
+        We only let `max_pending_parses` pages wait on the pool at once.
+        Responses beyond that wait here, which holds up Scrapy's scraper
+        and, in turn, new downloads.
+        """
+        await self.parse_slots.acquire()
+        try:
+            future = self.parse_pool.submit(parse_page, response.url,
+                                            response.body)
+            docs_for_page = await deferred_from_future(future)
+        except ParseError as e:
+            log.error("Document parser error -- %s: %s", e, response.url)
+            docs_for_page = []
+        finally:
+            self.parse_slots.release()
+
+        return self.page_output(response, content_hash, docs_for_page, lastmod)
+
+    def page_output(self, response, content_hash: str,
+                    docs_for_page: List[SearchDocument],
+                    lastmod: str = "") -> list:
+        """Build the items and requests that a newly parsed page produces."""
+        # Most pages link to the same navigation pages, and we keep every
+        # page's links in the manifest, so we only keep one copy of each.
+        links = [sys.intern(link) for link in self.extract_links(response)]
+        entry = PageManifestEntry(
+            url=response.url,
+            title=docs_for_page[0].title if docs_for_page else "",
+            etag=response_header(response, 'ETag'),
+            last_modified=response_header(response, 'Last-Modified'),
+            content_hash=content_hash,
+            doc_ids=tuple(doc.doc_id for doc in docs_for_page),
+            links=tuple(links),
+            lastmod=lastmod)
+
+        return [*docs_for_page, entry, *self.follow_links(response, links)]
 
     @property
     def start_urls(self):
@@ -314,16 +656,27 @@ class Indexer:
 
     Whenever we try to search the index, we'll refer to the alias --
     not the actual index name.
+
+    If `index_name` is given, we write to that index instead, which is
+    how the helpers of a distributed crawl write to the coordinator's
+    new index (see join_crawl()).
     """
     def __init__(self,
                  site: SiteConfiguration,
                  app_config: AppConfiguration,
-                 search_client: Client = None):
+                 search_client: Client = None,
+                 index_name: Optional[str] = None):
         self.site = site
         self.keys = Keys(app_config.key_prefix)
         self.index_alias = self.keys.index_alias(self.site.url)
-        self.index_name = f"{self.index_alias}-{time.time()}"
-        self.escaper = TokenEscaper(site.literal_terms)
+        self.index_name = index_name or f"{self.index_alias}-{time.time()}"
+        self.escaper = get_escaper(site.literal_terms)
+        self.batch_size = app_config.index_batch_size
+        self.batch_bytes = app_config.index_batch_bytes
+        self.parse_workers = app_config.parse_workers
+        self.stream_indexing = app_config.stream_indexing
+        self.queue_size = app_config.index_queue_size
+        self.crawl_workers = app_config.crawl_workers
 
         if search_client is None:
             search_client = get_search_connection(self.index_name)
@@ -331,6 +684,8 @@ class Indexer:
         self.search_client = search_client
         self.redis = self.search_client.redis
         self.lock = self.keys.index_lock(site.url)
+        self.lock_token: Optional[str] = None
+        self.release_lock_script = self.redis.register_script(RELEASE_LOCK_SCRIPT)
         index_exists = self.search_index_exists()
 
         if not index_exists:
@@ -342,8 +697,23 @@ class Indexer:
         self.seen_urls: Dict[str, str] = {}
 
         # This is the set of all known document IDs. We'll use this to remove
-        # outdated documents from the index.
-        self.seen_ids: Set[str] = set()
+        # outdated documents from the index. The IDs themselves are in the
+        # manifest (see seen_doc_ids()).
+        self.seen_ids = DocIdSet()
+
+        # The page manifest from the last indexing run, and the one we're
+        # building during this run.
+        self.manifest: Dict[str, PageManifestEntry] = {}
+        self.new_manifest: Dict[str, PageManifestEntry] = {}
+
+        # When we write documents during the crawl, this maps the URL of
+        # every page we wrote documents for to the hierarchy we wrote, or
+        # to None if we wrote its documents with different hierarchies.
+        self.written_hierarchies: Dict[str, Optional[List[str]]] = {}
+        self.written_hierarchies_lock = Lock()
+
+        # The frontier we share with other workers, in a distributed crawl.
+        self.frontier: Optional[CrawlFrontier] = None
 
     @property
     def url(self):
@@ -360,13 +730,18 @@ class Indexer:
         At query time, RediSearch will multiply the ad-hoc score by the TF*IDF
         score of a document to produce the final score.
         """
-        score = 1.0
-        for scorer in self.site.scorers:
-            score = scorer(document, score)
+        hierarchy = self.build_hierarchy(document)
+        if self.stream_indexing:
+            self.record_hierarchy(document.url, hierarchy)
+
+        # Scorers like boost_top_level_pages look at the hierarchy.
+        score = score_document(replace(document, hierarchy=hierarchy), self.site.scorers)
         doc = asdict(document)
         doc['__score'] = score
-        hierarchy = self.build_hierarchy(document)
         doc['hierarchy'] = json.dumps(hierarchy)
+        # The hierarchy as we serve it, so searches don't have to decode and
+        # unescape it for every result.
+        doc['display_hierarchy'] = json.dumps([unescape(h) for h in hierarchy])
         return doc
 
     def index_document(self, doc: SearchDocument):
@@ -386,6 +761,186 @@ class Indexer:
 
         new_urls_key = self.keys.site_urls_new(self.index_alias)
         self.redis.sadd(new_urls_key, doc.url)
+        self.redis.sadd(self.keys.doc_ids_new(self.url), doc.doc_id)
+
+    def index_documents(self, docs: List[SearchDocument]):
+        """
+        Add a batch of documents to the search index.
+
+        The batch goes to Redis as one non-transactional pipeline, so the
+        whole batch costs a single round trip. Errors are still reported
+        per document.
+
+        We add each document's ID to this run's set of document IDs along
+        with its Hash, so if the run never finishes, the next one still
+        knows to delete the documents it wrote (see recover_doc_ids()).
+
+        When we write documents during the crawl, searches see them while
+        their hierarchies may still be incomplete. A document ID hashes the
+        document's content, so a document that's already in the index is
+        the one we'd write -- we leave it, with its complete hierarchy, and
+        fix_hierarchies() rewrites it if the hierarchy changed.
+        """
+        new_urls_key = self.keys.site_urls_new(self.index_alias)
+        doc_ids_key = self.keys.doc_ids_new(self.url)
+        if self.stream_indexing:
+            docs = self.skip_indexed_documents(docs)
+            if not docs:
+                return
+
+        pipeline = self.redis.pipeline(transaction=False)
+
+        for doc in docs:
+            key = self.keys.document(self.site.url, doc.doc_id)
+            pipeline.hset(key, mapping=self.document_to_dict(doc))
+            pipeline.sadd(new_urls_key, doc.url)
+            pipeline.sadd(doc_ids_key, doc.doc_id)
+
+        try:
+            results = pipeline.execute(raise_on_error=False)
+        except redis.exceptions.DataError as e:
+            # Bad data in any document fails the whole pipeline, so retry
+            # the batch one document at a time to find the culprit.
+            log.error("Batch write failed -- bad data: %s, retrying %d documents",
+                      e, len(docs))
+            for doc in docs:
+                self.index_document(doc)
+            return
+
+        # Every document produced an HSET and two SADDs, in that order.
+        for doc, result in zip(docs, results[::3]):
+            if isinstance(result, redis.exceptions.ResponseError):
+                log.error("Failed -- response error: %s, %s", result, doc.url)
+
+    def skip_indexed_documents(self, docs: List[SearchDocument]) -> List[SearchDocument]:
+        """
+        Return the documents in a batch that aren't in the index yet.
+
+        For the others, we record the hierarchy they have in the index, so
+        fix_hierarchies() rewrites them if it changed. A document without
+        a "display_hierarchy" was written before we stored it, so it's
+        always rewritten.
+        """
+        pipeline = self.redis.pipeline(transaction=False)
+        for doc in docs:
+            pipeline.hmget(self.keys.document(self.site.url, doc.doc_id),
+                           "hierarchy", "display_hierarchy")
+
+        new_docs = []
+        indexed_urls = set()
+        indexed_ids = []
+        for doc, (hierarchy, display_hierarchy) in zip(docs, pipeline.execute()):
+            if hierarchy is None:
+                new_docs.append(doc)
+                continue
+            indexed_urls.add(doc.url)
+            indexed_ids.append(doc.doc_id)
+            if display_hierarchy is None:
+                self.record_hierarchy(doc.url, None)
+            else:
+                self.record_hierarchy(doc.url, json.loads(hierarchy))
+
+        if indexed_urls:
+            pipeline = self.redis.pipeline(transaction=False)
+            pipeline.sadd(self.keys.site_urls_new(self.index_alias), *indexed_urls)
+            pipeline.sadd(self.keys.doc_ids_new(self.url), *indexed_ids)
+            pipeline.execute()
+        return new_docs
+
+    def write_documents(self, docs_to_process: Queue,
+                        written: Optional[Callable[[int], None]] = None):
+        """
+        Take documents off a queue and index them in batches.
+
+        A batch is flushed when it reaches the configured document count or
+        size, or when the queue runs dry. After each batch, we call
+        `written`, if given, with the number of documents in it. This
+        method never returns, so run it in a daemon thread.
+        """
+        while True:
+            batch = [docs_to_process.get()]
+            batch_bytes = document_size(batch[0])
+
+            while len(batch) < self.batch_size and batch_bytes < self.batch_bytes:
+                try:
+                    doc = docs_to_process.get_nowait()
+                except Empty:
+                    break
+                batch.append(doc)
+                batch_bytes += document_size(doc)
+
+            try:
+                self.index_documents(batch)
+            except Exception as e:
+                log.error("Unexpected error while indexing %d docs, error: %s",
+                          len(batch), e)
+
+            if written is not None:
+                written(len(batch))
+            for _ in batch:
+                docs_to_process.task_done()
+
+    def record_hierarchy(self, url: str, hierarchy: Optional[List[str]]):
+        """
+        Remember the hierarchy we wrote for a document from a page.
+
+        A hierarchy of None means the page's documents must be rewritten.
+        """
+        url = page_url(url)
+        with self.written_hierarchies_lock:
+            written = self.written_hierarchies.get(url, hierarchy)
+            self.written_hierarchies[url] = hierarchy if written == hierarchy else None
+
+    def fix_hierarchies(self):
+        """
+        Update documents whose hierarchy changed after we wrote them.
+
+        When we write documents during the crawl, we build each one's
+        hierarchy from the pages we've seen so far, so a document crawled
+        before a page above it gets an incomplete hierarchy. Once the crawl
+        is done, we build every hierarchy again and rewrite the fields that
+        depend on it -- only for the documents whose hierarchy changed.
+
+        Unchanged pages keep the documents an earlier run wrote, with the
+        hierarchy in their manifest entries, which goes stale when the
+        title of a page above them changes. Entries that don't record a
+        hierarchy come from runs that might not have stored the
+        "display_hierarchy" that searches return, so we rewrite those too.
+
+        Rescoring a document runs the site's scorers, which may look at any
+        field, so we read the stale documents back from their Hashes.
+        """
+        stale_urls = {
+            url for url, hierarchy in self.written_hierarchies.items()
+            if hierarchy is None or self.url_hierarchy(url) != hierarchy
+        }
+        for entry in self.new_manifest.values():
+            url = page_url(entry.url)
+            if entry.changed or not entry.doc_ids or url in self.written_hierarchies:
+                continue
+            if entry.hierarchy is None or self.url_hierarchy(url) != list(entry.hierarchy):
+                stale_urls.add(url)
+        stale = list(self.seen_doc_ids(stale_urls))
+        log.info("Fixing the hierarchies of %d documents", len(stale))
+
+        for i in range(0, len(stale), self.batch_size):
+            keys = [self.keys.document(self.url, doc_id)
+                    for doc_id in stale[i:i + self.batch_size]]
+            pipeline = self.redis.pipeline(transaction=False)
+            for key in keys:
+                pipeline.hgetall(key)
+
+            hashes = pipeline.execute()
+
+            pipeline = self.redis.pipeline(transaction=False)
+            for key, fields in zip(keys, hashes):
+                if not fields:  # Deleted since we wrote it.
+                    continue
+                doc = self.document_to_dict(document_from_hash(fields))
+                pipeline.hset(key, mapping={f: doc[f] for f in HIERARCHY_FIELDS})
+            pipeline.execute()
+
+        self.written_hierarchies = {}
 
     def add_synonyms(self):
         for synonym_group in self.site.synonym_groups:
@@ -416,6 +971,18 @@ class Indexer:
         if self.site.synonym_groups:
             self.add_synonyms()
 
+    def take_lock(self):
+        """Take the site's index lock, with a token that only we know."""
+        self.lock_token = uuid.uuid4().hex
+        self.redis.set(self.lock, self.lock_token, ex=INDEXING_LOCK_TIMEOUT)
+
+    def release_lock(self):
+        """Release the site's index lock, unless another job has taken it."""
+        if self.lock_token is None:
+            return
+        self.release_lock_script(keys=[self.lock], args=[self.lock_token])
+        self.lock_token = None
+
     def debounce(self):
         last_index = self.redis.get(self.keys.last_index(self.site.url))
         if last_index:
@@ -434,47 +1001,188 @@ class Indexer:
         for idx in old_indexes:
             self.redis.execute_command('FT.DROPINDEX', idx)
 
+    def seen_doc_ids(self, urls: Optional[Set[str]] = None) -> Iterator[str]:
+        """
+        Yield the IDs of the documents we saw in this run.
+
+        `seen_ids` only keeps digests, so we get the IDs from the manifest
+        we built in this run, which lists the documents of every page. If
+        `urls` is given, we only yield the IDs of documents from those pages.
+        """
+        root_url = page_url(self.site.url)
+        for entry in self.new_manifest.values():
+            url = page_url(entry.url)
+            if url != root_url and (urls is None or url in urls):
+                yield from entry.doc_ids
+
+    def recover_doc_ids(self):
+        """
+        Prepare this run's set of document IDs.
+
+        A run that didn't finish leaves the IDs of the documents it wrote
+        in the set. If any of them aren't in this run, they're stale, so
+        we add them to the previous run's set before starting a new one.
+        Without a previous set, stale_doc_ids() scans for them anyway.
+        """
+        current_key = self.keys.doc_ids_current(self.url)
+        new_key = self.keys.doc_ids_new(self.url)
+
+        if self.redis.exists(new_key) and self.redis.exists(current_key):
+            total = self.redis.sunionstore(current_key, [current_key, new_key])
+            log.info("Recovered the document IDs of an unfinished run (%d in all)", total)
+        self.redis.delete(new_key)
+
+    def save_doc_ids(self):
+        """
+        Add the IDs of the documents seen in this run to this run's set.
+
+        We added the IDs of the documents we wrote as we wrote them, but
+        unchanged pages keep their documents, and in a distributed crawl,
+        other workers wrote some of them.
+        """
+        new_key = self.keys.doc_ids_new(self.url)
+
+        doc_ids = list(self.seen_doc_ids())
+        for i in range(0, len(doc_ids), self.batch_size):
+            self.redis.sadd(new_key, *doc_ids[i:i + self.batch_size])
+
+    def stale_doc_ids(self) -> Iterator[str]:
+        """
+        Yield the IDs of documents that we indexed before but didn't see
+        in this run.
+
+        The previous run left the IDs it saw in a set, so the stale IDs are
+        the difference between that set and this run's. Before there was a
+        previous set, we scan the site's Hashes instead.
+        """
+        current_key = self.keys.doc_ids_current(self.url)
+        new_key = self.keys.doc_ids_new(self.url)
+        stale_key = self.keys.doc_ids_stale(self.url)
+
+        if self.redis.exists(current_key):
+            total = self.redis.sdiffstore(stale_key, [current_key, new_key])
+            log.info("Found %d stale documents", total)
+            yield from self.redis.sscan_iter(stale_key, count=self.batch_size)
+            self.redis.delete(stale_key)
+            return
+
+        log.info("No document IDs saved for %s, scanning for stale documents",
+                 self.url)
+        prefix = self.keys.document(self.url, "")
+        for key in self.redis.scan_iter(match=f"{prefix}*", count=self.batch_size):
+            doc_id = key[len(prefix):]
+            if doc_id not in self.seen_ids:
+                yield doc_id
+
     def clear_old_hashes(self):
         """
         Delete any stale Hashes from the index.
 
-        Stale Hashes are those whose document IDs exist in the search index but
-        not in the latest set of seen IDs after scraping a site.
+        Stale Hashes are those whose document IDs we indexed in the past but
+        didn't see after scraping a site this time.
 
         Every document ID includes both the URL of the page it came from and a
         hash of the page's or section's content. When the content of a page or
         section we're tracking in the index changes on the site, we'll get a new
         document ID. Because the ID will differ from the one we've already seen,
         the old document will show up as stale, and we can delete it.
+
+        We delete stale Hashes in batches with UNLINK, so that Redis frees
+        their memory in the background and no single command blocks it for
+        long while replicas are serving searches.
         """
-        all_hash_ids = set()
-        offset = 0
-        iter_by = 200
+        if not self.seen_ids:
+            log.error("Not clearing old hashes: no documents seen for %s", self.url)
+            return
 
-        # Get the set of all Hash IDs that this index knows about.
-        while True:
-            q = Query("*").paging(offset, iter_by).return_fields("doc_id")
-            existing_docs = self.search_client.search(q).docs
-            if not existing_docs: # No more documents
-                break
-            all_hash_ids |= {getattr(d, 'doc_id', None) for d in existing_docs}
-            offset += iter_by
+        self.save_doc_ids()
+
+        deleted = 0
+        batch = []
 
-        stale_ids = all_hash_ids - self.seen_ids
-        stale_ids.discard(None)
+        for doc_id in self.stale_doc_ids():
+            batch.append(self.keys.document(self.url, doc_id))
+            if len(batch) >= self.batch_size:
+                deleted += self.redis.unlink(*batch)
+                batch = []
+                log.info("Deleted %d stale documents so far", deleted)
+        if batch:
+            deleted += self.redis.unlink(*batch)
 
-        log.warning("Deleting stale IDs: %s", stale_ids)
+        log.info("Deleted %d stale documents", deleted)
+
+        self.redis.rename(self.keys.doc_ids_new(self.url),
+                          self.keys.doc_ids_current(self.url))
+
+    def build_suggestions(self):
+        """
+        Build the site's autocomplete suggestion dictionary.
+
+        Suggestions are the titles, section titles and hierarchy entries of
+        every document we saw in this run, plus the site's landing pages.
+        We read the documents back from their Hashes, so pages that didn't
+        change since the last run contribute suggestions too. A suggestion
+        takes the highest score of the documents it came from, and carries
+        the URL of that document as its payload.
+        """
+        suggestions: Dict[str, Tuple[float, str]] = {}
 
-        # Remove the stale Hashes.
-        if stale_ids:
-            keys = [self.keys.document(self.url, id) for id in stale_ids]
-            self.redis.delete(*keys)
+        def add(text: str, score: float, url: str):
+            text = unescape(text).strip()
+            if not text:
+                return
+            current = suggestions.get(text)
+            if current is None or score > current[0]:
+                suggestions[text] = (score, url or (current[1] if current else ""))
+
+        doc_ids = list(set(self.seen_doc_ids()))
+        for i in range(0, len(doc_ids), self.batch_size):
+            pipeline = self.redis.pipeline(transaction=False)
+            for doc_id in doc_ids[i:i + self.batch_size]:
+                pipeline.hmget(self.keys.document(self.url, doc_id), SUGGESTION_FIELDS)
+
+            for title, section_title, hierarchy, url, score in pipeline.execute():
+                if title is None:
+                    continue
+                score = float(score or 1.0)
+                add(title, score, url)
+                if section_title:
+                    add(section_title, score, url)
+                try:
+                    parents = json.loads(hierarchy or "[]")
+                except ValueError:
+                    parents = []
+                for parent in parents:
+                    add(parent, score, "")
+
+        for query in self.site.landing_pages:
+            page = self.site.landing_page(query)
+            add(query, LANDING_PAGE_SUGGESTION_SCORE, page.url)
+            add(page.title, LANDING_PAGE_SUGGESTION_SCORE, page.url)
+
+        new_key = self.keys.suggestions_new(self.url)
+        self.redis.delete(new_key)
+
+        entries = list(suggestions.items())
+        for i in range(0, len(entries), self.batch_size):
+            pipeline = self.redis.pipeline(transaction=False)
+            for text, (score, url) in entries[i:i + self.batch_size]:
+                args = ["FT.SUGADD", new_key, text, score]
+                if url:
+                    args += ["PAYLOAD", url]
+                pipeline.execute_command(*args)
+            pipeline.execute()
+
+        log.info("Built %d suggestions for %s", len(entries), self.url)
 
     def create_index_alias(self):
         """
         Switch the current alias to point to the new index and delete old indexes.
 
         If the alias doesn't exist yet, this method will create it.
+
+        The suggestion dictionary built for the new index replaces the old
+        one right after the alias moves.
         """
         try:
             self.search_client.aliasupdate(self.index_alias)
@@ -483,15 +1191,106 @@ class Indexer:
                       self.index_alias, self.index_name)
             self.search_client.aliasadd(self.index_alias)
 
+        new_suggestions = self.keys.suggestions_new(self.url)
+        if self.redis.exists(new_suggestions):
+            self.redis.rename(new_suggestions, self.keys.suggestions(self.url))
+
+        # Let the search API know that cached results are now stale. Cache
+        # keys include the generation, so the old entries can't be read
+        # anymore, and they expire on their own.
+        self.redis.incr(self.keys.index_generation(self.url))
+
         self.clear_old_indexes()
 
+    def load_manifest(self, key: Optional[str] = None) -> Dict[str, PageManifestEntry]:
+        """Load the page manifest saved by the last indexing run, or the one at `key`."""
+        manifest = {}
+        raw_manifest = self.redis.hgetall(key or self.keys.page_manifest(self.url))
+
+        for url, raw_entry in raw_manifest.items():
+            try:
+                entry = PageManifestEntry(**json.loads(raw_entry))
+            except (TypeError, ValueError) as e:
+                log.error("Bad page manifest entry for %s: %s", url, e)
+                continue
+            # JSON gives us lists, and most pages share most of their links.
+            manifest[url] = replace(entry,
+                                    doc_ids=tuple(entry.doc_ids),
+                                    links=tuple(sys.intern(link) for link in entry.links),
+                                    hierarchy=None if entry.hierarchy is None
+                                    else tuple(entry.hierarchy))
+
+        return manifest
+
+    def save_manifest(self):
+        """Replace the saved page manifest with the pages crawled in this run."""
+        if not self.new_manifest:
+            return
+
+        new_key = self.keys.page_manifest_new(self.url)
+        self.redis.delete(new_key)
+
+        # Every document has its final hierarchy by now (see fix_hierarchies()).
+        entries = [replace(entry, hierarchy=tuple(self.url_hierarchy(page_url(entry.url))))
+                   for entry in self.new_manifest.values()]
+        for i in range(0, len(entries), self.batch_size):
+            pipeline = self.redis.pipeline(transaction=False)
+            for entry in entries[i:i + self.batch_size]:
+                pipeline.hset(new_key, entry.url, json.dumps(asdict(entry)))
+            pipeline.execute()
+
+        self.redis.rename(new_key, self.keys.page_manifest(self.url))
+        # We used to keep manifests under the index prefix, where
+        # RediSearch indexed them as empty documents.
+        self.redis.delete(f"{self.keys.index_prefix(self.url)}:{{manifest}}:current",
+                          f"{self.keys.index_prefix(self.url)}:{{manifest}}:new")
+
+    def memory_report(self) -> Dict[str, float]:
+        """
+        Estimate the memory used by what we keep for the whole crawl.
+
+        Documents pass through the write queue, but the manifests,
+        `seen_urls`, `seen_ids` and the hierarchies we wrote grow with the
+        number of pages and documents in the site.
+        """
+        documents = len(self.seen_ids)
+        state_bytes = object_bytes(self.manifest, self.new_manifest, self.seen_urls,
+                                   self.seen_ids, self.written_hierarchies)
+        return {
+            "documents": documents,
+            "bytes": state_bytes,
+            "bytes_per_document": state_bytes / documents if documents else 0.0,
+        }
+
+    def record_page(self, entry: PageManifestEntry):
+        """
+        Record a crawled page in the manifest we're building.
+
+        Unchanged pages produce no documents, so we mark the documents they
+        produced last time as seen. Otherwise, we would consider them stale.
+        """
+        self.new_manifest[entry.url] = entry
+        if self.frontier is not None:
+            # The coordinator of the crawl loads every worker's pages.
+            self.frontier.record_page_later(entry.url, json.dumps(asdict(entry)))
+
+        if entry.changed or not entry.doc_ids:
+            return
+
+        url_without_slash = page_url(entry.url)
+        if url_without_slash == self.site.url.rstrip("/"):
+            return
+
+        self.seen_urls[url_without_slash] = entry.title.replace("//", "")
+        self.seen_ids.update(entry.doc_ids)
+
     def build_hierarchy(self, doc: SearchDocument):
         """
         Build the hierarchy of pages "above" this document.
 
-        At this point, we've already crawled all the URLs that we're going to
-        index, and we added the URLs and page titles to the `seen_urls`
-        dictionary.
+        As we crawl, we add the URLs and page titles we see to the
+        `seen_urls` dictionary. (If we write documents during the crawl,
+        some pages may not be there yet -- see `fix_hierarchies()`.)
 
         Now, for this document, we're going to walk through the parts of its
         URL and reconstruct the page titles for those pages. We don't need
@@ -517,8 +1316,12 @@ class Indexer:
         trailing slash when we add a URL to `seen_urls` and then we remove
         any trailing slashes again when we look up a URL.
         """
+        return self.url_hierarchy(doc.url)
+
+    def url_hierarchy(self, doc_url: str) -> List[str]:
+        """Build the hierarchy of pages "above" a URL. See build_hierarchy()."""
         hierarchy = []
-        url = doc.url.replace(self.site.url, "").replace("//", "/").strip("/")
+        url = doc_url.replace(self.site.url, "").replace("//", "/").strip("/")
         parts = url.split("/")
         joinable_site_url = self.site.url.rstrip("/")
 
@@ -533,7 +1336,110 @@ class Indexer:
 
         return hierarchy
 
-    def index(self, force: bool = False):
+    def accept_document(self, item: SearchDocument) -> bool:
+        """
+        Record a scraped document as seen, unless we don't index it.
+
+        Returns True if the document should be indexed.
+        """
+        url_without_slash = item.url.rstrip("/")
+        # Don't index the root page. There is probably a better way to
+        # do this with Scrapy!
+        if url_without_slash == self.site.url.rstrip("/"):
+            return False
+        # Remove any escape slashes -- we don't want to include escape characters
+        # within the hierarchy JSON because json.loads() can't parse them...
+        self.seen_urls[url_without_slash] = item.title.replace("//", "")
+        self.seen_ids.add(item.doc_id)
+        return True
+
+    def load_crawl_results(self):
+        """
+        Load what every worker of a distributed crawl saw.
+
+        Each worker added its pages to the new page manifest in Redis, so
+        we rebuild `seen_urls` and `seen_ids` from it. Workers built their
+        hierarchies from the pages they saw, so we read back the hierarchy
+        of every document for fix_hierarchies().
+        """
+        self.new_manifest = self.load_manifest(self.keys.page_manifest_new(self.url))
+        self.seen_urls = {}
+        self.seen_ids = DocIdSet()
+        self.written_hierarchies = {}
+        root_url = page_url(self.site.url)
+
+        for entry in self.new_manifest.values():
+            url = page_url(entry.url)
+            if url != root_url and entry.doc_ids:
+                self.seen_urls[url] = entry.title.replace("//", "")
+                self.seen_ids.update(entry.doc_ids)
+
+        doc_ids = list(self.seen_doc_ids())
+        for i in range(0, len(doc_ids), self.batch_size):
+            pipeline = self.redis.pipeline(transaction=False)
+            for doc_id in doc_ids[i:i + self.batch_size]:
+                pipeline.hmget(self.keys.document(self.url, doc_id), "url", "hierarchy")
+            for url, hierarchy in pipeline.execute():
+                if url is not None:
+                    self.record_hierarchy(url, json.loads(hierarchy or "[]"))
+
+        log.info("Loaded %d pages and %d documents from the crawl's workers",
+                 len(self.new_manifest), len(self.seen_ids))
+
+    def start_writers(self, docs_to_process: Queue,
+                      written: Optional[Callable[[int], None]] = None):
+        for _ in range(WRITER_THREADS):
+            Thread(target=self.write_documents,
+                   args=(docs_to_process, written),
+                   daemon=True).start()
+
+    def finish_indexing(self, docs_to_process: Queue, save_manifest: bool = True):
+        """
+        Write the remaining documents and swap the new index in.
+
+        If `save_manifest` is False, we delete the saved page manifest
+        instead of replacing it, so the next crawl parses every page.
+        """
+        if docs_to_process.empty() and not self.seen_ids:
+            # Don't keep around an empty search index.
+            self.redis.execute_command('FT.DROPINDEX', self.index_name)
+            return
+        if not self.stream_indexing:
+            self.start_writers(docs_to_process)
+        self.redis.set(self.keys.last_index(self.site.url),
+                       datetime.datetime.now().timestamp())
+        docs_to_process.join()
+        log.info("Crawl state for %(documents)d documents: %(bytes)d bytes, "
+                 "%(bytes_per_document).0f bytes per document", self.memory_report())
+        self.fix_hierarchies()
+        if save_manifest:
+            self.save_manifest()
+        else:
+            self.redis.delete(self.keys.page_manifest(self.url))
+        self.build_suggestions()
+        self.create_index_alias()
+        self.clear_old_hashes()
+        self.release_lock()
+
+    def index(self, force: bool = False, incremental: bool = True,
+              record: Optional[str] = None):
+        """
+        Crawl the site and index every page we find.
+
+        If `incremental` is True, we make conditional requests for pages we
+        crawled during the last run and skip parsing pages that haven't
+        changed. Otherwise, we crawl and parse every page.
+
+        If `record` is the path of a snapshot file, we append every page we
+        fetch to it, so we can index the site again without crawling (see
+        reindex_from_snapshot()). A snapshot needs every page, so
+        recording makes the crawl a full one.
+
+        If `crawl_workers` is set (and we aren't recording), we coordinate
+        a distributed crawl: we start a frontier in Redis that helpers
+        join (see join_crawl()), crawl along with them, and once the
+        frontier drains and they're done, finish indexing for all of us.
+        """
         if not force:
             try:
                 self.debounce()
@@ -545,67 +1451,245 @@ class Indexer:
                 return
 
         # Set a lock per URL while indexing.
-        self.redis.set(self.lock, 1, ex=INDEXING_LOCK_TIMEOUT)
+        self.take_lock()
+        self.recover_doc_ids()
 
         log.info("[Starting] indexing for site %s", self.site.url)
 
+        if incremental and record is None:
+            self.manifest = self.load_manifest()
+
+        if self.crawl_workers and record is None:
+            self.start_frontier(incremental)
+
+        self.crawl(record)
+
+    def start_frontier(self, incremental: bool):
+        """
+        Start a distributed crawl, and queue `crawl_workers` helper jobs
+        to join it (see tasks.crawl()).
+
+        index() calls this after it takes the index lock, so a debounced
+        or locked indexing job doesn't leave helpers waiting for a crawl
+        that never starts.
+        """
+        # Workers can't hold documents until the crawl is over, because
+        # the coordinator finishes it.
+        self.stream_indexing = True
+        self.frontier = CrawlFrontier(self.redis, self.keys, self.url)
+        self.redis.delete(self.keys.page_manifest_new(self.url))
+
+        sitemap_url = self.site.sitemap_url
+        self.frontier.start(self.index_name, incremental,
+                            urls=[] if sitemap_url else [self.url],
+                            local_urls=[sitemap_url] if sitemap_url else [])
+        log.info("Started a distributed crawl of %s for index %s",
+                 self.url, self.index_name)
+
+        # tasks imports this module, so we name the helpers' task.
+        queue = ClusterAwareQueue(connection=get_rq_redis_client())
+        for _ in range(self.crawl_workers):
+            queue.enqueue("sitesearch.tasks.crawl",
+                          args=[self.site, self.index_name],
+                          job_timeout=INDEXING_TIMEOUT)
+
+    def join_crawl(self, frontier: CrawlFrontier, state: Dict[str, str]):
+        """
+        Help the coordinator of a distributed crawl crawl the site.
+
+        `state` is the crawl's state from CrawlFrontier.wait_for_start().
+        We write documents to the coordinator's new index as we go, and
+        leave it to the coordinator to finish indexing.
+        """
+        log.info("[Joining] crawl of site %s for index %s", self.url, self.index_name)
+        if state.get("incremental") == "1":
+            self.manifest = self.load_manifest()
+        self.stream_indexing = True
+        self.frontier = frontier
+        self.crawl(coordinator=False)
+
+    def crawl(self, record: Optional[str] = None, coordinator: bool = True):
+        """
+        Run the crawler, and finish indexing when it stops.
+
+        In a distributed crawl, only the coordinator finishes indexing,
+        after loading what the other workers saw.
+        """
+        parse_pool = None
+        if self.parse_workers:
+            parse_pool = start_parser_pool(self.site, self.parse_workers)
+
+        snapshot = None
+        if record is not None:
+            snapshot = SnapshotWriter(record)
+
+        # When we write documents during the crawl, we only hold as many as
+        # the writers can't keep up with: a document takes a slot until a
+        # writer has written it. We wait for slots on the reactor, so no
+        # thread is tied up while the crawl waits for the writers.
         docs_to_process = Queue()
-        Spider = type(
-            'Spider', (DocumentationSpiderBase, ), {"site_config": self.site})
+        slots = defer.DeferredSemaphore(self.queue_size) if self.stream_indexing else None
+
+        def release_slots(count: int):
+            for _ in range(count):
+                slots.release()
+
+        def written(count: int):
+            from twisted.internet import reactor
+            reactor.callFromThread(release_slots, count)
+
+        Spider = type('Spider', (DocumentationSpiderBase, ), {
+            "site_config": self.site,
+            "manifest": self.manifest,
+            "parse_pool": parse_pool,
+            "max_pending_parses": self.parse_workers * 2,
+            "snapshot": snapshot,
+            "frontier": self.frontier,
+            "coordinator": coordinator,
+        })
 
         def enqueue_document(signal, sender, item: SearchDocument, response,
                              spider):
             """Queue a SearchDocument for indexation."""
-            url_without_slash = item.url.rstrip("/")
-            # Don't index the root page. There is probably a better way to
-            # do this with Scrapy!
-            if url_without_slash == self.site.url.rstrip("/"):
+            if isinstance(item, PageManifestEntry):
+                self.record_page(item)
                 return
-            # Remove any escape slashes -- we don't want to include escape characters
-            # within the hierarchy JSON because json.loads() can't parse them...
-            self.seen_urls[url_without_slash] = item.title.replace("//", "")
-            self.seen_ids |= {item.doc_id}
-            docs_to_process.put(item)
-
-        def index_documents():
-            while True:
-                doc: SearchDocument = docs_to_process.get()
-                try:
-                    self.index_document(doc)
-                except Exception as e:
-                    log.error(
-                        "Unexpected error while indexing doc %s, error: %s",
-                        doc.doc_id, e)
-                docs_to_process.task_done()
+            if not self.accept_document(item):
+                return
+            if slots is None:
+                docs_to_process.put_nowait(item)
+            elif slots.tokens:
+                slots.acquire()
+                docs_to_process.put_nowait(item)
+            else:
+                # Scrapy waits for the Deferred before it finishes with the
+                # response, which in turn holds up new downloads.
+                return slots.acquire().addCallback(lambda _: docs_to_process.put_nowait(item))
 
         def start_indexing():
-            if docs_to_process.empty():
-                # Don't keep around an empty search index.
-                self.redis.execute_command('FT.DROPINDEX', self.index_name)
+            if parse_pool is not None:
+                parse_pool.shutdown()
+            if snapshot is not None:
+                snapshot.close()
+            if self.frontier is None:
+                self.finish_indexing(docs_to_process)
                 return
-            for _ in range(MAX_THREADS):
-                Thread(target=index_documents, daemon=True).start()
-            self.redis.set(self.keys.last_index(self.site.url),
-                           datetime.datetime.now().timestamp())
+
+            self.frontier.flush()
             docs_to_process.join()
-            self.create_index_alias()
-            self.clear_old_hashes()
-            self.redis.delete(self.lock)
+            self.frontier.deregister()
+            if coordinator:
+                self.frontier.clear()
+                self.load_crawl_results()
+                self.finish_indexing(docs_to_process)
 
         dispatcher.connect(enqueue_document, signal=signals.item_scraped)
         dispatcher.connect(start_indexing, signal=signals.engine_stopped)
 
-        process = CrawlerProcess(
-            settings={
-                'CONCURRENT_ITEMS': 200,
-                'CONCURRENT_REQUESTS': 100,
-                'CONCURRENT_REQUESTS_PER_DOMAIN': 100,
-                'HTTP_CACHE_ENABLED': True,
-                'REACTOR_THREADPOOL_MAXSIZE': 30,
-                'LOG_LEVEL': 'INFO'
-            })
+        settings = {
+            'CONCURRENT_ITEMS': 200,
+            'CONCURRENT_REQUESTS': 100,
+            'CONCURRENT_REQUESTS_PER_DOMAIN': 100,
+            'HTTP_CACHE_ENABLED': True,
+            'REACTOR_THREADPOOL_MAXSIZE': 30,
+            'LOG_LEVEL': 'INFO'
+        }
+        if self.frontier is not None:
+            settings['SCHEDULER'] = 'sitesearch.frontier.FrontierScheduler'
+            settings['SPIDER_MIDDLEWARES'] = {'sitesearch.frontier.FrontierMiddleware': 0}
+            self.frontier.register()
+
+        process = CrawlerProcess(settings=settings)
+
+        if self.stream_indexing:
+            self.start_writers(docs_to_process, written)
 
         log.info("Started crawling")
 
         process.crawl(Spider)
         process.start()
+
+    def parse_snapshot(self, path: str) -> Iterator[Tuple[SnapshotPage, List[SearchDocument]]]:
+        """
+        Parse the pages in a snapshot that the site configuration allows.
+
+        With parse workers, we keep up to two pages per worker in the
+        pool, and yield pages in the order they finish parsing.
+        """
+        doc_parser = DocumentParser(self.site)
+        allow = [re.compile(pattern) for pattern in self.site.allow]
+        deny = [re.compile(pattern) for pattern in self.site.deny]
+        pages = (page for page in read_snapshot(path)
+                 if url_is_allowed(page.url, self.url, allow, deny))
+
+        def parsed(page: SnapshotPage, parse: Callable[[], List[SearchDocument]]):
+            try:
+                return page, parse()
+            except ParseError as e:
+                log.error("Document parser error -- %s: %s", e, page.url)
+                return page, []
+
+        if not self.parse_workers:
+            for page in pages:
+                yield parsed(page, lambda: doc_parser.parse(page.url, page.body))
+            return
+
+        pool = start_parser_pool(self.site, self.parse_workers)
+        pending: Dict[Future, SnapshotPage] = {}
+        try:
+            for page in pages:
+                pending[pool.submit(parse_page, page.url, page.body)] = page
+                if len(pending) < self.parse_workers * 2:
+                    continue
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield parsed(pending.pop(future), future.result)
+            for future in as_completed(list(pending)):
+                yield parsed(pending.pop(future), future.result)
+        finally:
+            pool.shutdown()
+
+    def reindex_from_snapshot(self, path: str, force: bool = False) -> bool:
+        """
+        Index the site from a snapshot recorded by index(), without crawling.
+
+        We parse the recorded pages with the current site configuration,
+        write their documents in batches, and then swap in the new index
+        the same way a crawl does.
+
+        The new index no longer matches the page manifest of the last crawl,
+        so we delete the manifest, and the next crawl parses every page.
+
+        Like index(), we skip reindexing while the site is being indexed,
+        unless `force` is True. Returns whether we reindexed.
+        """
+        if not force and self.redis.exists(self.lock):
+            log.info("Skipping reindex due to presence of lock %s", self.lock)
+            return False
+
+        self.take_lock()
+        try:
+            self.recover_doc_ids()
+            log.info("[Starting] indexing site %s from snapshot %s", self.site.url, path)
+
+            docs_to_process = Queue(self.queue_size if self.stream_indexing else 0)
+            if self.stream_indexing:
+                self.start_writers(docs_to_process)
+
+            for page, docs in self.parse_snapshot(path):
+                for doc in docs:
+                    if self.accept_document(doc):
+                        docs_to_process.put(doc)
+                self.record_page(PageManifestEntry(
+                    url=page.url,
+                    title=docs[0].title if docs else "",
+                    etag=page.header('ETag'),
+                    last_modified=page.header('Last-Modified'),
+                    content_hash=hashlib.md5(page.body).hexdigest(),
+                    doc_ids=tuple(doc.doc_id for doc in docs),
+                    links=()))
+
+            self.finish_indexing(docs_to_process, save_manifest=False)
+        finally:
+            self.release_lock()
+        return True
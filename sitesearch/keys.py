@@ -21,6 +21,34 @@ class Keys:
         """The index alias we use for a URL."""
         return f"{self.prefix}:{url}"
 
+    def index_generation(self, url: str) -> str:
+        """A counter we increment when an index alias moves to a new index."""
+        return f"{self.prefix}:{url}:index_generation"
+
+    def search_cache_prefix(self, url: str) -> str:
+        """The prefix of every shared search cache entry for a site."""
+        return f"{self.prefix}:{url}:search_cache:"
+
+    def search_cache(self, url: str, generation: str, digest: str) -> str:
+        """A search result in the shared search cache."""
+        return f"{self.search_cache_prefix(url)}{generation}:{digest}"
+
+    def search_cache_lock(self, cache_key: str) -> str:
+        """A lock taken while computing a shared search cache entry."""
+        return f"{cache_key}:lock"
+
+    def suggestions(self, url: str) -> str:
+        """The autocomplete suggestion dictionary for a site."""
+        return f"{self.prefix}:{url}:suggestions"
+
+    def suggestions_new(self, url: str) -> str:
+        """The suggestion dictionary an indexing task is building for a site.
+
+        When the site's index alias moves to the new index, this key
+        replaces suggestions().
+        """
+        return f"{self.prefix}:{url}:suggestions:new"
+
     def index_lock(self, url: str) -> str:
         """A simple lock taken while indexing."""
         return f"{self.prefix}:{url}:lock"
@@ -44,3 +72,59 @@ class Keys:
         indexed from a site in the past but that are no longer on the site.
         """
         return f"{self.prefix}:{index_alias}:{{urls}}:new"
+
+    def doc_ids_current(self, url: str) -> str:
+        """The IDs of every document currently indexed for a site."""
+        return f"{self.prefix}:{url}:{{doc_ids}}:current"
+
+    def doc_ids_new(self, url: str) -> str:
+        """The IDs of every document seen by an indexing task for a site.
+
+        When indexing finishes, the difference between doc_ids_current()
+        and this set is the set of stale documents, and this key replaces
+        doc_ids_current().
+        """
+        return f"{self.prefix}:{url}:{{doc_ids}}:new"
+
+    def doc_ids_stale(self, url: str) -> str:
+        """The IDs of documents an indexing task is about to delete."""
+        return f"{self.prefix}:{url}:{{doc_ids}}:stale"
+
+    def page_manifest(self, url: str) -> str:
+        """Validators, content hashes, and doc IDs for every page we crawled.
+
+        Like every Hash that isn't a document, this key must not start with
+        index_prefix(), or RediSearch would index it as a document.
+        """
+        return f"{self.prefix}:{self.index_alias(url)}:{{manifest}}:current"
+
+    def page_manifest_new(self, url: str) -> str:
+        """The page manifest an indexing task is building for a site.
+
+        When indexing finishes, this key replaces page_manifest().
+        """
+        return f"{self.prefix}:{self.index_alias(url)}:{{manifest}}:new"
+
+    def crawl_frontier(self, url: str) -> str:
+        """The URLs waiting to be crawled in a distributed crawl of a site."""
+        return f"{self.prefix}:{self.index_alias(url)}:{{crawl}}:frontier"
+
+    def crawl_seen(self, url: str) -> str:
+        """Fingerprints of every URL added to a distributed crawl's frontier."""
+        return f"{self.prefix}:{self.index_alias(url)}:{{crawl}}:seen"
+
+    def crawl_in_flight(self, url: str) -> str:
+        """The URLs that workers are crawling, scored by when they took them."""
+        return f"{self.prefix}:{self.index_alias(url)}:{{crawl}}:in_flight"
+
+    def crawl_workers(self, url: str) -> str:
+        """The workers of a distributed crawl, scored by their last heartbeat."""
+        return f"{self.prefix}:{self.index_alias(url)}:{{crawl}}:workers"
+
+    def crawl_state(self, url: str) -> str:
+        """The index that a distributed crawl builds, and how it crawls.
+
+        This is a Hash, so like page_manifest(), it must not start with
+        index_prefix().
+        """
+        return f"{self.prefix}:{self.index_alias(url)}:{{crawl}}:state"
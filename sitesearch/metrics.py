@@ -0,0 +1,130 @@
+"""
+In-process latency metrics for the search API.
+
+We time the stages of a search with a StageTimer, report the stages of
+each search in its Server-Timing header, and count them in histograms
+that the /metrics endpoint renders in the Prometheus text format.
+
+Each worker process keeps its own histograms, like the search result
+caches, so Prometheus sees one series per worker it scrapes.
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# Upper bounds of the histogram buckets, in seconds.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """
+    A Prometheus histogram with labels.
+
+    Observing a value is a bisect and a few increments. We only make the
+    buckets cumulative, as Prometheus expects, when we render them.
+    """
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str],
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # Labels -> [count per bucket..., count over the last bucket, sum]
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+
+        for labels, series in sorted(self.series.items()):
+            label_text = ",".join(f'{name}="{escape_label(value)}"'
+                                  for name, value in zip(self.label_names, labels))
+            prefix = f"{label_text}," if label_text else ""
+            suffix = f"{{{label_text}}}" if label_text else ""
+            count = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), series):
+                count += bucket_count
+                yield f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}'
+            yield f"{self.name}_sum{suffix} {series[-1]}"
+            yield f"{self.name}_count{suffix} {count}"
+
+
+SEARCH_SECONDS = Histogram(
+    "sitesearch_search_seconds",
+    "Time to handle a search, by site and how the result caches answered.",
+    ("site", "cache"))
+
+SEARCH_STAGE_SECONDS = Histogram(
+    "sitesearch_search_stage_seconds",
+    "Time spent in each stage of a search, by site and how the result caches answered.",
+    ("site", "cache", "stage"))
+
+HISTOGRAMS = (SEARCH_SECONDS, SEARCH_STAGE_SECONDS)
+
+
+def render_metrics() -> str:
+    """Render every histogram in the Prometheus text format."""
+    return "\n".join(line for histogram in HISTOGRAMS for line in histogram.render()) + "\n"
+
+
+class StageTimer:
+    """
+    Time the stages of handling one request.
+
+    A stage that runs more than once, like the Redis round trip of a
+    search that has to fetch more results, adds up.
+    """
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        self.total = 0.0
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0) + self.clock() - start
+
+    def stop(self):
+        """Record the total time since the timer started."""
+        self.total = self.clock() - self.started
+
+    def server_timing(self, cache: str) -> str:
+        """Format the stages for a Server-Timing header, in milliseconds."""
+        metrics = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.stages.items()]
+        metrics.append(f"total;dur={self.total * 1000:.3f}")
+        metrics.append(f'cache-status;desc="{cache}"')
+        return ", ".join(metrics)
+
+    def observe(self, site: str, cache: str):
+        """Count this request's stages and total time in the search histograms."""
+        for name, seconds in self.stages.items():
+            SEARCH_STAGE_SECONDS.observe(seconds, site, cache, name)
+        SEARCH_SECONDS.observe(self.total, site, cache)
+
+
+class NullTimer(StageTimer):
+    """A timer for searches we don't instrument, like federated searches."""
+    @contextmanager
+    def stage(self, name: str):
+        yield
+
+
+NULL_TIMER = NullTimer()
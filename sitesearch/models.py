@@ -1,6 +1,6 @@
 import re
-from dataclasses import dataclass, replace
-from typing import Dict, List, Set, Tuple, Callable, Pattern
+from dataclasses import dataclass, fields, replace
+from typing import Dict, List, Optional, Set, Tuple, Callable, Pattern
 
 from redisearch.client import Field
 
@@ -8,6 +8,34 @@ TYPE_PAGE = "page"
 TYPE_SECTION = "section"
 
 
+def with_slots(cls):
+    """
+    Rebuild a dataclass with __slots__, like dataclass(slots=True) does
+    on Python 3.10+.
+
+    The indexer holds many documents and manifest entries at once, and a
+    slotted instance has no __dict__, which makes it several times
+    smaller. Pickle restores slots with setattr(), which a frozen
+    dataclass forbids, so we give the class its own pickle state.
+    """
+    names = tuple(f.name for f in fields(cls))
+    namespace = {k: v for k, v in cls.__dict__.items()
+                 if k not in names and k not in ('__dict__', '__weakref__')}
+    namespace['__slots__'] = names
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in names)
+
+    def __setstate__(self, state):
+        for name, value in zip(names, state):
+            object.__setattr__(self, name, value)
+
+    namespace['__getstate__'] = __getstate__
+    namespace['__setstate__'] = __setstate__
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+
+@with_slots
 @dataclass(frozen=True)
 class SearchDocument:
     doc_id: str
@@ -21,6 +49,39 @@ class SearchDocument:
     position: int = 0
 
 
+@with_slots
+@dataclass(frozen=True)
+class PageManifestEntry:
+    """
+    What we knew about a crawled page the last time we indexed it.
+
+    The crawler sends `etag` and `last_modified` back to the server as
+    conditional request headers, and compares `content_hash` against
+    the body it receives. When the page hasn't changed, we reuse
+    `doc_ids` and `links` instead of parsing the page again.
+
+    In sitemap mode, `lastmod` is the page's last modification date from
+    the sitemap. If the sitemap gives the same date next time, we don't
+    request the page at all.
+
+    `hierarchy` is the hierarchy the page's documents have in the index.
+    An unchanged page keeps its documents, so if the title of a page
+    above it changed, we know to fix their hierarchy. It's None in
+    manifests saved before we recorded it, whose documents may also lack
+    a "display_hierarchy", so we rewrite their hierarchy fields.
+    """
+    url: str
+    title: str
+    etag: str
+    last_modified: str
+    content_hash: str
+    doc_ids: Tuple[str, ...]
+    links: Tuple[str, ...]
+    lastmod: str = ""
+    changed: bool = True
+    hierarchy: Optional[Tuple[str, ...]] = None
+
+
 @dataclass(frozen=True)
 class SynonymGroup:
     group_id: str
@@ -44,6 +105,11 @@ class SiteConfiguration:
     allowed_domains: Tuple[str, ...]
     content_classes: Tuple[str, ...] = None
     literal_terms: Tuple[str, ...] = ""
+    # The HTML backend DocumentParser uses: "html.parser" or "lxml".
+    html_parser: str = "html.parser"
+    # If set, crawl the pages listed in this sitemap (or sitemap index)
+    # instead of following links from the site's root URL.
+    sitemap_url: str = None
 
     @property
     def all_synonyms(self) -> Set[str]:
@@ -1,10 +1,109 @@
 import re
-from typing import List, Optional, Sequence
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
 
 from sitesearch.models import SiteConfiguration
 
 UNSAFE_CHARS = re.compile(r'[\[\]<>+]')
 
+# The fields a search returns for each document. Title, section title and
+# body are highlighted, so we return the searchable fields for those. The
+# hierarchy is served from "display_hierarchy", which the indexer stores
+# ready to use; "hierarchy" is the fallback for documents indexed before
+# it existed.
+RETURN_FIELDS = ("title", "section_title", "body", "url", "hierarchy", "display_hierarchy")
+
+
+# Characters with special meaning in a regular expression, other than ".".
+# We can't split terms that use these into single-character tokens.
+REGEX_SYNTAX_CHARS = set("()[]{}?*+|^$")
+ANY_CHAR = None
+
+
+def tokenize_term(term: str) -> List[str]:
+    """
+    Split a literal term (a regular expression) into single-character tokens.
+
+    Escape sequences like "\\." are one token. Terms that use other regex
+    syntax become a single token, because we can't safely split them.
+    """
+    if REGEX_SYNTAX_CHARS & set(term):
+        return [f"(?:{term})"]
+
+    tokens = []
+    chars = iter(term)
+    for char in chars:
+        if char == "\\":
+            char += next(chars, "")
+        tokens.append(char)
+    return tokens
+
+
+def token_first_char(token: str) -> Optional[str]:
+    """
+    Return the (case-folded) character a token matches, or ANY_CHAR if the
+    token might match more than one character.
+    """
+    if len(token) == 1 and token != ".":
+        return token.casefold()
+    if len(token) == 2 and token[0] == "\\" and not token[1].isalnum():
+        return token[1].casefold()
+    return ANY_CHAR
+
+
+def tokens_overlap(a: Optional[str], b: Optional[str]) -> bool:
+    return a is ANY_CHAR or b is ANY_CHAR or a == b
+
+
+def compile_alternation(terms: Sequence[List[str]]) -> str:
+    """
+    Compile tokenized terms into a regex equivalent to "term1|term2|...".
+
+    Python's regex engine tries each branch of an alternation in turn at
+    every position, so an alternation of ~100 terms is slow. Instead, we
+    group terms by their first token and compile each group's remaining
+    tokens recursively -- a trie, expressed as a regex.
+
+    Alternation picks the first branch that matches, not the longest, so
+    grouping must not change which term matches first. A term only joins an
+    earlier group if no group after that one could match at the same
+    position. Otherwise it starts a new group.
+    """
+    return "|".join(_compile_branches(terms))
+
+
+def _compile_branches(terms: Sequence[List[str]]) -> List[str]:
+    groups: List[Tuple[str, List[List[str]]]] = []
+
+    for tokens in terms:
+        first = tokens[0] if tokens else ""
+        first_char = token_first_char(first) if first else ANY_CHAR
+
+        for i in range(len(groups) - 1, -1, -1):
+            group_token, group_terms = groups[i]
+            group_char = token_first_char(group_token) if group_token else ANY_CHAR
+            if first_char is not ANY_CHAR and group_token.casefold() == first.casefold():
+                group_terms.append(tokens[1:])
+                break
+            if tokens_overlap(first_char, group_char):
+                groups.append((first, [tokens[1:]]))
+                break
+        else:
+            groups.append((first, [tokens[1:]]))
+
+    branches = []
+    for token, rests in groups:
+        if len(rests) == 1:
+            branches.append(token + "".join(rests[0]))
+            continue
+        sub_branches = _compile_branches(rests)
+        if len(sub_branches) == 1:
+            branches.append(token + sub_branches[0])
+        else:
+            branches.append(f"{token}(?:{'|'.join(sub_branches)})")
+
+    return branches
+
 
 class TokenEscaper:
     """
@@ -17,24 +116,38 @@ class TokenEscaper:
     This Escaper class takes a sequence of "literal tokens". When you call
     escape_string(), Escaper escapes punctuation within any literal tokens
     found in the input string.
+
+    Building an escaper compiles a large regex, so use get_escaper() to
+    reuse one escaper per set of literal terms.
     """
 
     ESCAPED_CHARS_RE = re.compile(r"[,.<>{}\[\]\\\"\':;!@#$%^&*()\-\+=~+]")
 
     def __init__(self, literal_terms: Sequence[str]):
-        regex = "|".join(literal_terms)
-        self.literal_terms_re = re.compile(f"{regex}", re.IGNORECASE)
+        terms = [tokenize_term(term) for term in literal_terms]
+        if terms:
+            regex = compile_alternation(terms)
+            self.literal_terms_re = re.compile(regex, re.IGNORECASE)
+        else:
+            self.literal_terms_re = None
+
+    @staticmethod
+    def escape_symbol(match) -> str:
+        return f"\\{match.group(0)}"
+
+    def escape_string(self, match) -> str:
+        return self.ESCAPED_CHARS_RE.sub(self.escape_symbol, match.group(0))
 
     def escape(self, string):
-        def escape_symbol(match):
-            value = match.group(0)
-            return f"\\{value}"
+        if self.literal_terms_re is None:
+            return string
+        return self.literal_terms_re.sub(self.escape_string, string)
 
-        def escape_string(match):
-            value = match.group(0)
-            return self.ESCAPED_CHARS_RE.sub(escape_symbol, value)
 
-        return self.literal_terms_re.sub(escape_string, string)
+@lru_cache(maxsize=None)
+def get_escaper(literal_terms: Tuple[str, ...]) -> TokenEscaper:
+    """Get the shared TokenEscaper for a tuple of literal terms."""
+    return TokenEscaper(literal_terms)
 
 
 async def parse(index_alias: str, query: str, section: Optional[str], start: int, num: int,
@@ -44,7 +157,7 @@ async def parse(index_alias: str, query: str, section: Optional[str], start: int
     query = query.strip().replace("-*", "*")
     query = UNSAFE_CHARS.sub(' ', query)
     query = query.strip()
-    query = TokenEscaper(search_site.literal_terms).escape(query)
+    query = get_escaper(search_site.literal_terms).escape(query)
 
     # For queries of a term that should result in an exact match, e.g.
     # "insight" (a synonym of RedisInsight), or "active-active", strip any star
@@ -62,5 +175,6 @@ async def parse(index_alias: str, query: str, section: Optional[str], start: int
         query = f"((@s:{section}) => {{$weight: 10}} {query}) | {query}"
 
     options = f'SUMMARIZE FIELDS 1 body FRAGS 1 LEN 10 HIGHLIGHT FIELDS 3 title body section_title LIMIT {start} {num}'.split(' ')
+    options += ["RETURN", str(len(RETURN_FIELDS)), *RETURN_FIELDS]
 
     return [index_alias, query] + options
@@ -0,0 +1,151 @@
+"""
+Recompute the scores of a site's indexed documents without crawling.
+
+The indexer only runs a site's scorers when it writes a document. To try
+new scorers, we read every document Hash of the site back, rebuild its
+SearchDocument, score it again, and write back only the `__score` values
+that changed.
+"""
+import logging
+import math
+from dataclasses import dataclass, field, fields
+from typing import Dict, List
+
+from redis import Redis
+
+from sitesearch.indexer import document_from_hash
+from sitesearch.keys import Keys
+from sitesearch.models import SearchDocument, SiteConfiguration
+from sitesearch.scorers import score_document
+
+# The fields we read back to rebuild and score a document.
+HASH_FIELDS = (*(f.name for f in fields(SearchDocument)), "__score")
+
+# Set a document's score, unless the indexer deleted the document since we
+# read it. A plain HSET would create a Hash with nothing but a score.
+SET_SCORE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('HSET', KEYS[1], '__score', ARGV[1])
+end
+return 0
+"""
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class ScoreDistribution:
+    """A summary of scores, with a histogram of 0.1-wide buckets."""
+    count: int = 0
+    total: float = 0.0
+    minimum: float = math.inf
+    maximum: float = -math.inf
+    buckets: Dict[str, int] = field(default_factory=dict)
+
+    def add(self, score: float):
+        self.count += 1
+        self.total += score
+        self.minimum = min(self.minimum, score)
+        self.maximum = max(self.maximum, score)
+        bucket = f"{math.floor(score * 10) / 10:.1f}"
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def to_dict(self) -> dict:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "min": self.minimum,
+            "mean": self.total / self.count,
+            "max": self.maximum,
+            "buckets": dict(sorted(self.buckets.items(), key=lambda b: float(b[0]))),
+        }
+
+
+@dataclass
+class RescoreReport:
+    """What rescoring a site changed, or would change in a dry run."""
+    site: str
+    dry_run: bool
+    documents: int = 0
+    changed: int = 0
+    before: ScoreDistribution = field(default_factory=ScoreDistribution)
+    after: ScoreDistribution = field(default_factory=ScoreDistribution)
+
+    def to_dict(self) -> dict:
+        return {
+            "site": self.site,
+            "dry_run": self.dry_run,
+            "documents": self.documents,
+            "changed": self.changed,
+            "before": self.before.to_dict(),
+            "after": self.after.to_dict(),
+        }
+
+
+def rescore_batch(site: SiteConfiguration, redis_client: Redis, keys: List[str],
+                  report: RescoreReport):
+    pipeline = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipeline.hmget(key, HASH_FIELDS)
+
+    changed = {}
+    for key, values in zip(keys, pipeline.execute()):
+        hash_fields = dict(zip(HASH_FIELDS, values))
+        # Deleted since we scanned it, or a Hash with no document in it.
+        if hash_fields['doc_id'] is None:
+            continue
+        old_score = float(hash_fields['__score'] or 1.0)
+        new_score = score_document(document_from_hash(hash_fields), site.scorers)
+
+        report.documents += 1
+        report.before.add(old_score)
+        report.after.add(new_score)
+        if new_score != old_score:
+            changed[key] = new_score
+
+    report.changed += len(changed)
+    if report.dry_run or not changed:
+        return
+
+    set_score = redis_client.register_script(SET_SCORE_SCRIPT)
+    pipeline = redis_client.pipeline(transaction=False)
+    for key, score in changed.items():
+        set_score(keys=[key], args=[score], client=pipeline)
+    pipeline.execute()
+
+
+def rescore_site(site: SiteConfiguration, redis_client: Redis, keys: Keys,
+                 batch_size: int, dry_run: bool = False) -> RescoreReport:
+    """
+    Score every indexed document of a site again with the site's scorers.
+
+    We SCAN the site's document Hashes and work through them in batches
+    of `batch_size`, with one pipeline to read a batch and one to write
+    the changed scores. The indexer may delete documents while we work,
+    so we only write scores to documents that still exist. In a dry run,
+    we only report what would change.
+
+    If any score changed, we bump the site's index generation, so the
+    search API stops reading the results it cached.
+    """
+    report = RescoreReport(site=site.url, dry_run=dry_run)
+    pattern = f"{keys.document(site.url, '')}*"
+    batch = []
+
+    for key in redis_client.scan_iter(match=pattern, count=batch_size):
+        batch.append(key)
+        if len(batch) >= batch_size:
+            rescore_batch(site, redis_client, batch, report)
+            batch = []
+            log.info("Rescored %d documents so far", report.documents)
+    if batch:
+        rescore_batch(site, redis_client, batch, report)
+
+    log.info("Rescored %d documents for %s, %d changed%s", report.documents, site.url,
+             report.changed, " (dry run)" if dry_run else "")
+
+    if report.changed and not dry_run:
+        redis_client.incr(keys.index_generation(site.url))
+
+    return report
@@ -0,0 +1,65 @@
+"""
+Decode FT.SEARCH replies for the search API.
+
+redisearch.Result decodes a reply into generic Document objects, copying
+every field into a dictionary and then setting it as an attribute. The
+search API only reads the fields that query_parser.parse() asks for with
+RETURN, so we decode straight into small records with a slot per field.
+"""
+from typing import List, Optional
+
+
+class SearchHit:
+    """One document in the reply to a search."""
+    __slots__ = ('id', 'score', 'title', 'section_title', 'body', 'url',
+                 'hierarchy', 'display_hierarchy')
+
+    def __init__(self, id: str, score: Optional[float], title: str = "",
+                 section_title: str = "", body: str = "", url: str = "",
+                 hierarchy: str = "[]", display_hierarchy: Optional[str] = None):
+        self.id = id
+        self.score = score
+        self.title = title
+        self.section_title = section_title
+        self.body = body
+        self.url = url
+        self.hierarchy = hierarchy
+        self.display_hierarchy = display_hierarchy
+
+    def __repr__(self):
+        return f"SearchHit({self.id!r}, url={self.url!r})"
+
+
+class SearchResults:
+    """The total number of matching documents and the hits in a reply."""
+    __slots__ = ('total', 'docs')
+
+    def __init__(self, total: int, docs: List[SearchHit]):
+        self.total = total
+        self.docs = docs
+
+
+def parse_search_reply(reply: list, with_scores: bool = False) -> SearchResults:
+    """
+    Decode the reply to an FT.SEARCH without NOCONTENT or WITHPAYLOADS.
+
+    The reply is flat: the total, then for each document its ID, its score
+    (if we asked for scores), and a list of its field names and values.
+    Fields other than those of a SearchHit are ignored.
+    """
+    step = 3 if with_scores else 2
+    docs = []
+
+    for i in range(1, len(reply), step):
+        fields = reply[i + step - 1]
+        hit = SearchHit(reply[i], float(reply[i + 1]) if with_scores else None)
+        for j in range(0, len(fields) - 1, 2):
+            name = fields[j]
+            if name in FIELD_NAMES:
+                setattr(hit, name, fields[j + 1])
+        docs.append(hit)
+
+    return SearchResults(reply[0], docs)
+
+
+FIELD_NAMES = frozenset(SearchHit.__slots__) - {'id', 'score'}
@@ -1,4 +1,5 @@
 import math
+from typing import Callable, Iterable
 
 from sitesearch.models import SearchDocument, TYPE_PAGE
 
@@ -9,6 +10,19 @@ from sitesearch.models import SearchDocument, TYPE_PAGE
 SCORE_FLOOR = 0.01
 
 
+def score_document(doc: SearchDocument,
+                   scorers: Iterable[Callable[[SearchDocument, float], float]]) -> float:
+    """
+    Compute the ad-hoc score of a document.
+
+    Every scorer gets a chance to adjust the score, starting from 1.0.
+    """
+    score = 1.0
+    for scorer in scorers:
+        score = scorer(doc, score)
+    return score
+
+
 def boost_pages(doc: SearchDocument, current_score: float) -> float:
     """Score page sections lower than pages, to boost pages."""
     if doc.type != TYPE_PAGE:
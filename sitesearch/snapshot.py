@@ -0,0 +1,130 @@
+"""
+Record crawled pages to a snapshot file, and read them back.
+
+A snapshot is a gzip file of records, one per page. Each record is the
+length of a JSON header, the header (the page's URL, response headers and
+body length), and then the body. Every crawl that records to a snapshot
+appends a new gzip member, which gzip readers see as one stream, so a
+file can collect several crawls.
+
+A crawl starts with a record that has no URL or body, only the time the
+crawl started. We replay the latest crawl in a file: pages that earlier
+crawls found, but that the site has since removed, stay removed. When a
+URL appears more than once in a crawl, the last record wins. If a crawl
+died while writing a record, we stop at the last complete record.
+"""
+import gzip
+import json
+import logging
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Set, Tuple
+
+from sitesearch.models import with_slots
+
+# The length of a record's JSON header, as a big-endian unsigned int.
+HEADER_LENGTH = struct.Struct(">I")
+COMPRESSION_LEVEL = 6
+
+log = logging.getLogger(__name__)
+
+
+@with_slots
+@dataclass(frozen=True)
+class SnapshotPage:
+    """A page as we fetched it during a crawl."""
+    url: str
+    headers: Dict[str, str]
+    body: bytes
+
+    def header(self, name: str) -> str:
+        """Get a response header, ignoring case, or an empty string if it's missing."""
+        name = name.lower()
+        return next((value for key, value in self.headers.items() if key.lower() == name), "")
+
+
+class SnapshotWriter:
+    """Append the pages of a crawl to a snapshot file."""
+    def __init__(self, path: str, compression_level: int = COMPRESSION_LEVEL):
+        self.path = path
+        self.file = gzip.open(path, "ab", compresslevel=compression_level)
+        self.pages = 0
+        self._write_record({"crawl": time.time(), "length": 0}, b"")
+
+    def write(self, url: str, headers: Dict[str, str], body: bytes):
+        self._write_record({"url": url, "headers": headers, "length": len(body)}, body)
+        self.pages += 1
+
+    def _write_record(self, fields: Dict[str, Any], body: bytes):
+        header = json.dumps(fields).encode("utf-8")
+        self.file.write(HEADER_LENGTH.pack(len(header)))
+        self.file.write(header)
+        self.file.write(body)
+
+    def close(self):
+        self.file.close()
+        log.info("Recorded %d pages to %s", self.pages, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _read_exactly(f: BinaryIO, size: int) -> Optional[bytes]:
+    data = f.read(size)
+    return data if len(data) == size else None
+
+
+def _read_records(path: str, with_body: bool = True) -> Iterator[Tuple[Dict[str, Any], bytes]]:
+    with gzip.open(path, "rb") as f:
+        try:
+            while True:
+                length = _read_exactly(f, HEADER_LENGTH.size)
+                if length is None:
+                    return
+                header = _read_exactly(f, HEADER_LENGTH.unpack(length)[0])
+                if header is None:
+                    break
+                fields = json.loads(header)
+                if with_body:
+                    body = _read_exactly(f, fields["length"])
+                    if body is None:
+                        break
+                else:
+                    start = f.tell()
+                    if f.seek(fields["length"], 1) - start != fields["length"]:
+                        break
+                    body = b""
+                yield fields, body
+        except (EOFError, OSError, zlib.error, ValueError) as e:
+            log.error("Snapshot %s is damaged: %s", path, e)
+            return
+
+    log.error("Snapshot %s ends with an incomplete record", path)
+
+
+def read_snapshot(path: str) -> Iterator[SnapshotPage]:
+    """
+    Yield the pages of the latest crawl in a snapshot, once per URL.
+
+    We read the file twice: once, skipping over bodies, to find the last
+    record of each URL since the latest crawl started, and then again to
+    yield those records. This way, we never hold more than one body in
+    memory.
+    """
+    last_record: Dict[str, int] = {}
+    for i, (fields, _) in enumerate(_read_records(path, with_body=False)):
+        if "crawl" in fields:
+            last_record.clear()
+        else:
+            last_record[fields["url"]] = i
+    keep: Set[int] = set(last_record.values())
+    del last_record
+
+    for i, (fields, body) in enumerate(_read_records(path)):
+        if i in keep:
+            yield SnapshotPage(url=fields["url"], headers=fields["headers"], body=body)
@@ -3,10 +3,12 @@ from typing import Optional
 from redis import ResponseError
 
 from sitesearch.config import AppConfiguration
-from sitesearch.connections import get_search_connection
-from sitesearch.indexer import Indexer
+from sitesearch.connections import get_redis_connection, get_search_connection
+from sitesearch.frontier import CrawlFrontier
+from sitesearch.indexer import INDEXING_TIMEOUT, Indexer
 from sitesearch.keys import Keys
 from sitesearch.models import SiteConfiguration
+from sitesearch.rescorer import RescoreReport, rescore_site
 
 log = logging.getLogger(__name__)
 
@@ -14,18 +16,50 @@ log = logging.getLogger(__name__)
 # state of the `index` task in the queueing/scheduling system.
 JOB_NOT_QUEUED = 'not_queued'
 JOB_STARTED = 'started'
-INDEXING_TIMEOUT = 60*60  # One hour
 
 
-def index(site: SiteConfiguration, config: Optional[AppConfiguration] = None, force=False):
+def index(site: SiteConfiguration, config: Optional[AppConfiguration] = None, force=False,
+          incremental=True, record: Optional[str] = None):
     if config is None:
         config = AppConfiguration()
     indexer = Indexer(site, config)
-    indexer.index(force)
+    indexer.index(force, incremental, record)
 
     return True
 
 
+def crawl(site: SiteConfiguration, index_name: str, config: Optional[AppConfiguration] = None):
+    """Help the `index` job building `index_name` crawl its site."""
+    if config is None:
+        config = AppConfiguration()
+    frontier = CrawlFrontier(get_redis_connection(), Keys(config.key_prefix), site.url)
+    state = frontier.wait_for_start(index_name)
+    if state is None:
+        log.error("No crawl of %s started for index %s", site.url, index_name)
+        return False
+
+    indexer = Indexer(site, config, index_name=index_name)
+    indexer.join_crawl(frontier, state)
+
+    return True
+
+
+def reindex_from_snapshot(site: SiteConfiguration, path: str,
+                          config: Optional[AppConfiguration] = None, force: bool = False):
+    if config is None:
+        config = AppConfiguration()
+    indexer = Indexer(site, config)
+    return indexer.reindex_from_snapshot(path, force)
+
+
+def rescore(site: SiteConfiguration, config: Optional[AppConfiguration] = None,
+            dry_run=False) -> RescoreReport:
+    if config is None:
+        config = AppConfiguration()
+    return rescore_site(site, get_redis_connection(), Keys(config.key_prefix),
+                        config.index_batch_size, dry_run)
+
+
 def clear_old_indexes(site: SiteConfiguration, config: Optional[AppConfiguration] = None):
     if config is None:
         config = AppConfiguration()
@@ -1,9 +1,9 @@
 import json
 import logging
 from json import JSONDecodeError
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Union
 
-from sitesearch.models import SiteConfiguration
+from sitesearch.models import SearchDocument, SiteConfiguration
 
 
 DEFAULT_MAX_LENGTH = 100
@@ -27,6 +27,57 @@ def unescape(string: str) -> str:
     return string.replace("\\", "")
 
 
+class RawJSON:
+    """
+    JSON text to put in a response as it is.
+
+    UJSONResponse writes what __json__() returns into the response without
+    decoding and encoding it again. For json.dumps(), pass
+    default=json_default.
+    """
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def __json__(self) -> str:
+        return self.text
+
+    def __eq__(self, other):
+        return isinstance(other, RawJSON) and self.text == other.text
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"RawJSON({self.text!r})"
+
+
+def json_default(obj: Any) -> Any:
+    """Encode the types that only UJSONResponse knows, for json.dumps()."""
+    if isinstance(obj, RawJSON):
+        return json.loads(obj.text)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def display_hierarchy(doc: Any) -> Union[RawJSON, List[str]]:
+    """
+    Get the hierarchy of a document, ready to display.
+
+    The indexer stores the hierarchy as "display_hierarchy", a JSON list
+    that's already unescaped, so we serve it as it is. Documents indexed
+    before we stored it only have the escaped hierarchy.
+    """
+    text = getattr(doc, 'display_hierarchy', None)
+    if text and text.startswith('[') and text.endswith(']'):
+        return RawJSON(text)
+    try:
+        return [unescape(h) for h in json.loads(getattr(doc, 'hierarchy', None) or "[]")]
+    except (JSONDecodeError, ValueError):
+        log.error("Bad hierarchy data for doc: %s", doc)
+        return []
+
+
 def transform_documents(docs: List[Any],
                         search_site: SiteConfiguration,
                         query: str,
@@ -34,8 +85,18 @@ def transform_documents(docs: List[Any],
     """
     Transform a list of Documents from RediSearch into a list of dictionaries.
     """
-    transformed = []
     landing_page = search_site.landing_page(query.replace('*', ''))
+    return transform_results(docs, landing_page, max_body_length)
+
+
+def transform_results(docs: List[Any],
+                      landing_page: Optional[SearchDocument],
+                      max_body_length: int = DEFAULT_MAX_LENGTH) -> List[Dict[str, str]]:
+    """
+    Transform a list of Documents from RediSearch into a list of dictionaries,
+    starting with the landing page for the query, if it has one.
+    """
+    transformed = []
     pages_seen = set()
 
     if landing_page:
@@ -53,11 +114,7 @@ def transform_documents(docs: List[Any],
         if doc.url in pages_seen:
             continue
 
-        try:
-            hierarchy = json.loads(doc.hierarchy)
-        except (JSONDecodeError, ValueError):
-            log.error("Bad hierarchy data for doc: %s", doc)
-            hierarchy = []
+        hierarchy = display_hierarchy(doc)
 
         # When the body includes highlighted terms, summarization shortens
         # the text to a max length. But if the body doesn't have any highlighted
@@ -71,7 +128,7 @@ def transform_documents(docs: List[Any],
         transformed.append({
             "title": unescape(doc.title),
             "section_title": unescape(doc.section_title),
-            "hierarchy": [unescape(h) for h in hierarchy],
+            "hierarchy": hierarchy,
             "body": unescape(doc.body),
             "url": doc.url
         })
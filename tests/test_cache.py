@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from sitesearch.cache import IndexGenerations, SearchResultCache, SharedResultCache
+from sitesearch.keys import Keys
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.gets = 0
+
+    async def get(self, key):
+        self.gets += 1
+        return self.data.get(key)
+
+
+def test_cache_returns_cached_results_and_counts_hits():
+    cache = SearchResultCache(max_size=10, ttl=60)
+    cache.set("key", {"total": 1})
+
+    assert cache.get("key") == {"total": 1}
+    assert cache.get("missing") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1, "max_size": 10}
+
+
+def test_cache_expires_entries_after_ttl():
+    clock = FakeClock()
+    cache = SearchResultCache(max_size=10, ttl=60, clock=clock)
+    cache.set("key", {"total": 1})
+
+    clock.now = 61
+
+    assert cache.get("key") is None
+
+
+def test_cache_evicts_least_recently_used_entry():
+    cache = SearchResultCache(max_size=2, ttl=60)
+    cache.set("one", 1)
+    cache.set("two", 2)
+    cache.get("one")
+    cache.set("three", 3)
+
+    assert cache.get("two") is None
+    assert cache.get("one") == 1
+    assert cache.get("three") == 3
+
+
+@pytest.mark.asyncio
+async def test_index_generations_are_rechecked_after_interval():
+    clock = FakeClock()
+    redis = FakeRedis()
+    keys = Keys("test")
+    generations = IndexGenerations(redis, keys, refresh_interval=1, clock=clock)
+
+    assert await generations.get("https://example.com") == "0"
+
+    redis.data[keys.index_generation("https://example.com")] = "1"
+    assert await generations.get("https://example.com") == "0"
+
+    clock.now = 1
+    assert await generations.get("https://example.com") == "1"
+    assert redis.gets == 2
+
+
+class FakeSharedRedis(FakeRedis):
+    async def set(self, key, value, nx=False, px=None, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+
+@pytest.mark.asyncio
+async def test_shared_cache_reads_entries_from_the_read_client():
+    redis = FakeSharedRedis()
+    replica = FakeRedis()
+    cache = SharedResultCache(redis, Keys("test"), ttl=60, read_client=replica)
+    key = cache.key("https://example.com", "1", ("q",))
+    replica.data[key] = '{"total": 2}'
+
+    async def compute():
+        raise AssertionError("The entry is cached")
+
+    assert await cache.get_or_compute("https://example.com", "1", ("q",), compute) == {"total": 2}
+    assert replica.gets == 1
+    assert redis.gets == 0
+
+
+@pytest.mark.asyncio
+async def test_shared_cache_runs_one_search_for_concurrent_misses():
+    redis = FakeSharedRedis()
+    cache = SharedResultCache(redis, Keys("test"), ttl=60)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"total": 1}
+
+    results = await asyncio.gather(
+        *[cache.get_or_compute("https://example.com", "1", ("q",), compute) for _ in range(5)])
+
+    assert results == [{"total": 1}] * 5
+    assert len(calls) == 1
+    assert await cache.get_or_compute("https://example.com", "1", ("q",), compute) == {"total": 1}
+    assert cache.hits == 1
@@ -0,0 +1,125 @@
+import pytest
+from aioredis.exceptions import ConnectionError
+
+from sitesearch.connections import ReadRouter, Replica, parse_replicas
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeClient:
+    def __init__(self, name, fail=False):
+        self.name = name
+        self.fail = fail
+        self.commands = []
+
+    async def execute_command(self, *args):
+        self.commands.append(args)
+        if self.fail:
+            raise ConnectionError("Connection refused")
+        return self.name
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def execute_command(self, *args):
+        self.commands.append(args)
+        return self
+
+    async def execute(self, raise_on_error=True):
+        return [await self.client.execute_command(*args) for args in self.commands]
+
+
+def test_parse_replicas():
+    assert parse_replicas("replica-1:6380, replica-2,") == [("replica-1", 6380), ("replica-2", 6379)]
+    assert parse_replicas("") == []
+
+
+@pytest.mark.asyncio
+async def test_reads_go_to_least_loaded_replica():
+    primary = FakeClient("primary")
+    busy = Replica("busy", FakeClient("busy"), outstanding=2)
+    slow = Replica("slow", FakeClient("slow"), latency=0.5)
+    fast = Replica("fast", FakeClient("fast"), latency=0.1)
+    router = ReadRouter(primary, [busy, slow, fast])
+
+    assert await router.execute_command("FT.SEARCH", "index", "redis") == "fast"
+    assert fast.outstanding == 0
+    assert primary.commands == []
+
+
+@pytest.mark.asyncio
+async def test_reads_fall_back_to_primary_when_a_replica_fails():
+    clock = FakeClock()
+    primary = FakeClient("primary")
+    replica = Replica("replica", FakeClient("replica", fail=True))
+    router = ReadRouter(primary, [replica], retry_seconds=5, clock=clock)
+
+    assert await router.execute_command("FT.SEARCH", "index", "redis") == "primary"
+    assert replica.failures == 1
+
+    # The replica gets a rest...
+    assert await router.execute_command("FT.SEARCH", "index", "redis") == "primary"
+    assert len(replica.client.commands) == 1
+
+    # ...and then we try it again.
+    clock.now = 6
+    replica.client.fail = False
+    assert await router.execute_command("FT.SEARCH", "index", "redis") == "replica"
+    assert router.stats()["fallbacks"] == 1
+
+
+@pytest.mark.asyncio
+async def test_reads_go_to_primary_without_replicas():
+    router = ReadRouter(FakeClient("primary"), [])
+    assert await router.execute_command("FT.SEARCH", "index", "redis") == "primary"
+
+
+@pytest.mark.asyncio
+async def test_pipelines_fall_back_to_primary_when_a_replica_fails():
+    primary = FakeClient("primary")
+    replica = Replica("replica", FakeClient("replica", fail=True))
+    router = ReadRouter(primary, [replica])
+
+    pipeline = router.pipeline(transaction=False)
+    pipeline.execute_command("FT.SEARCH", "index", "redis")
+    pipeline.execute_command("FT.SEARCH", "index", "python")
+
+    assert await pipeline.execute() == ["primary", "primary"]
+    assert len(primary.commands) == 2
+    assert replica.failures == 1
+    assert replica.outstanding == 0
+    assert router.stats()["fallbacks"] == 1
+
+
+@pytest.mark.asyncio
+async def test_pipelines_count_against_the_replica_they_go_to():
+    clock = FakeClock()
+    replica = Replica("replica", FakeClient("replica"))
+    router = ReadRouter(FakeClient("primary"), [replica], clock=clock)
+
+    pipeline = router.pipeline()
+    pipeline.execute_command("FT.SEARCH", "index", "redis")
+    original_execute = replica.client.execute_command
+
+    async def slow_execute(*args):
+        assert replica.outstanding == 1
+        clock.now += 1
+        return await original_execute(*args)
+
+    replica.client.execute_command = slow_execute
+
+    assert await pipeline.execute() == ["replica"]
+    assert replica.outstanding == 0
+    assert replica.latency > 0
@@ -0,0 +1,30 @@
+import pytest
+
+from sitesearch.cursor import MAX_PAGES, SearchCursor, page_digest
+
+
+def test_cursor_round_trips():
+    cursor = SearchCursor(37, {page_digest("https://example.com/a"), page_digest("https://example.com/b")})
+
+    token = cursor.encode()
+
+    assert "=" not in token
+    assert SearchCursor.decode(token) == cursor
+    assert SearchCursor.decode(SearchCursor().encode()) == SearchCursor()
+
+
+def test_a_number_is_a_cursor_with_no_pages():
+    assert SearchCursor.decode("20") == SearchCursor(20)
+
+
+def test_cursor_only_keeps_the_last_pages():
+    cursor = SearchCursor(10, range(MAX_PAGES * 3))
+
+    assert cursor.pages == tuple(range(MAX_PAGES * 2, MAX_PAGES * 3))
+    assert len(cursor.encode()) == len(SearchCursor(10, range(MAX_PAGES)).encode())
+
+
+@pytest.mark.parametrize("token", ["!", "cAAA", "cAAAAJQA", "AAAAJQ", "-1"])
+def test_cursor_rejects_bad_tokens(token):
+    with pytest.raises(ValueError):
+        SearchCursor.decode(token)
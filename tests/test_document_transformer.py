@@ -1,9 +1,12 @@
+import json
+
 import pytest
+import ujson
 
 from redisearch import Document
 from sitesearch.config import AppConfiguration
 from sitesearch.models import TYPE_PAGE
-from sitesearch.transformer import transform_documents
+from sitesearch.transformer import RawJSON, json_default, transform_documents
 
 
 config = AppConfiguration()
@@ -50,7 +53,7 @@ async def test_transform_documents_decodes_hierarchy():
         id="123",
         title="Title",
         section_title="Section",
-        hierarchy='["one","two"]',
+        display_hierarchy='["one","two"]',
         url="http://example.com/1",
         body="This is the body",
         type=TYPE_PAGE,
@@ -59,7 +62,10 @@ async def test_transform_documents_decodes_hierarchy():
 
     docs = transform_documents([doc], config.default_search_site, 'test')
 
-    assert docs[0]['hierarchy'] == ["one", "two"]
+    # We serve the hierarchy the indexer stored without decoding it.
+    assert docs[0]['hierarchy'] == RawJSON('["one","two"]')
+    assert ujson.dumps(docs[0]['hierarchy']) == '["one","two"]'
+    assert json.loads(json.dumps(docs[0], default=json_default))['hierarchy'] == ["one", "two"]
 
 
 @pytest.mark.asyncio
@@ -68,7 +74,7 @@ async def test_transform_documents_raises_parse_error_with_bad_hierarchy():
         id="123",
         title="Title",
         section_title="Section",
-        hierarchy='bad json',
+        display_hierarchy='bad json',
         url="http://example.com/1",
         body="This is the body",
         type=TYPE_PAGE,
@@ -108,3 +114,40 @@ async def test_transform_documents_unescapes_backslashes():
     assert docs[0]['section_title'] == "Section-1"
     assert docs[0]['body'] == "This is the body-"
 
+
+
+@pytest.mark.asyncio
+async def test_transform_documents_uses_display_hierarchy():
+    doc = Document(
+        id="123",
+        title="Title",
+        section_title="Section",
+        hierarchy='["Active\\\\-Active", "two"]',
+        display_hierarchy='["Active-Active", "two"]',
+        url="http://example.com/1",
+        body="This is the body",
+        type=TYPE_PAGE,
+        position=0
+    )
+
+    docs = transform_documents([doc], config.default_search_site, 'test')
+
+    assert docs[0]['hierarchy'] == RawJSON('["Active-Active", "two"]')
+
+
+@pytest.mark.asyncio
+async def test_transform_documents_unescapes_hierarchy_without_display_hierarchy():
+    doc = Document(
+        id="123",
+        title="Title",
+        section_title="Section",
+        hierarchy='["Active\\\\-Active", "two"]',
+        url="http://example.com/1",
+        body="This is the body",
+        type=TYPE_PAGE,
+        position=0
+    )
+
+    docs = transform_documents([doc], config.default_search_site, 'test')
+
+    assert docs[0]['hierarchy'] == ["Active-Active", "two"]
@@ -0,0 +1,230 @@
+from dataclasses import replace
+from unittest import mock
+
+import pytest
+from scrapy.http import Request, Response
+
+from sitesearch.connections import get_redis_connection
+from sitesearch.frontier import FRONTIER_ENTRY, KEYS_TTL, CrawlFrontier, FrontierMiddleware, \
+    FrontierScheduler, frontier_entry, parse_frontier_entry, url_fingerprint
+from sitesearch.indexer import DocumentationSpiderBase
+from sitesearch.keys import Keys
+from sitesearch.models import PageManifestEntry
+
+KEYS = Keys("sitesearch:test")
+
+
+@pytest.fixture()
+def frontier(site):
+    redis = mock.MagicMock()
+    redis.register_script.side_effect = lambda script: mock.MagicMock()
+    yield CrawlFrontier(redis, KEYS, site.url, worker_id="worker")
+
+
+@pytest.fixture()
+def redis_frontier(site):
+    """A frontier in the test Redis, to run our scripts against."""
+    yield CrawlFrontier(get_redis_connection(), KEYS, site.url, worker_id="worker")
+
+
+def spider_for(site, frontier, coordinator=True, **site_config):
+    manifest = {
+        f"{site.url}/page/": PageManifestEntry(
+            url=f"{site.url}/page/", title="Page", etag='"abc"', last_modified="",
+            content_hash="", doc_ids=("one", ), links=())
+    }
+    Spider = type('Spider', (DocumentationSpiderBase, ), {
+        "site_config": replace(site, **site_config),
+        "manifest": manifest,
+        "frontier": frontier,
+        "coordinator": coordinator,
+    })
+    return Spider()
+
+
+def scheduler_for(spider):
+    scheduler = FrontierScheduler(crawler=None)
+    scheduler.open(spider)
+    return scheduler
+
+
+def test_frontier_entries_carry_the_sitemap_lastmod(site):
+    url = f"{site.url}/page/"
+    assert parse_frontier_entry(frontier_entry(url)) == (url, "")
+    assert parse_frontier_entry(frontier_entry(url, "2021-02-01")) == (url, "2021-02-01")
+
+
+def test_frontier_keys_share_a_hash_tag(frontier):
+    for key in frontier.all_keys:
+        assert "{crawl}" in key
+
+
+def test_frontier_keys_expire_unless_workers_keep_them_alive(frontier):
+    frontier.heartbeat()
+
+    pipeline = frontier.redis.pipeline.return_value
+    pipeline.zadd.assert_called_once_with(frontier.workers_key, {"worker": mock.ANY})
+    assert [c.args for c in pipeline.expire.call_args_list] == \
+        [(key, KEYS_TTL) for key in frontier.all_keys]
+
+
+def test_scheduler_shares_page_requests(site, frontier):
+    spider = spider_for(site, frontier)
+    scheduler = scheduler_for(spider)
+    url = f"{site.url}/new/"
+    frontier.add_script.return_value = 1
+
+    assert scheduler.enqueue_request(spider.page_request(url, "2021-02-01"))
+    assert scheduler.enqueue_request(spider.page_request(f"{url}2/"))
+    assert len(scheduler) == 0
+    # We add the links of a page all at once, after we've handled it.
+    frontier.add_script.assert_not_called()
+
+    frontier.flush()
+
+    pipeline = frontier.redis.pipeline.return_value
+    frontier.add_script.assert_called_once_with(
+        keys=[KEYS.crawl_seen(site.url), KEYS.crawl_frontier(site.url)],
+        args=["0", url_fingerprint(url), f"{url} 2021-02-01",
+              url_fingerprint(f"{url}2/"), f"{url}2/"],
+        client=pipeline)
+    pipeline.execute.assert_called_once_with()
+
+
+def test_scheduler_keeps_sitemap_requests_in_flight_locally(site, frontier):
+    sitemap_url = f"{site.url}/sitemap.xml"
+    spider = spider_for(site, frontier, sitemap_url=sitemap_url)
+    scheduler = scheduler_for(spider)
+
+    start, = spider.start_requests()
+    assert scheduler.enqueue_request(start)
+
+    entry = f"local:worker {sitemap_url}"
+    frontier.redis.zadd.assert_called_once_with(KEYS.crawl_in_flight(site.url),
+                                                {entry: mock.ANY})
+    request = scheduler.next_request()
+    assert request.url == sitemap_url
+    assert request.meta[FRONTIER_ENTRY] == entry
+    frontier.pop_script.assert_not_called()
+
+
+def test_only_the_coordinator_requests_the_sitemap(site, frontier):
+    sitemap_url = f"{site.url}/sitemap.xml"
+    assert list(spider_for(site, frontier, coordinator=False,
+                           sitemap_url=sitemap_url).start_requests()) == []
+    # The coordinator put the start URL in the frontier when it started.
+    assert list(spider_for(site, frontier).start_requests()) == []
+
+
+def test_scheduler_requests_pages_from_the_frontier(site, frontier):
+    spider = spider_for(site, frontier)
+    scheduler = scheduler_for(spider)
+    entry = f"{site.url}/page/ 2021-02-01"
+    frontier.pop_script.return_value = [entry]
+
+    request = scheduler.next_request()
+
+    assert request.url == f"{site.url}/page/"
+    assert request.callback == spider.parse
+    assert request.cb_kwargs == {"lastmod": "2021-02-01"}
+    assert request.headers[b"If-None-Match"] == b'"abc"'
+    assert request.meta[FRONTIER_ENTRY] == entry
+
+    # A retry of the request is still in flight, so we keep it.
+    assert scheduler.enqueue_request(request.replace(dont_filter=True))
+    assert scheduler.next_request().url == request.url
+    frontier.add_script.assert_not_called()
+
+
+def test_coordinator_waits_for_other_workers(site, frontier):
+    frontier.redis.pipeline.return_value.execute.return_value = [0, 0]
+    frontier.redis.zrangebyscore.return_value = ["worker", "helper"]
+
+    assert scheduler_for(spider_for(site, frontier)).has_pending_requests()
+    assert not scheduler_for(spider_for(site, frontier, coordinator=False)).has_pending_requests()
+
+    frontier.redis.zrangebyscore.return_value = ["worker"]
+    assert not scheduler_for(spider_for(site, frontier)).has_pending_requests()
+
+
+def test_middleware_marks_pages_done_after_their_output(site, frontier):
+    spider = spider_for(site, frontier)
+    request = Request(f"{site.url}/page/", meta={FRONTIER_ENTRY: "entry"})
+    response = Response(request.url, request=request)
+
+    output = FrontierMiddleware().process_spider_output(response, iter(["item", "link"]), spider)
+    assert next(output) == "item"
+    frontier.redis.zrem.assert_not_called()
+
+    assert list(output) == ["link"]
+    pipeline = frontier.redis.pipeline.return_value
+    pipeline.zrem.assert_called_once_with(KEYS.crawl_in_flight(site.url), "entry")
+    pipeline.execute.assert_called_once_with()
+
+
+def test_frontier_writes_buffered_pages_and_links_in_one_round_trip(site, frontier):
+    frontier.add_later(f"{site.url}/a/")
+    frontier.add_later(f"{site.url}/b/", dont_filter=True)
+    frontier.record_page_later(f"{site.url}/page/", "{}")
+
+    frontier.flush(done="entry")
+
+    pipeline = frontier.redis.pipeline.return_value
+    assert [c.kwargs["args"][0] for c in frontier.add_script.call_args_list] == ["0", "1"]
+    pipeline.hset.assert_called_once_with(KEYS.page_manifest_new(site.url),
+                                          mapping={f"{site.url}/page/": "{}"})
+    pipeline.zrem.assert_called_once_with(KEYS.crawl_in_flight(site.url), "entry")
+    pipeline.execute.assert_called_once_with()
+    assert not frontier.has_buffered
+
+    # With nothing to write, we don't make a round trip.
+    frontier.flush()
+    frontier.redis.pipeline.assert_called_once()
+
+
+def test_add_script_skips_urls_a_worker_has_seen(site, redis_frontier):
+    a, b, c = (f"{site.url}/{path}/" for path in "abc")
+
+    assert redis_frontier.add([a, f"{b} 2021-02-01"]) == 2
+    # Fragments don't make a URL new.
+    assert redis_frontier.add([f"{a}#section", c]) == 1
+    assert redis_frontier.add([a], dont_filter=True) == 1
+
+    assert redis_frontier.redis.scard(redis_frontier.seen_key) == 3
+    # The frontier is first in, first out.
+    assert redis_frontier.pop(10) == [a, f"{b} 2021-02-01", c, a]
+
+
+def test_pop_script_takes_entries_in_flight(site, redis_frontier):
+    entries = [f"{site.url}/{path}/" for path in "abc"]
+    redis_frontier.add(entries)
+
+    assert redis_frontier.pop(2) == entries[:2]
+    assert redis_frontier.pop(2) == entries[2:]
+    assert redis_frontier.pop(2) == []
+
+    in_flight = redis_frontier.redis.zrange(redis_frontier.in_flight_key, 0, -1)
+    assert sorted(in_flight) == sorted(entries)
+    assert not redis_frontier.is_drained()
+
+    for entry in entries:
+        redis_frontier.done(entry)
+    assert redis_frontier.is_drained()
+
+
+def test_requeue_script_puts_stalled_pages_back(site, redis_frontier):
+    page = f"{site.url}/page/"
+    redis_frontier.add([page])
+    redis_frontier.pop()
+    local = redis_frontier.add_local(f"{site.url}/sitemap.xml")
+
+    # Nothing has been in flight for long.
+    assert redis_frontier.requeue_stalled() == 0
+
+    assert redis_frontier.requeue_stalled(timeout=-1) == 2
+
+    # Only this worker makes its local requests, so we don't requeue them.
+    assert redis_frontier.redis.zcard(redis_frontier.in_flight_key) == 0
+    assert redis_frontier.pop() == [page]
+    assert local not in redis_frontier.redis.lrange(redis_frontier.frontier_key, 0, -1)
+
@@ -1,7 +1,11 @@
+import asyncio
 import time
 
 import pytest
 
+from sitesearch.api import health
+from sitesearch.connections import Replica
+
 
 @pytest.mark.skip("This does not work properly in test at the moment.")
 def test_no_content(client):
@@ -13,3 +17,114 @@ def test_no_content(client):
 def test_with_content(docs, client):
     result = client.simulate_get('/health')
     assert result.status_code == 200
+
+
+class FakeRedis:
+    def __init__(self, replication=None, info_delay=0.0):
+        self.replication = replication or {"role": "master"}
+        self.info_delay = info_delay
+        self.calls = 0
+
+    async def ping(self):
+        self.calls += 1
+        return True
+
+    async def info(self, section):
+        return self.replication
+
+    async def execute_command(self, *args):
+        await asyncio.sleep(self.info_delay)
+        return ["index_name", args[1], "num_docs", "10"]
+
+
+STALE_REPLICA = {
+    "role": "slave",
+    "master_link_status": "down",
+    "master_last_io_seconds_ago": 30
+}
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    def fn(replicas=(), **kwargs):
+        redis = FakeRedis(**kwargs)
+        monkeypatch.setattr(health, "redis_client", redis)
+        monkeypatch.setattr(health, "readiness", health.ReadinessReport())
+        monkeypatch.setattr(health.connections.reads, "replicas", list(replicas))
+        return redis
+
+    return fn
+
+
+@pytest.mark.asyncio
+async def test_ready(fake_redis, client, app_config):
+    redis = fake_redis()
+    result = await client.get('/ready')
+
+    assert result.status_code == 200
+    report = result.json()
+    assert report["ready"]
+    assert set(report["sites"]) == set(app_config.sites)
+    assert all(site["num_docs"] == 10 for site in report["sites"].values())
+
+    # Probes get the cached report.
+    await client.get('/ready')
+    assert redis.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_not_ready_with_stale_replica(fake_redis, client):
+    fake_redis(replication=STALE_REPLICA)
+    result = await client.get('/ready')
+
+    assert result.status_code == 503
+    assert result.json()["replication"] == {
+        "ok": False,
+        "role": "slave",
+        "link_status": "down",
+        "lag_seconds": 30
+    }
+
+
+@pytest.mark.asyncio
+async def test_readiness_checks_have_a_time_budget(fake_redis, client):
+    fake_redis(info_delay=health.READINESS_TIMEOUT_SECONDS * 4)
+    start = time.perf_counter()
+    result = await client.get('/ready')
+
+    assert time.perf_counter() - start < health.READINESS_TIMEOUT_SECONDS * 2
+    assert result.status_code == 503
+    assert all(site == {"ok": False, "error": "timeout"}
+               for site in result.json()["sites"].values())
+
+
+@pytest.mark.asyncio
+async def test_ready_checks_every_read_replica(fake_redis, client):
+    stale = Replica(name="stale:6379", client=FakeRedis(replication=STALE_REPLICA))
+    current = Replica(name="current:6379", client=FakeRedis(replication={
+        "role": "slave",
+        "master_link_status": "up",
+        "master_last_io_seconds_ago": 1
+    }))
+    fake_redis(replication=STALE_REPLICA, replicas=[stale, current])
+
+    result = await client.get('/ready')
+
+    assert result.status_code == 200
+    report = result.json()
+    assert not report["replication"]["ok"]
+    assert not report["replicas"]["stale:6379"]["ok"]
+    assert report["replicas"]["current:6379"]["ok"]
+    # Searches stop reading from the stale replica.
+    assert health.connections.reads.choose() is current
+
+
+@pytest.mark.asyncio
+async def test_not_ready_without_a_healthy_replica_or_primary(fake_redis, client):
+    stale = Replica(name="stale:6379", client=FakeRedis(replication=STALE_REPLICA))
+    fake_redis(replication=STALE_REPLICA, replicas=[stale])
+
+    result = await client.get('/ready')
+
+    assert result.status_code == 503
+    assert not result.json()["ready"]
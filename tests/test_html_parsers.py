@@ -0,0 +1,123 @@
+import os
+from dataclasses import replace
+
+import pytest
+from bs4 import BeautifulSoup
+
+from sitesearch.errors import ParseError
+from sitesearch.html_parsers import BeautifulSoupBackend, LxmlBackend, get_html_backend
+from sitesearch.indexer import DocumentParser
+from sitesearch.sites.redis_labs import OLD_DOCS_PROD
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "documents")
+DOCUMENTS = sorted(f for f in os.listdir(DOCS_DIR) if f.endswith(".html"))
+
+TEST_URL = f"{OLD_DOCS_PROD.url}/test"
+
+EDGE_CASES = """
+<html><head><title>Edge cases | Docs</title></head>
+<body><div class="main-content">intro
+<h2>First</h2>  <!-- a comment --> text <b>bold <!-- hidden --></b>
+  <pre>  keep   this  </pre>   <script>var x = 1;</script>tail
+<h3>Sub</h3><p>one  <i> </i> two</p>
+<h2><a href="#">Linked</a> <span>title</span></h2><div><h2>Nested</h2>inner<p>after</p></div>
+<p>last &amp; <b>more</b></p> <style>p { color: red; }</style>
+</div></body></html>
+"""
+
+
+def read_document(filename, mode='r'):
+    with open(os.path.join(DOCS_DIR, filename), mode) as f:
+        return f.read()
+
+
+def next_element(elem):
+    while elem is not None:
+        elem = elem.next_sibling
+        if hasattr(elem, 'name'):
+            return elem
+
+
+def reference_sections(html, content_classes):
+    """
+    Extract sections the way DocumentParser originally did: by re-parsing the
+    HTML of the siblings of each heading.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    content = soup
+    for content_class in content_classes or []:
+        main_content = soup.select(content_class)
+        if main_content:
+            content = main_content[0]
+            break
+
+    h2s = content.find_all('h2') or content.find_all('h3')
+    sections = []
+
+    for tag in h2s:
+        origin = tag
+        if tag and tag.string is None:
+            tag = tag.find("a")
+        part_title = tag.get_text() if tag else ""
+
+        page = []
+        elem = next_element(origin)
+        while elem and elem.name != 'h2':
+            page.append(str(elem))
+            elem = next_element(elem)
+
+        body = BeautifulSoup('\n'.join(page), 'html.parser').get_text()
+        sections.append((part_title, body))
+
+    return content.get_text(), sections
+
+
+def parse(parser, html):
+    """Parse a page, returning the error instead if the page is invalid."""
+    try:
+        return parser.parse(TEST_URL, html)
+    except ParseError as e:
+        return str(e)
+
+
+@pytest.mark.parametrize("filename", DOCUMENTS)
+def test_lxml_backend_parses_documents_like_beautifulsoup(filename):
+    site = OLD_DOCS_PROD
+    html = read_document(filename)
+    expected = parse(DocumentParser(site), html)
+    lxml_parser = DocumentParser(replace(site, html_parser='lxml'))
+
+    assert parse(lxml_parser, html) == expected
+    assert parse(lxml_parser, read_document(filename, 'rb')) == expected
+
+
+@pytest.mark.parametrize("filename", DOCUMENTS)
+@pytest.mark.parametrize("content_classes", [None, OLD_DOCS_PROD.content_classes])
+def test_beautifulsoup_backend_extracts_sections_in_one_pass(filename, content_classes):
+    html = read_document(filename)
+    parsed = BeautifulSoupBackend().parse(html, content_classes)
+
+    assert (parsed.body, parsed.sections) == reference_sections(html, content_classes)
+
+
+@pytest.mark.parametrize("content_classes", [None, (".main-content", )])
+def test_beautifulsoup_backend_edge_cases(content_classes):
+    parsed = BeautifulSoupBackend().parse(EDGE_CASES, content_classes)
+
+    assert (parsed.body, parsed.sections) == reference_sections(EDGE_CASES, content_classes)
+
+
+@pytest.mark.parametrize("content_classes", [None, (".main-content", )])
+def test_lxml_backend_extracts_sections_like_beautifulsoup(content_classes):
+    expected = BeautifulSoupBackend().parse(EDGE_CASES, content_classes)
+    parsed = LxmlBackend().parse(EDGE_CASES, content_classes)
+
+    assert parsed.title == expected.title
+    assert parsed.sections == expected.sections
+    assert parsed.body.strip() == expected.body.strip()
+
+
+def test_unknown_html_backend():
+    with pytest.raises(ValueError):
+        get_html_backend("selectolax")
@@ -1,14 +1,24 @@
+import gzip
+import json
 import os
+import pickle
+from queue import Queue
+from threading import Thread
+from dataclasses import asdict, replace
 from unittest import mock
 from unittest.mock import call
 
 import pytest
+from scrapy.http import Request, Response, XmlResponse
 
 from sitesearch.keys import Keys
 from sitesearch.sites.redis_labs import OLD_DOCS_PROD
 from sitesearch.errors import ParseError
-from sitesearch.indexer import DocumentParser, Indexer, md5, SECTION_ID, PAGE_ID, page_id, section_id
-from sitesearch.models import SearchDocument
+from sitesearch.indexer import DocIdSet, DocumentParser, DocumentationSpiderBase, Indexer, md5, \
+    SECTION_ID, PAGE_ID, page_id, section_id, page_url, parse_page, \
+    start_parser_pool
+from sitesearch.models import PageManifestEntry, SearchDocument
+from sitesearch.snapshot import SnapshotWriter
 
 DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
                         "documents")
@@ -24,6 +34,12 @@ FILE_WITH_H3s = "file_with_h3s.html"
 TEST_URL = f"{OLD_DOCS_PROD.url}/test"
 
 
+def manifest_entry(url, doc_ids, changed=True):
+    return PageManifestEntry(url=url, title="Page", etag="", last_modified="",
+                             content_hash="", doc_ids=tuple(doc_ids), links=(),
+                             changed=changed)
+
+
 @pytest.fixture()
 def indexer(app_config):
     mock_search_client = mock.MagicMock()
@@ -84,6 +100,7 @@ def test_indexer_indexes_page_document(index_file, keys, site):
         'title': 'Database Persistence with Redis Enterprise Software',
         'section_title': '',
         'hierarchy': '[]',
+        'display_hierarchy': '[]',
         'url': TEST_URL,
         's': 'test',
         'body': 'All data is stored and managed exclusively in either RAM or RAM + Flash Memory (Redis on Flash) and therefore, is at risk of being lost upon a process or server failure. As Redis Enterprise Software is not just a caching solution, but also a full-fledged database, persistence to disk is critical. Therefore, Redis Enterprise Software supports persisting data to disk on a per-database basis and in multiple ways. There are two options for persistence:  Append Only File (AOF) - A continuous writing of data to disk Snapshot (RDB) - An automatic periodic snapshot writing to disk  Data persistence, via either mechanism, is used solely to rehydrate the database if the database process fails for any reason. It is not a replacement for backups, but something you do in addition to backups. To disable data persistence, select None. AOF writes the latest ‘write’ commands into a file every second, it resembles a traditional RDBMS’s redo log, if you are familiar with that. This file can later be ‘replayed’ in order to recover from a crash. A snapshot (RDB) on the other hand, is performed every one, six, or twelve hours. The snapshot is a dump of the data and while there is a potential of losing up to one hour of data, it is dramatically faster to recover from a snapshot compared to AOF recovery. Persistence can be configured either at time of database creation or by editing an existing database’s configuration. While the persistence model can be changed dynamically, just know that it can take time for your database to switch from one persistence model to the other. It depends on what you are switching from and to, but also on the size of your database. Note: For performance reasons, if you are going to be using AOF, it is highly recommended to make sure replication is enabled for that database as well. When these two features are enabled, persistence is performed on the database slave and does not impact performance on the master. Options for configuring data persistence There are six options for persistence in Redis Enterprise Software:    Options Description     None Data is not persisted to disk at all.   Append Only File (AoF) on every write Data is fsynced to disk with every write.   Append Only File (AoF) one second Data is fsynced to disk every second.   Snapshot every 1 hour A snapshot of the database is created every hour.   Snapshot every 6 hours A snapshot of the database is created every 6 hours.   Snapshot every 12 hours A snapshot of the database is created every 12 hours.    The first thing you need to do is determine if you even need persistence. Persistence is used to recover from a catastrophic failure, so make sure that you need to incur the overhead of persistence before you select it. If the database is being used as a cache, then you may not need persistence. If you do need persistence, then you need to identify which is the best type for your use case. Append only file (AOF) vs snapshot (RDB) Now that you know the available options, to assist in making a decision on which option is right for your use case, here is a table about the two:    Append Only File (AOF) Snapshot (RDB)     More resource intensive Less resource intensive   Provides better durability (recover the latest point in time) Less durable   Slower time to recover (Larger files) Faster recovery time   More disk space required (files tend to grow large and require compaction) Requires less resource (I/O once every several hours and no compaction required)    Data persistence and Redis on Flash with Active\-Active active\-active If you are enabling data persistence for databases running on Redis Enterprise Flash, by default both master and slave shards are configured to write to disk. This is unlike a standard Redis Enterprise Software database where only the slave shards persist to disk. This master and slave dual data persistence with replication is done to better protect the database against node failures. Flash-based databases are expected to hold larger datasets and repair times for shards can be longer under node failures. Having dual-persistence provides better protection against failures under these longer repair times. However, the dual data persistence with replication adds some processor and network overhead, especially in the case of cloud configurations with persistent storage that is network attached (e.g. EBS-backed volumes in AWS). The redis version is v6\.2\.8 Another redis version is v6\.2\.4 3rd Redis version test: the version is v6\.0\.20 4th Redis version test: the version is v6\.0\.12 5th Redis version test: the version is v6\.0\.8 6th Redis version test: the version is v6\.0 7th Redis version test: the version is v5\.6\.0 8th Redis version test: the version is v5\.4\.14 9th Redis version test: the version is v5\.4\.10 10th Redis version test: the version is v5\.4\.6 11th Redis version test: the version is v5\.4\.4 12th Redis version test: the version is v5\.4\.2 13th Redis version test: the version is v5\.4 There may be times where performance is critical for your use case and you don’t want to risk data persistence adding latency. If that is the case, you can disable data-persistence on the master shards using the following rladmin command: rladmin tune db db: master_persistence disabled     Page Contents   Options for configuring data persistence   Append only file (AOF) vs snapshot (RDB)   Data persistence and Redis on Flash', 
@@ -119,6 +136,7 @@ def test_indexer_indexes_page_section_documents(index_file, keys, site):
         'title': 'Database Persistence with Redis Enterprise Software',
         'section_title': 'Options for configuring data persistence',
         'hierarchy': '[]',
+        'display_hierarchy': '[]',
         'url': TEST_URL,
         's': 'test',
         'body':
@@ -131,6 +149,7 @@ def test_indexer_indexes_page_section_documents(index_file, keys, site):
         'title': 'Database Persistence with Redis Enterprise Software',
         'section_title': 'Append only file (AOF) vs snapshot (RDB)',
         'hierarchy': '[]',
+        'display_hierarchy': '[]',
         'url': TEST_URL,
         's': 'test',
         'body':
@@ -144,6 +163,7 @@ def test_indexer_indexes_page_section_documents(index_file, keys, site):
         'section_title': 'Data persistence and Redis on Flash with Active\\-Active',
         's': 'test',
         'hierarchy': '[]',
+        'display_hierarchy': '[]',
         'url': TEST_URL,
         'body':
         "active\-active If you are enabling data persistence for databases running on Redis Enterprise Flash, by default both master and slave shards are configured to write to disk. This is unlike a standard Redis Enterprise Software database where only the slave shards persist to disk. This master and slave dual data persistence with replication is done to better protect the database against node failures. Flash-based databases are expected to hold larger datasets and repair times for shards can be longer under node failures. Having dual-persistence provides better protection against failures under these longer repair times. However, the dual data persistence with replication adds some processor and network overhead, especially in the case of cloud configurations with persistent storage that is network attached (e.g. EBS-backed volumes in AWS). The redis version is v6\.2\.8 Another redis version is v6\.2\.4 3rd Redis version test: the version is v6\.0\.20 4th Redis version test: the version is v6\.0\.12 5th Redis version test: the version is v6\.0\.8 6th Redis version test: the version is v6\.0 7th Redis version test: the version is v5\.6\.0 8th Redis version test: the version is v5\.4\.14 9th Redis version test: the version is v5\.4\.10 10th Redis version test: the version is v5\.4\.6 11th Redis version test: the version is v5\.4\.4 12th Redis version test: the version is v5\.4\.2 13th Redis version test: the version is v5\.4 There may be times where performance is critical for your use case and you don’t want to risk data persistence adding latency. If that is the case, you can disable data-persistence on the master shards using the following rladmin command: rladmin tune db db: master_persistence disabled",
@@ -203,6 +223,105 @@ def test_build_hierarchy(indexer):
     assert indexer.build_hierarchy(doc) == ['One', 'Two', 'Three']
 
 
+def test_indexer_stores_unescaped_display_hierarchy(indexer):
+    indexer.seen_urls = {
+        "https://docs.redislabs.com/latest/1": "Active\\-Active",
+        "https://docs.redislabs.com/latest/1/2": "Two",
+    }
+    doc = SearchDocument(doc_id="123",
+                         title="Title",
+                         section_title="Section",
+                         hierarchy=[],
+                         s="",
+                         url="https://docs.redislabs.com/latest/1/2/",
+                         body="This is the body",
+                         type='page',
+                         position=0)
+    doc_dict = indexer.document_to_dict(doc)
+
+    assert json.loads(doc_dict['hierarchy']) == ['Active\\-Active', 'Two']
+    assert json.loads(doc_dict['display_hierarchy']) == ['Active-Active', 'Two']
+
+
+def test_indexer_scores_documents_by_their_hierarchy(indexer):
+    doc = SearchDocument(doc_id="123",
+                         title="Title",
+                         section_title="",
+                         hierarchy=[],
+                         s="",
+                         url="https://docs.redislabs.com/latest/1/2/",
+                         body="This is the body",
+                         type='page',
+                         position=0)
+    top_level_score = indexer.document_to_dict(doc)['__score']
+
+    indexer.seen_urls = {
+        "https://docs.redislabs.com/latest/1": "One",
+        "https://docs.redislabs.com/latest/1/2": "Two",
+    }
+
+    assert indexer.document_to_dict(doc)['__score'] < top_level_score
+
+
+def test_indexer_fixes_hierarchies_that_changed_after_writing(indexer, keys, site):
+    def doc(doc_id, url):
+        return SearchDocument(doc_id=doc_id, title="Title", section_title="",
+                              hierarchy=[], s="", url=url, body="Body",
+                              type='page', position=0)
+
+    indexer.stream_indexing = True
+    parent = doc("parent", "https://docs.redislabs.com/latest/1")
+    child = doc("child", "https://docs.redislabs.com/latest/1/2")
+    indexer.new_manifest = {
+        doc.url: manifest_entry(f"{doc.url}/", [doc.doc_id]) for doc in (parent, child)
+    }
+
+    # The child page was written before we crawled the page above it.
+    indexer.seen_urls = {"https://docs.redislabs.com/latest/1/2": "Two"}
+    child_fields = indexer.document_to_dict(child)
+    indexer.seen_urls["https://docs.redislabs.com/latest/1"] = "One"
+    indexer.document_to_dict(parent)
+
+    pipeline = indexer.search_client.redis.pipeline.return_value
+    pipeline.execute.return_value = [{k: str(v) for k, v in child_fields.items()}]
+
+    indexer.fix_hierarchies()
+
+    assert pipeline.hgetall.call_args_list == [call(keys.document(site.url, "child"))]
+    key, = pipeline.hset.call_args[0]
+    mapping = pipeline.hset.call_args[1]['mapping']
+    assert key == keys.document(site.url, "child")
+    assert json.loads(mapping['hierarchy']) == ["One", "Two"]
+    assert json.loads(mapping['display_hierarchy']) == ["One", "Two"]
+    assert mapping['__score'] < child_fields['__score']
+    assert indexer.written_hierarchies == {}
+
+
+def test_indexer_loads_the_results_of_a_distributed_crawl(indexer, keys, site):
+    parent = manifest_entry("https://docs.redislabs.com/latest/1/", ["parent"])
+    child = manifest_entry("https://docs.redislabs.com/latest/1/2/", ["child"])
+    redis = indexer.search_client.redis
+    redis.hgetall.return_value = {
+        entry.url: json.dumps(asdict(entry)) for entry in (parent, child)
+    }
+    # Another worker wrote the child before anyone saw the parent.
+    redis.pipeline.return_value.execute.return_value = [
+        [parent.url, '["Page"]'],
+        [child.url, '["Page"]'],
+    ]
+
+    indexer.load_crawl_results()
+
+    redis.hgetall.assert_called_once_with(keys.page_manifest_new(site.url))
+    assert set(indexer.new_manifest) == {parent.url, child.url}
+    assert "parent" in indexer.seen_ids and "child" in indexer.seen_ids
+    assert indexer.url_hierarchy(child.url) == ["Page", "Page"]
+    assert indexer.written_hierarchies == {
+        "https://docs.redislabs.com/latest/1": ["Page"],
+        "https://docs.redislabs.com/latest/1/2": ["Page"],
+    }
+
+
 def test_indexer_indexes_sections_from_h3s(index_file, keys, site):
     indexer = index_file(FILE_WITH_H3s)
 
@@ -211,6 +330,7 @@ def test_indexer_indexes_sections_from_h3s(index_file, keys, site):
         'title': 'RedisBloom Tutorial',
         'section_title': '',
         'hierarchy': '[]',
+        'display_hierarchy': '[]',
         'url': 'https://docs.redislabs.com/latest//test',
         'body': """Follow                                                  this link to register                                                  and subscribe to Redis Enterprise Cloud                                                                                                   Step 2. Create a database with RedisBloom Module                                                 #                                                       Step 3. Connect to a database                                                 #                                                   Follow                                                  this                                                  link to know how to connect to a database                                                                                                Step 4. Getting Started with RedisBloom                                                 #  In the next steps you will use some basic RedisBloom commands. You can run them from the Redis command-line interface (redis\-cli) or use the CLI available in RedisInsight. (See part 2 of this tutorial to learn more about using the RedisInsight CLI.) To interact with RedisBloom, you use the BF.ADD and BF.EXISTS commands.  Let’s go ahead and test drive some RedisBloom-specific operations. We will create a basic dataset based on unique visitors’ IP addresses, and you will see how to:  Create a Bloom filter Determine whether or not an item exists in the Bloom filter Add one or more items to the Bloom filter Determine whether or not a unique visitor’s IP address exists  Let’s walk through the process step-by-step:                                                   Create a Bloom filter                                                 #  Use the BF.ADD command to add a unique visitor IP address to the Bloom filter as shown here:      >> BF.ADD unique_visitors 10.94.214.120   (integer) 1   (1.75s)    Copy                                                     Determine whether or not an item exists                                                 #  Use the BF.EXISTS command to determine whether or not an item may exist in the Bloom filter:      >> BF.EXISTS unique_visitors 10.94.214.120   (integer) 1    Copy        >> BF.EXISTS unique_visitors 10.94.214.121   (integer) 0   (1.46s)    Copy   In the above example, the first command shows the result as “1”, indicating that the item may exist, whereas the second command displays "0", indicating that the item certainly may not exist.                                                   Add one or more items to the Bloom filter                                                 #  Use the BF.MADD command to add one or more items to the Bloom filter, creating the filter if it does not yet exist. This command operates identically to BF.ADD, except it allows multiple inputs and returns multiple values:      >> BF.MADD unique_visitors 10.94.214.100 10.94.214.200 10.94.214.210 10.94.214.212   1) (integer) 1   2) (integer) 1   3) (integer) 1   4) (integer) 1    Copy   As shown above, the BF.MADD allows you to add one or more visitors’ IP addresses to the Bloom filter.                                                   Determine whether or not a unique visitor’s IP address exists                                                 #  Use BF.MEXISTS to determine if one or more items may exist in the filter or not:      >> BF.MEXISTS unique_visitors 10.94.214.200 10.94.214.212   1) (integer) 1   2) (integer) 1    Copy         >> BF.MEXISTS unique_visitors 10.94.214.200 10.94.214.213   1) (integer) 1   2) (integer) 0    Copy   In the above example, the first command shows the result as “1” for both the visitors’ IP addresses, indicating that these items do exist. The second command displays "0" for one of the visitor’s IP addresses, indicating that the item certainly does not exist.                                                   Next Step                                                 #                                                        Learn more about RedisBloom in the                                                      Quick Start                                                      tutorial.""",
         'type': 'section',
@@ -222,6 +342,7 @@ def test_indexer_indexes_sections_from_h3s(index_file, keys, site):
         'title': 'RedisBloom Tutorial',
         'section_title': '',
         'hierarchy': '[]',
+        'display_hierarchy': '[]',
         'url': 'https://docs.redislabs.com/latest//test',
         'body': 'Step 3. Connect to a database                                                 #                                                   Follow                                                  this                                                  link to know how to connect to a database                                                                                                Step 4. Getting Started with RedisBloom                                                 #  In the next steps you will use some basic RedisBloom commands. You can run them from the Redis command-line interface (redis\\-cli) or use the CLI available in RedisInsight. (See part 2 of this tutorial to learn more about using the RedisInsight CLI.) To interact with RedisBloom, you use the BF.ADD and BF.EXISTS commands.  Let’s go ahead and test drive some RedisBloom-specific operations. We will create a basic dataset based on unique visitors’ IP addresses, and you will see how to:  Create a Bloom filter Determine whether or not an item exists in the Bloom filter Add one or more items to the Bloom filter Determine whether or not a unique visitor’s IP address exists  Let’s walk through the process step-by-step:                                                   Create a Bloom filter                                                 #  Use the BF.ADD command to add a unique visitor IP address to the Bloom filter as shown here:      >> BF.ADD unique_visitors 10.94.214.120   (integer) 1   (1.75s)    Copy                                                     Determine whether or not an item exists                                                 #  Use the BF.EXISTS command to determine whether or not an item may exist in the Bloom filter:      >> BF.EXISTS unique_visitors 10.94.214.120   (integer) 1    Copy        >> BF.EXISTS unique_visitors 10.94.214.121   (integer) 0   (1.46s)    Copy   In the above example, the first command shows the result as “1”, indicating that the item may exist, whereas the second command displays "0", indicating that the item certainly may not exist.                                                   Add one or more items to the Bloom filter                                                 #  Use the BF.MADD command to add one or more items to the Bloom filter, creating the filter if it does not yet exist. This command operates identically to BF.ADD, except it allows multiple inputs and returns multiple values:      >> BF.MADD unique_visitors 10.94.214.100 10.94.214.200 10.94.214.210 10.94.214.212   1) (integer) 1   2) (integer) 1   3) (integer) 1   4) (integer) 1    Copy   As shown above, the BF.MADD allows you to add one or more visitors’ IP addresses to the Bloom filter.                                                   Determine whether or not a unique visitor’s IP address exists                                                 #  Use BF.MEXISTS to determine if one or more items may exist in the filter or not:      >> BF.MEXISTS unique_visitors 10.94.214.200 10.94.214.212   1) (integer) 1   2) (integer) 1    Copy         >> BF.MEXISTS unique_visitors 10.94.214.200 10.94.214.213   1) (integer) 1   2) (integer) 0    Copy   In the above example, the first command shows the result as “1” for both the visitors’ IP addresses, indicating that these items do exist. The second command displays "0" for one of the visitor’s IP addresses, indicating that the item certainly does not exist.                                                   Next Step                                                 #                                                        Learn more about RedisBloom in the                                                      Quick Start                                                      tutorial.',
         'type': 'section',
@@ -233,6 +354,7 @@ def test_indexer_indexes_sections_from_h3s(index_file, keys, site):
         'title': 'RedisBloom Tutorial',
         'section_title': '',
         'hierarchy': '[]',
+        'display_hierarchy': '[]',
         'url': 'https://docs.redislabs.com/latest//test',
         'body':
         'Follow                                                  this                                                  link to know how to connect to a database                                                                                                Step 4. Getting Started with RedisBloom                                                 #  In the next steps you will use some basic RedisBloom commands. You can run them from the Redis command-line interface (redis\\-cli) or use the CLI available in RedisInsight. (See part 2 of this tutorial to learn more about using the RedisInsight CLI.) To interact with RedisBloom, you use the BF.ADD and BF.EXISTS commands.  Let’s go ahead and test drive some RedisBloom-specific operations. We will create a basic dataset based on unique visitors’ IP addresses, and you will see how to:  Create a Bloom filter Determine whether or not an item exists in the Bloom filter Add one or more items to the Bloom filter Determine whether or not a unique visitor’s IP address exists  Let’s walk through the process step-by-step:                                                   Create a Bloom filter                                                 #  Use the BF.ADD command to add a unique visitor IP address to the Bloom filter as shown here:      >> BF.ADD unique_visitors 10.94.214.120   (integer) 1   (1.75s)    Copy                                                     Determine whether or not an item exists                                                 #  Use the BF.EXISTS command to determine whether or not an item may exist in the Bloom filter:      >> BF.EXISTS unique_visitors 10.94.214.120   (integer) 1    Copy        >> BF.EXISTS unique_visitors 10.94.214.121   (integer) 0   (1.46s)    Copy   In the above example, the first command shows the result as “1”, indicating that the item may exist, whereas the second command displays "0", indicating that the item certainly may not exist.                                                   Add one or more items to the Bloom filter                                                 #  Use the BF.MADD command to add one or more items to the Bloom filter, creating the filter if it does not yet exist. This command operates identically to BF.ADD, except it allows multiple inputs and returns multiple values:      >> BF.MADD unique_visitors 10.94.214.100 10.94.214.200 10.94.214.210 10.94.214.212   1) (integer) 1   2) (integer) 1   3) (integer) 1   4) (integer) 1    Copy   As shown above, the BF.MADD allows you to add one or more visitors’ IP addresses to the Bloom filter.                                                   Determine whether or not a unique visitor’s IP address exists                                                 #  Use BF.MEXISTS to determine if one or more items may exist in the filter or not:      >> BF.MEXISTS unique_visitors 10.94.214.200 10.94.214.212   1) (integer) 1   2) (integer) 1    Copy         >> BF.MEXISTS unique_visitors 10.94.214.200 10.94.214.213   1) (integer) 1   2) (integer) 0    Copy   In the above example, the first command shows the result as “1” for both the visitors’ IP addresses, indicating that these items do exist. The second command displays "0" for one of the visitor’s IP addresses, indicating that the item certainly does not exist.                                                   Next Step                                                 #                                                        Learn more about RedisBloom in the                                                      Quick Start                                                      tutorial.',
@@ -245,6 +367,7 @@ def test_indexer_indexes_sections_from_h3s(index_file, keys, site):
         'title': 'RedisBloom Tutorial',
         'section_title': '',
         'hierarchy': '[]',
+        'display_hierarchy': '[]',
         'url': 'https://docs.redislabs.com/latest//test',
         'body':
         'In the next steps you will use some basic RedisBloom commands. You can run them from the Redis command-line interface (redis\\-cli) or use the CLI available in RedisInsight. (See part 2 of this tutorial to learn more about using the RedisInsight CLI.) To interact with RedisBloom, you use the BF.ADD and BF.EXISTS commands.  Let’s go ahead and test drive some RedisBloom-specific operations. We will create a basic dataset based on unique visitors’ IP addresses, and you will see how to:  Create a Bloom filter Determine whether or not an item exists in the Bloom filter Add one or more items to the Bloom filter Determine whether or not a unique visitor’s IP address exists  Let’s walk through the process step-by-step:                                                   Create a Bloom filter                                                 #  Use the BF.ADD command to add a unique visitor IP address to the Bloom filter as shown here:      >> BF.ADD unique_visitors 10.94.214.120   (integer) 1   (1.75s)    Copy                                                     Determine whether or not an item exists                                                 #  Use the BF.EXISTS command to determine whether or not an item may exist in the Bloom filter:      >> BF.EXISTS unique_visitors 10.94.214.120   (integer) 1    Copy        >> BF.EXISTS unique_visitors 10.94.214.121   (integer) 0   (1.46s)    Copy   In the above example, the first command shows the result as “1”, indicating that the item may exist, whereas the second command displays "0", indicating that the item certainly may not exist.                                                   Add one or more items to the Bloom filter                                                 #  Use the BF.MADD command to add one or more items to the Bloom filter, creating the filter if it does not yet exist. This command operates identically to BF.ADD, except it allows multiple inputs and returns multiple values:      >> BF.MADD unique_visitors 10.94.214.100 10.94.214.200 10.94.214.210 10.94.214.212   1) (integer) 1   2) (integer) 1   3) (integer) 1   4) (integer) 1    Copy   As shown above, the BF.MADD allows you to add one or more visitors’ IP addresses to the Bloom filter.                                                   Determine whether or not a unique visitor’s IP address exists                                                 #  Use BF.MEXISTS to determine if one or more items may exist in the filter or not:      >> BF.MEXISTS unique_visitors 10.94.214.200 10.94.214.212   1) (integer) 1   2) (integer) 1    Copy         >> BF.MEXISTS unique_visitors 10.94.214.200 10.94.214.213   1) (integer) 1   2) (integer) 0    Copy   In the above example, the first command shows the result as “1” for both the visitors’ IP addresses, indicating that these items do exist. The second command displays "0" for one of the visitor’s IP addresses, indicating that the item certainly does not exist.                                                   Next Step                                                 #                                                        Learn more about RedisBloom in the                                                      Quick Start                                                      tutorial.',
@@ -257,6 +380,7 @@ def test_indexer_indexes_sections_from_h3s(index_file, keys, site):
         'title': 'RedisBloom Tutorial',
         'section_title': '',
         'hierarchy': '[]',
+        'display_hierarchy': '[]',
         'url': 'https://docs.redislabs.com/latest//test',
         'body':
         'Learn more about RedisBloom in the                                                      Quick Start                                                      tutorial.',
@@ -279,3 +403,384 @@ def test_indexer_indexes_sections_from_h3s(index_file, keys, site):
         # print(call[1]['mapping']['body'])
         assert call[0][0] == key
         assert doc == call[1]['mapping']
+
+
+def test_indexer_writes_batches_in_one_pipeline(indexer, parse_file, keys, site):
+    docs = parse_file(FILE_WITH_SECTIONS)
+    indexer.index_documents(docs)
+
+    indexer.search_client.redis.pipeline.assert_called_once_with(transaction=False)
+    pipeline = indexer.search_client.redis.pipeline.return_value
+    hset_keys = [c[0][0] for c in pipeline.hset.call_args_list]
+
+    assert hset_keys == [keys.document(site.url, doc.doc_id) for doc in docs]
+    pipeline.execute.assert_called_once_with(raise_on_error=False)
+
+
+def test_streaming_leaves_documents_that_are_already_indexed(indexer, parse_file, keys, site):
+    indexer.stream_indexing = True
+    indexed, new, *_ = parse_file(FILE_WITH_SECTIONS)
+    redis = indexer.search_client.redis
+    pipeline = redis.pipeline.return_value
+    pipeline.execute.side_effect = [
+        [['["Old"]', '["Old"]'], [None, None]],
+        [1, 1],
+        [1, 1, 1],
+    ]
+
+    indexer.index_documents([indexed, new])
+
+    hset_keys = [c[0][0] for c in pipeline.hset.call_args_list]
+    assert hset_keys == [keys.document(site.url, new.doc_id)]
+    assert call(keys.site_urls_new(indexer.index_alias), indexed.url) in pipeline.sadd.call_args_list
+    # Both documents are in this run, even though we only wrote one.
+    assert call(keys.doc_ids_new(site.url), indexed.doc_id) in pipeline.sadd.call_args_list
+    assert call(keys.doc_ids_new(site.url), new.doc_id) in pipeline.sadd.call_args_list
+    # fix_hierarchies() rewrites the indexed document if its hierarchy changed.
+    assert indexer.written_hierarchies[page_url(indexed.url)] is None
+
+
+def test_streaming_rewrites_indexed_documents_without_display_hierarchy(indexer, parse_file):
+    indexer.stream_indexing = True
+    indexed = parse_file(FILE_WITH_SECTIONS)[0]
+    pipeline = indexer.search_client.redis.pipeline.return_value
+    pipeline.execute.return_value = [['["Old"]', None]]
+
+    indexer.index_documents([indexed])
+
+    pipeline.hset.assert_not_called()
+    assert indexer.written_hierarchies == {page_url(indexed.url): None}
+
+
+def test_indexer_adds_document_ids_with_their_hashes(indexer, parse_file, keys, site):
+    docs = parse_file(FILE_WITH_SECTIONS)
+    indexer.index_documents(docs)
+
+    pipeline = indexer.search_client.redis.pipeline.return_value
+    doc_ids_key = keys.doc_ids_new(site.url)
+    added = [c[0][1] for c in pipeline.sadd.call_args_list if c[0][0] == doc_ids_key]
+    assert added == [doc.doc_id for doc in docs]
+
+
+def test_indexer_recovers_document_ids_of_an_unfinished_run(indexer, keys, site):
+    redis = indexer.search_client.redis
+    redis.exists.return_value = True
+
+    indexer.recover_doc_ids()
+
+    current_key = keys.doc_ids_current(site.url)
+    new_key = keys.doc_ids_new(site.url)
+    redis.sunionstore.assert_called_once_with(current_key, [current_key, new_key])
+    redis.delete.assert_called_once_with(new_key)
+
+
+def test_indexer_starts_without_a_previous_set_of_document_ids(indexer, keys, site):
+    redis = indexer.search_client.redis
+    redis.exists.side_effect = lambda key: key == keys.doc_ids_new(site.url)
+
+    indexer.recover_doc_ids()
+
+    redis.sunionstore.assert_not_called()
+    redis.delete.assert_called_once_with(keys.doc_ids_new(site.url))
+
+
+def test_writers_report_each_batch_they_write(indexer, parse_file):
+    docs = parse_file(FILE_WITH_SECTIONS)
+    docs_to_process = Queue()
+    for doc in docs:
+        docs_to_process.put(doc)
+    indexer.batch_size = 2
+    written = []
+
+    Thread(target=indexer.write_documents, args=(docs_to_process, written.append),
+           daemon=True).start()
+    docs_to_process.join()
+
+    assert sum(written) == len(docs)
+    assert max(written) == 2
+
+
+def test_unchanged_pages_keep_their_documents(indexer):
+    entry = PageManifestEntry(url=f"{TEST_URL}/",
+                              title="Test Page",
+                              etag='"abc"',
+                              last_modified="",
+                              content_hash="123",
+                              doc_ids=("one", "two"),
+                              links=(),
+                              changed=False)
+    indexer.record_page(entry)
+
+    assert len(indexer.seen_ids) == 2
+    assert "one" in indexer.seen_ids and "two" in indexer.seen_ids
+    assert indexer.seen_urls == {TEST_URL: "Test Page"}
+    assert indexer.new_manifest == {entry.url: entry}
+
+
+@mock.patch("sitesearch.indexer.get_rq_redis_client")
+@mock.patch("sitesearch.indexer.ClusterAwareQueue")
+def test_coordinator_queues_helpers_after_taking_the_lock(queue_class, _, indexer, site):
+    redis = indexer.search_client.redis
+    queue = queue_class.return_value
+    order = mock.Mock()
+    order.attach_mock(redis.set, "set")
+    order.attach_mock(queue.enqueue, "enqueue")
+    indexer.crawl_workers = 2
+
+    with mock.patch.object(indexer, "crawl"):
+        indexer.index(force=True, incremental=False)
+
+    assert [c[0] for c in order.mock_calls] == ["set", "enqueue", "enqueue"]
+    assert order.mock_calls[0].args[0] == indexer.lock
+    queue.enqueue.assert_called_with("sitesearch.tasks.crawl",
+                                     args=[site, indexer.index_name], job_timeout=mock.ANY)
+
+
+@mock.patch("sitesearch.indexer.ClusterAwareQueue")
+def test_locked_indexing_jobs_queue_no_helpers(queue_class, indexer):
+    indexer.search_client.redis.exists.return_value = 1
+    indexer.crawl_workers = 2
+
+    with mock.patch.object(indexer, "debounce"), mock.patch.object(indexer, "crawl") as crawl:
+        indexer.index()
+
+    crawl.assert_not_called()
+    queue_class.assert_not_called()
+
+
+def test_workers_of_a_distributed_crawl_buffer_their_pages(indexer):
+    indexer.frontier = mock.MagicMock()
+    entry = manifest_entry(f"{TEST_URL}/", ["one"])
+
+    indexer.record_page(entry)
+
+    indexer.frontier.record_page_later.assert_called_once_with(entry.url, json.dumps(asdict(entry)))
+    indexer.search_client.redis.hset.assert_not_called()
+
+
+def test_indexer_fixes_hierarchies_of_unchanged_pages(indexer, keys, site):
+    parent = manifest_entry("https://docs.redislabs.com/latest/1/", ["parent"])
+    child = replace(manifest_entry("https://docs.redislabs.com/latest/1/2/", ["child"],
+                                   changed=False),
+                    hierarchy=("Old Title", "Page"))
+    indexer.record_page(parent)
+    indexer.record_page(child)
+    indexer.seen_urls["https://docs.redislabs.com/latest/1"] = "New Title"
+
+    pipeline = indexer.search_client.redis.pipeline.return_value
+    pipeline.execute.return_value = [{}]
+    indexer.fix_hierarchies()
+
+    assert pipeline.hgetall.call_args_list == [call(keys.document(site.url, "child"))]
+
+
+def test_indexer_backfills_display_hierarchy_of_pages_from_old_manifests(indexer, keys, site):
+    # Manifests from before we recorded hierarchies have documents that
+    # may not have a "display_hierarchy".
+    page = manifest_entry("https://docs.redislabs.com/latest/1/", ["page"], changed=False)
+    assert page.hierarchy is None
+    indexer.record_page(page)
+
+    pipeline = indexer.search_client.redis.pipeline.return_value
+    pipeline.execute.return_value = [{}]
+    indexer.fix_hierarchies()
+
+    assert pipeline.hgetall.call_args_list == [call(keys.document(site.url, "page"))]
+
+
+def test_hashes_that_are_not_documents_are_outside_the_index_prefix(keys, site):
+    for key in (keys.page_manifest(site.url), keys.page_manifest_new(site.url),
+                keys.crawl_state(site.url)):
+        assert not key.startswith(keys.index_prefix(site.url))
+
+
+def test_doc_id_set_only_keeps_digests():
+    doc_ids = DocIdSet([f"{TEST_URL}:section:{md5(str(i))}" for i in range(3)])
+    doc_ids.add(f"{TEST_URL}:page:{md5('page')}")
+
+    assert len(doc_ids) == 4
+    assert f"{TEST_URL}:section:{md5('1')}" in doc_ids
+    assert f"{TEST_URL}:section:{md5('4')}" not in doc_ids
+    assert all(isinstance(digest, int) for digest in doc_ids.digests)
+
+
+def test_search_documents_are_slotted_and_pickle(parse_file):
+    docs = parse_file(FILE_WITH_SECTIONS)
+
+    assert not hasattr(docs[0], '__dict__')
+    assert pickle.loads(pickle.dumps(docs)) == docs
+
+
+def test_indexer_reports_bytes_per_document(indexer):
+    indexer.record_page(manifest_entry(f"{TEST_URL}/", ["one", "two"], changed=False))
+
+    report = indexer.memory_report()
+
+    assert report["documents"] == 2
+    assert report["bytes"] > 0
+    assert report["bytes_per_document"] == report["bytes"] / 2
+
+
+def test_indexer_reindexes_from_a_snapshot(indexer, parse_file, keys, site, tmp_path):
+    path = str(tmp_path / "site.snapshot.gz")
+    with open(os.path.join(DOCS_DIR, FILE_WITH_SECTIONS), "rb") as f:
+        html = f.read()
+    with SnapshotWriter(path) as snapshot:
+        snapshot.write(TEST_URL, {"Etag": '"abc"'}, html)
+        snapshot.write("https://example.com/elsewhere/", {}, html)
+    indexer.search_client.redis.exists.return_value = 0
+
+    assert indexer.reindex_from_snapshot(path)
+
+    docs = parse_file(FILE_WITH_SECTIONS)
+    redis = indexer.search_client.redis
+    hset_keys = [c[0][0] for c in redis.pipeline.return_value.hset.call_args_list]
+    assert sorted(hset_keys) == sorted(keys.document(site.url, doc.doc_id) for doc in docs)
+    assert indexer.new_manifest[TEST_URL].etag == '"abc"'
+    redis.delete.assert_any_call(keys.page_manifest(site.url))
+    token = next(c[0][1] for c in redis.set.call_args_list if c[0][0] == indexer.lock)
+    indexer.release_lock_script.assert_called_once_with(keys=[indexer.lock], args=[token])
+
+
+def test_reindex_from_a_snapshot_honors_the_index_lock(indexer, tmp_path):
+    path = str(tmp_path / "site.snapshot.gz")
+    with SnapshotWriter(path) as snapshot:
+        snapshot.write(TEST_URL, {}, b"<html></html>")
+    redis = indexer.search_client.redis
+    redis.exists.return_value = 1
+
+    assert not indexer.reindex_from_snapshot(path)
+    redis.set.assert_not_called()
+
+    # If reindexing fails, we don't leave the lock behind.
+    with mock.patch.object(indexer, "finish_indexing", side_effect=RuntimeError):
+        with pytest.raises(RuntimeError):
+            indexer.reindex_from_snapshot(path, force=True)
+    redis.set.assert_called_once_with(indexer.lock, mock.ANY, ex=mock.ANY)
+    token = redis.set.call_args[0][1]
+    indexer.release_lock_script.assert_called_once_with(keys=[indexer.lock], args=[token])
+    assert indexer.lock_token is None
+
+
+def test_indexing_jobs_take_the_lock_with_their_own_token(indexer):
+    redis = indexer.search_client.redis
+
+    indexer.take_lock()
+    first = redis.set.call_args[0][1]
+    indexer.take_lock()
+    second = redis.set.call_args[0][1]
+    assert first != second
+
+    indexer.release_lock()
+    indexer.release_lock()
+    indexer.release_lock_script.assert_called_once_with(keys=[indexer.lock], args=[second])
+
+
+def test_parser_pool_parses_like_document_parser(parse_file, site):
+    with open(os.path.join(DOCS_DIR, FILE_WITH_SECTIONS), encoding='utf-8') as f:
+        html = f.read()
+
+    pool = start_parser_pool(site, workers=1)
+    try:
+        docs = pool.submit(parse_page, TEST_URL, html).result()
+    finally:
+        pool.shutdown()
+
+    assert docs == parse_file(FILE_WITH_SECTIONS)
+
+
+def test_indexer_unlinks_stale_documents_in_batches(indexer, keys, site):
+    redis = indexer.search_client.redis
+    redis.exists.return_value = True
+    redis.sdiffstore.return_value = 3
+    redis.sscan_iter.return_value = iter(["old1", "old2", "old3"])
+    redis.unlink.side_effect = lambda *keys: len(keys)
+    indexer.batch_size = 2
+    indexer.seen_ids = DocIdSet(["one", "two", "three"])
+    indexer.new_manifest = {TEST_URL: manifest_entry(TEST_URL, ["one", "two", "three"])}
+
+    indexer.clear_old_hashes()
+
+    current_key = keys.doc_ids_current(site.url)
+    new_key = keys.doc_ids_new(site.url)
+    redis.sdiffstore.assert_called_once_with(keys.doc_ids_stale(site.url),
+                                             [current_key, new_key])
+    assert redis.unlink.call_args_list == [
+        call(keys.document(site.url, "old1"), keys.document(site.url, "old2")),
+        call(keys.document(site.url, "old3"))
+    ]
+    assert sorted(redis.sadd.call_args_list[0][0][1:]) == ["one", "two"]
+    redis.rename.assert_called_once_with(new_key, current_key)
+
+
+SITEMAP_INDEX = f"""<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>{OLD_DOCS_PROD.url}/sitemap-1.xml.gz</loc></sitemap>
+</sitemapindex>"""
+
+SITEMAP = f"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url><loc>{TEST_URL}/changed/</loc><lastmod>2021-02-01</lastmod></url>
+  <url><loc>{TEST_URL}/unchanged/</loc><lastmod>2021-01-01</lastmod></url>
+  <url><loc>{TEST_URL}/new/</loc></url>
+  <url><loc>https://example.com/elsewhere/</loc></url>
+  <url><loc>{TEST_URL}/denied/</loc></url>
+</urlset>"""
+
+
+def test_spider_crawls_pages_from_nested_gzipped_sitemaps(site):
+    def entry(url, lastmod):
+        return PageManifestEntry(url=url, title="Page", etag="", last_modified="",
+                                 content_hash="", doc_ids=("one", ), links=(),
+                                 lastmod=lastmod)
+
+    manifest = {
+        f"{TEST_URL}/changed/": entry(f"{TEST_URL}/changed/", "2021-01-01"),
+        f"{TEST_URL}/unchanged/": entry(f"{TEST_URL}/unchanged/", "2021-01-01"),
+    }
+    sitemap_url = f"{site.url}/sitemap.xml"
+    Spider = type('Spider', (DocumentationSpiderBase, ), {
+        "site_config": replace(site, sitemap_url=sitemap_url, deny=("/denied/", )),
+        "manifest": manifest
+    })
+    spider = Spider()
+
+    start, = spider.start_requests()
+    assert start.url == sitemap_url
+
+    nested, = spider.parse_sitemap(
+        XmlResponse(sitemap_url, body=SITEMAP_INDEX.encode(), request=start))
+    assert nested.url == f"{site.url}/sitemap-1.xml.gz"
+
+    output = list(spider.parse_sitemap(
+        Response(nested.url, body=gzip.compress(SITEMAP.encode()), request=nested)))
+    requests = [o for o in output if isinstance(o, Request)]
+
+    assert [r.url for r in requests] == [f"{TEST_URL}/changed/", f"{TEST_URL}/new/"]
+    assert requests[0].cb_kwargs == {"lastmod": "2021-02-01"}
+    assert output[1] == replace(manifest[f"{TEST_URL}/unchanged/"], changed=False)
+    assert spider.extract_links(None) == []
+
+
+def test_indexer_builds_suggestions_from_indexed_documents(indexer, keys, site):
+    pipeline = indexer.search_client.redis.pipeline.return_value
+    pipeline.execute.return_value = [
+        ["Database Persistence", "", '["Redis Enterprise Software"]', f"{TEST_URL}/persistence", "0.5"],
+        ["Database Persistence", "Persistence options", "[]", f"{TEST_URL}/persistence", "0.25"],
+        ["Redis Enterprise Software", "", "[]", f"{TEST_URL}/rs", "0.75"],
+        [None, None, None, None, None]
+    ]
+    indexer.new_manifest = {
+        TEST_URL: manifest_entry(TEST_URL, ["one", "two", "three", "four"])
+    }
+    indexer.site = replace(site, landing_pages={})
+
+    indexer.build_suggestions()
+
+    new_key = keys.suggestions_new(site.url)
+    added = sorted(c[0] for c in pipeline.execute_command.call_args_list)
+    assert added == [
+        ("FT.SUGADD", new_key, "Database Persistence", 0.5, "PAYLOAD", f"{TEST_URL}/persistence"),
+        ("FT.SUGADD", new_key, "Persistence options", 0.25, "PAYLOAD", f"{TEST_URL}/persistence"),
+        ("FT.SUGADD", new_key, "Redis Enterprise Software", 0.75, "PAYLOAD", f"{TEST_URL}/rs"),
+    ]
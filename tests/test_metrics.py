@@ -0,0 +1,69 @@
+import pytest
+
+from sitesearch.api import authentication
+from sitesearch.metrics import Histogram, SEARCH_SECONDS, StageTimer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test.", ("site", ), buckets=(0.1, 1))
+    histogram.observe(0.05, "a")
+    histogram.observe(0.5, "a")
+    histogram.observe(5, "a")
+    histogram.observe(1, 'say "hi"')
+
+    assert list(histogram.render()) == [
+        "# HELP test_seconds Test.",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{site="a",le="0.1"} 1',
+        'test_seconds_bucket{site="a",le="1"} 2',
+        'test_seconds_bucket{site="a",le="+Inf"} 3',
+        'test_seconds_sum{site="a"} 5.55',
+        'test_seconds_count{site="a"} 3',
+        'test_seconds_bucket{site="say \\"hi\\"",le="0.1"} 0',
+        'test_seconds_bucket{site="say \\"hi\\"",le="1"} 1',
+        'test_seconds_bucket{site="say \\"hi\\"",le="+Inf"} 1',
+        'test_seconds_sum{site="say \\"hi\\""} 1',
+        'test_seconds_count{site="say \\"hi\\""} 1',
+    ]
+
+
+def test_stage_timer_adds_up_repeated_stages():
+    clock = FakeClock()
+    timer = StageTimer(clock)
+
+    for seconds in (0.002, 0.003):
+        with timer.stage("redis"):
+            clock.now += seconds
+    with timer.stage("transform"):
+        clock.now += 0.0005
+    clock.now += 0.001
+    timer.stop()
+
+    assert timer.server_timing("miss") == \
+        'redis;dur=5.000, transform;dur=0.500, total;dur=6.500, cache-status;desc="miss"'
+
+
+@pytest.mark.asyncio
+async def test_metrics_require_an_api_key(client):
+    result = await client.get("/metrics", headers={"X-API-KEY": "wrong"})
+    assert result.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_metrics(client):
+    SEARCH_SECONDS.observe(0.01, "https://example.com", "miss")
+
+    result = await client.get("/metrics", headers={"X-API-KEY": authentication.API_KEY})
+
+    assert result.status_code == 200
+    assert result.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'sitesearch_search_seconds_count{site="https://example.com",cache="miss"}' \
+        in result.text
@@ -1,7 +1,9 @@
+import re
+
 import pytest
 
 from sitesearch.config import AppConfiguration
-from sitesearch.query_parser import parse
+from sitesearch.query_parser import TokenEscaper, get_escaper, parse
 
 config = AppConfiguration()
 
@@ -9,13 +11,13 @@ config = AppConfiguration()
 @pytest.mark.asyncio
 async def test_strips_dash_star_postfixes():
     query = await parse("index", "python-*", None, 0, 10, config.default_search_site)
-    assert ' '.join(query) == "index python* SUMMARIZE FIELDS 1 body FRAGS 1 LEN 10 HIGHLIGHT FIELDS 3 title body section_title LIMIT 0 10"
+    assert ' '.join(query) == "index python* SUMMARIZE FIELDS 1 body FRAGS 1 LEN 10 HIGHLIGHT FIELDS 3 title body section_title LIMIT 0 10 RETURN 6 title section_title body url hierarchy display_hierarchy"
 
 
 @pytest.mark.asyncio
 async def test_strips_unsafe_chars():
     query = await parse("index", "this is a [test]", None, 0, 10, config.default_search_site)
-    assert ' '.join(query) == "index this is a  test SUMMARIZE FIELDS 1 body FRAGS 1 LEN 10 HIGHLIGHT FIELDS 3 title body section_title LIMIT 0 10"
+    assert ' '.join(query) == "index this is a  test SUMMARIZE FIELDS 1 body FRAGS 1 LEN 10 HIGHLIGHT FIELDS 3 title body section_title LIMIT 0 10 RETURN 6 title section_title body url hierarchy display_hierarchy"
 
 
 @pytest.mark.asyncio
@@ -30,28 +32,54 @@ async def test_highlights_fields():
     assert "HIGHLIGHT FIELDS 3 title body section_title" in " ".join(query)
 
 
+@pytest.mark.asyncio
+async def test_returns_display_fields():
+    query = await parse("index", "test", None, 0, 10, config.default_search_site)
+    assert "RETURN 6 title section_title body url hierarchy display_hierarchy" in " ".join(query)
+
+
 @pytest.mark.asyncio
 async def test_exact_search_for_synonym_terms():
     query = await parse("index", "insight*", None, 0, 10, config.default_search_site)
-    assert ' '.join(query) == "index insight SUMMARIZE FIELDS 1 body FRAGS 1 LEN 10 HIGHLIGHT FIELDS 3 title body section_title LIMIT 0 10"
+    assert ' '.join(query) == "index insight SUMMARIZE FIELDS 1 body FRAGS 1 LEN 10 HIGHLIGHT FIELDS 3 title body section_title LIMIT 0 10 RETURN 6 title section_title body url hierarchy display_hierarchy"
 
 
 @pytest.mark.asyncio
 async def test_allow_fuzzy_search_for_non_synonym_terms():
     query = await parse("index", "test*", None, 0, 10, config.default_search_site)
-    assert ' '.join(query) == "index test* SUMMARIZE FIELDS 1 body FRAGS 1 LEN 10 HIGHLIGHT FIELDS 3 title body section_title LIMIT 0 10"
+    assert ' '.join(query) == "index test* SUMMARIZE FIELDS 1 body FRAGS 1 LEN 10 HIGHLIGHT FIELDS 3 title body section_title LIMIT 0 10 RETURN 6 title section_title body url hierarchy display_hierarchy"
 
 
 @pytest.mark.asyncio
 async def test_boosts_current_section_if_given():
     query = await parse("index", "test", "test", 0, 10, config.default_search_site)
-    assert ' '.join(query) == "index ((@s:test) => {$weight: 10} test) | test SUMMARIZE FIELDS 1 body FRAGS 1 LEN 10 HIGHLIGHT FIELDS 3 title body section_title LIMIT 0 10"
+    assert ' '.join(query) == "index ((@s:test) => {$weight: 10} test) | test SUMMARIZE FIELDS 1 body FRAGS 1 LEN 10 HIGHLIGHT FIELDS 3 title body section_title LIMIT 0 10 RETURN 6 title section_title body url hierarchy display_hierarchy"
 
 
 @pytest.mark.asyncio
 async def test_escapes_configured_literal_terms():
     query = await parse("index", "active-active", None, 0, 10, config.default_search_site)
-    assert ' '.join(query) == "index active\\-active SUMMARIZE FIELDS 1 body FRAGS 1 LEN 10 HIGHLIGHT FIELDS 3 title body section_title LIMIT 0 10"
+    assert ' '.join(query) == "index active\\-active SUMMARIZE FIELDS 1 body FRAGS 1 LEN 10 HIGHLIGHT FIELDS 3 title body section_title LIMIT 0 10 RETURN 6 title section_title body url hierarchy display_hierarchy"
 
     query = await parse("index", "leader-follower active-active", None, 0, 10, config.default_search_site)
-    assert ' '.join(query) == "index leader\\-follower active\\-active SUMMARIZE FIELDS 1 body FRAGS 1 LEN 10 HIGHLIGHT FIELDS 3 title body section_title LIMIT 0 10"
\ No newline at end of file
+    assert ' '.join(query) == "index leader\\-follower active\\-active SUMMARIZE FIELDS 1 body FRAGS 1 LEN 10 HIGHLIGHT FIELDS 3 title body section_title LIMIT 0 10 RETURN 6 title section_title body url hierarchy display_hierarchy"
+
+def test_escaper_matches_terms_in_the_order_given():
+    """
+    The escaper must match like a plain alternation of its terms, which
+    picks the first matching term rather than the longest one.
+    """
+    terms = ('6.0', 'v6.0', '6.0.20', 'v6.0.20', 'RAM-based', 're-sharding')
+    alternation = re.compile("|".join(terms), re.IGNORECASE)
+    escaper = TokenEscaper(terms)
+
+    for text in ("v6.0.20", "6.0.20", "ram-based re-sharding", "6x0", "RE-SHARDING"):
+        expected = alternation.sub(
+            lambda m: TokenEscaper.ESCAPED_CHARS_RE.sub(lambda s: f"\\{s.group(0)}", m.group(0)),
+            text)
+        assert escaper.escape(text) == expected
+
+
+def test_escaper_is_shared_per_site():
+    site = config.default_search_site
+    assert get_escaper(site.literal_terms) is get_escaper(site.literal_terms)
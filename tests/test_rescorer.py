@@ -0,0 +1,67 @@
+import json
+from unittest import mock
+from unittest.mock import call
+
+from sitesearch.keys import Keys
+from sitesearch.rescorer import HASH_FIELDS, SET_SCORE_SCRIPT, rescore_site
+from sitesearch.scorers import score_document
+from sitesearch.indexer import document_from_hash
+
+KEYS = Keys("sitesearch:test")
+
+
+def document_hash(doc_id, hierarchy, type, score):
+    return [
+        doc_id, "Title", "", json.dumps(hierarchy), "https://docs.redislabs.com/latest/rs",
+        "Body", type, "rs", "0", str(score)
+    ]
+
+
+def redis_with(site, hashes):
+    redis = mock.MagicMock()
+    keys = [KEYS.document(site.url, h[0]) for h in hashes]
+    redis.scan_iter.return_value = iter(keys)
+    redis.pipeline.return_value.execute.side_effect = [hashes, [1] * len(hashes)]
+    return redis, keys
+
+
+def test_rescore_writes_only_changed_scores(site):
+    current = dict(zip(HASH_FIELDS, document_hash("one", ["One", "Two"], "page", 0)))
+    current_score = score_document(document_from_hash(current), site.scorers)
+    hashes = [
+        document_hash("one", ["One", "Two"], "page", current_score),
+        document_hash("two", ["One", "Two"], "section", 1.0),
+        [None] * len(HASH_FIELDS),
+    ]
+    redis, keys = redis_with(site, hashes)
+
+    report = rescore_site(site, redis, KEYS, batch_size=10)
+
+    pipeline = redis.pipeline.return_value
+    redis.register_script.assert_called_once_with(SET_SCORE_SCRIPT)
+    set_score = redis.register_script.return_value
+    assert set_score.call_args_list == [call(keys=[keys[1]], args=[mock.ANY], client=pipeline)]
+    assert set_score.call_args[1]['args'][0] < 1.0
+    pipeline.hset.assert_not_called()
+    assert report.documents == 2
+    assert report.changed == 1
+    redis.incr.assert_called_once_with(KEYS.index_generation(site.url))
+
+
+def test_rescore_dry_run_reports_the_score_distribution(site):
+    hashes = [
+        document_hash("one", [], "page", 1.0),
+        document_hash("two", ["One", "Two"], "section", 1.0),
+    ]
+    redis, _ = redis_with(site, hashes)
+
+    report = rescore_site(site, redis, KEYS, batch_size=10, dry_run=True)
+
+    redis.register_script.return_value.assert_not_called()
+    redis.incr.assert_not_called()
+    summary = report.to_dict()
+    assert summary["changed"] == 1
+    assert summary["before"]["buckets"] == {"1.0": 2}
+    assert summary["after"]["count"] == 2
+    assert summary["after"]["max"] == 1.0
+    assert summary["after"]["min"] < 1.0
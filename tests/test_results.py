@@ -0,0 +1,49 @@
+from redisearch import Result
+
+from sitesearch.results import parse_search_reply
+from sitesearch.sites.redis_labs import DOCS_PROD
+from sitesearch.transformer import transform_documents
+
+URL = f"{DOCS_PROD.url}/page"
+
+REPLY = [
+    12,
+    "doc:1", ["title", "Title", "section_title", "Section", "body", "<b>Body</b>",
+              "url", URL, "hierarchy", '["One"]', "display_hierarchy", '["One"]'],
+    "doc:2", ["title", "Active\\-Active", "url", f"{URL}/2", "type", "page"],
+]
+
+REPLY_WITH_SCORES = [2, "doc:1", "2.5", REPLY[2], "doc:2", "1", REPLY[4]]
+
+
+def test_parse_search_reply():
+    result = parse_search_reply(REPLY)
+
+    assert result.total == 12
+    first, second = result.docs
+    assert (first.id, first.score, first.title, first.section_title, first.body,
+            first.url, first.hierarchy, first.display_hierarchy) == \
+        ("doc:1", None, "Title", "Section", "<b>Body</b>", URL, '["One"]', '["One"]')
+
+    # Fields we didn't get have defaults, and fields we don't serve are ignored.
+    assert (second.title, second.section_title, second.body, second.hierarchy,
+            second.display_hierarchy) == ("Active\\-Active", "", "", "[]", None)
+    assert not hasattr(second, "type")
+
+
+def test_parse_search_reply_with_scores():
+    result = parse_search_reply(REPLY_WITH_SCORES, with_scores=True)
+
+    assert [(doc.id, doc.score) for doc in result.docs] == [("doc:1", 2.5), ("doc:2", 1.0)]
+    assert result.docs[0].url == URL
+
+
+def test_parse_search_reply_transforms_like_redisearch_result():
+    for reply, with_scores in ((REPLY, False), (REPLY_WITH_SCORES, True)):
+        expected = Result(reply, True, has_payload=False, with_scores=with_scores)
+        # redisearch.Result doesn't have defaults for fields the reply lacks.
+        expected.docs[1].section_title = expected.docs[1].body = ""
+        expected.docs[1].hierarchy = "[]"
+
+        assert transform_documents(parse_search_reply(reply, with_scores).docs, DOCS_PROD, "q") == \
+            transform_documents(expected.docs, DOCS_PROD, "q")
@@ -1,5 +1,11 @@
+import asyncio
+
 import pytest
 
+from sitesearch.api import search
+from sitesearch.cursor import MAX_PAGES, SearchCursor, page_digest
+from sitesearch.sites.redis_labs import DEVELOPERS, DOCS_PROD, OSS
+
 
 @pytest.mark.asyncio
 async def test_query_python(docs, client):
@@ -63,3 +69,282 @@ async def test_escapes_known_version_numbers(docs, client):
 
     result = await client.get('/search?q=v5.4&site=https://docs.redislabs.com/latest/')
     assert "<b>v5</b>.4" in result.json()['results'][0]['body']
+
+
+def raw_search_result(url, *docs):
+    """Build an FT.SEARCH ... WITHSCORES reply."""
+    reply = [len(docs)]
+    for path, score in docs:
+        reply += [f"doc:{path}", str(score), [
+            "title", path.title(), "section_title", "", "hierarchy", "[]",
+            "body", "<b>Body</b>", "url", f"{url}/{path}"
+        ]]
+    return reply
+
+
+class FakeSearchRedis:
+    def __init__(self, replies, delays):
+        self.replies = replies
+        self.delays = delays
+
+    async def execute_command(self, command, index_alias, *args):
+        assert "WITHSCORES" in args
+        await asyncio.sleep(self.delays.get(index_alias, 0))
+        return self.replies[index_alias]
+
+
+@pytest.mark.asyncio
+async def test_federated_search_merges_sites_by_normalized_score(monkeypatch, client):
+    docs_url, dev_url, oss_url = DOCS_PROD.url, DEVELOPERS.url, OSS.url
+    keys = search.config.keys
+    redis = FakeSearchRedis(replies={
+        keys.index_alias(docs_url): raw_search_result(docs_url, ("a", 10), ("b", 5)),
+        keys.index_alias(dev_url): raw_search_result(dev_url, ("c", 2), ("d", 1.5)),
+        keys.index_alias(oss_url): raw_search_result(oss_url, ("e", 1)),
+    }, delays={keys.index_alias(oss_url): 1})
+    monkeypatch.setattr(search, "read_client", redis)
+    monkeypatch.setattr(search, "FEDERATED_SITE_TIMEOUT_SECONDS", 0.1)
+
+    result = await client.get(
+        f'/search/federated?q=xyzzy&site={docs_url}&site={dev_url}&site={oss_url}')
+
+    assert result.status_code == 200
+    body = result.json()
+    assert [(doc["url"], doc["score"]) for doc in body["results"]] == [
+        (f"{docs_url}/a", 1.0),
+        (f"{dev_url}/c", 1.0),
+        (f"{dev_url}/d", 0.75),
+        (f"{docs_url}/b", 0.5),
+    ]
+    assert body["results"][1]["site"] == dev_url
+    assert body["total"] == 4
+    assert body["sites"][oss_url] == {"total": 0, "error": "timeout"}
+
+
+class FakePipeline:
+    def __init__(self, replies):
+        self.replies = replies
+        self.commands = []
+
+    def execute_command(self, *args):
+        self.commands.append(args)
+        return self
+
+    async def execute(self, raise_on_error=True):
+        return [self.replies[args[2]] for args in self.commands]
+
+
+@pytest.mark.asyncio
+async def test_batch_search_runs_searches_in_one_pipeline(monkeypatch, client):
+    docs_url = DOCS_PROD.url
+    pipeline = FakePipeline(replies={
+        "first": [1, "doc:a", ["title", "A", "section_title", "", "hierarchy", "[]",
+                               "body", "<b>First</b>", "url", f"{docs_url}/a"]],
+        "second": search.aioredis.exceptions.ResponseError("Syntax error"),
+    })
+
+    class FakeRedis:
+        def pipeline(self, transaction=True):
+            assert not transaction
+            return pipeline
+
+    monkeypatch.setattr(search, "read_client", FakeRedis())
+
+    result = await client.post('/search/batch', json=[
+        {"q": "first", "site": docs_url},
+        {"q": "nope", "site": "https://example.com"},
+        {"q": "second", "num": 5},
+    ])
+
+    assert result.status_code == 200
+    first, invalid, second = result.json()
+    assert first["total"] == 1
+    assert first["results"][0]["url"] == f"{docs_url}/a"
+    assert first["next_start"] is None
+    assert invalid == {"error": "You must specify a valid search site."}
+    assert second == {"error": "Search failed"}
+    assert len(pipeline.commands) == 2
+
+
+@pytest.mark.asyncio
+async def test_batch_search_reports_connection_errors(monkeypatch, client):
+    class FailingPipeline(FakePipeline):
+        async def execute(self, raise_on_error=True):
+            raise search.aioredis.exceptions.ConnectionError("Connection refused")
+
+    pipeline = FailingPipeline(replies={})
+
+    class FakeRedis:
+        def pipeline(self, transaction=True):
+            return pipeline
+
+    monkeypatch.setattr(search, "read_client", FakeRedis())
+
+    result = await client.post('/search/batch', json=[{"q": "first"}, {"q": "second"}])
+
+    assert result.status_code == 200
+    assert result.json() == [{"error": "Search failed"}] * 2
+
+
+class FakePagedRedis:
+    """Answer FT.SEARCH with the slice of `paths` that LIMIT asks for."""
+    def __init__(self, url, paths):
+        self.url = url
+        self.paths = paths
+        self.limits = []
+
+    async def execute_command(self, command, index_alias, query, *args):
+        limit = args.index("LIMIT")
+        start, num = int(args[limit + 1]), int(args[limit + 2])
+        self.limits.append((start, num))
+        reply = [len(self.paths)]
+        for i, path in list(enumerate(self.paths))[start:start + num]:
+            reply += [f"doc:{i}", [
+                "title", path.title(), "section_title", f"Section {i}", "hierarchy", "[]",
+                "body", "<b>Body</b>", "url", f"{self.url}/{path}"
+            ]]
+        return reply
+
+
+def test_collapse_pages_keeps_the_first_document_of_each_page():
+    class Doc:
+        def __init__(self, url):
+            self.url = url
+
+    docs = [Doc(url) for url in ("a", "b", "a", "c", "seen", "d", "c", "e")]
+    pages_seen = {page_digest("seen")}
+
+    collapsed, consumed = search.collapse_pages(docs, pages_seen, 3)
+
+    assert [doc.url for doc in collapsed] == ["a", "b", "c"]
+    # We also went past "seen", which doesn't need to come back.
+    assert consumed == 5
+    assert pages_seen == {page_digest(url) for url in ("seen", "a", "b", "c")}
+
+
+@pytest.mark.asyncio
+async def test_search_returns_num_distinct_pages(monkeypatch, client):
+    docs_url = DOCS_PROD.url
+    # Ten sections of page "a", then one section each of pages b-e.
+    redis = FakePagedRedis(docs_url, ["a"] * 10 + ["b", "c", "a", "d", "e"])
+    monkeypatch.setattr(search, "read_client", redis)
+    monkeypatch.setattr(search.result_cache, "max_size", 0)
+    monkeypatch.setattr(search.shared_cache, "ttl", 0)
+
+    result = await client.get(f'/search?q=xyzzy&site={docs_url}&num=3')
+
+    body = result.json()
+    assert [(doc["url"], doc["section_title"]) for doc in body["results"]] == [
+        (f"{docs_url}/a", "Section 0"),
+        (f"{docs_url}/b", "Section 10"),
+        (f"{docs_url}/c", "Section 11"),
+    ]
+    assert SearchCursor.decode(body["next_start"]).offset == 13
+    # Nine documents weren't enough, so we fetched eighteen more.
+    assert redis.limits == [(0, 9), (9, 18)]
+
+    stages = [metric.split(";")[0] for metric in result.headers["Server-Timing"].split(", ")]
+    assert stages == ["cache", "landing_page", "parse", "redis", "decode", "transform",
+                      "serialize", "total", "cache-status"]
+    assert result.headers["Server-Timing"].endswith('cache-status;desc="disabled"')
+
+    result = await client.get(f'/search?q=xyzzy&site={docs_url}&num=3&start={body["next_start"]}')
+
+    body = result.json()
+    # The cursor skips the section of "a" that follows "c".
+    assert [doc["url"] for doc in body["results"]] == [f"{docs_url}/d", f"{docs_url}/e"]
+    assert body["next_start"] is None
+
+
+@pytest.mark.asyncio
+async def test_paging_through_a_search_returns_each_page_once(monkeypatch, client):
+    docs_url = DOCS_PROD.url
+    # Pages have several sections, spread through the results.
+    paths = [f"p{i % 7}" if i % 3 else f"q{i}" for i in range(60)]
+    monkeypatch.setattr(search, "read_client", FakePagedRedis(docs_url, paths))
+    monkeypatch.setattr(search.result_cache, "max_size", 0)
+    monkeypatch.setattr(search.shared_cache, "ttl", 0)
+
+    urls = []
+    start = ""
+    while start is not None:
+        body = (await client.get(f'/search?q=xyzzy&site={docs_url}&num=4&start={start}')).json()
+        urls += [doc["url"] for doc in body["results"]]
+        start = body["next_start"]
+
+    assert len(urls) == len(set(urls))
+    assert set(urls) == {f"{docs_url}/{path}" for path in paths}
+
+
+@pytest.mark.asyncio
+async def test_batch_search_fetches_again_for_num_distinct_pages(monkeypatch, client):
+    docs_url = DOCS_PROD.url
+    redis = FakePagedRedis(docs_url, ["a"] * 10 + ["b", "c", "a", "d", "e"])
+
+    class FakeBatchPipeline:
+        def __init__(self):
+            self.commands = []
+
+        def execute_command(self, *args):
+            self.commands.append(args)
+
+        async def execute(self, raise_on_error=True):
+            return [await redis.execute_command(*args) for args in self.commands]
+
+    redis.pipeline = lambda transaction=True: FakeBatchPipeline()
+    monkeypatch.setattr(search, "read_client", redis)
+
+    result = await client.post('/search/batch', json=[{"q": "xyzzy", "site": docs_url, "num": 3}])
+
+    response, = result.json()
+    assert [doc["url"] for doc in response["results"]] == \
+        [f"{docs_url}/a", f"{docs_url}/b", f"{docs_url}/c"]
+    assert redis.limits == [(0, 9), (9, 18)]
+
+    result = await client.post('/search/batch', json=[
+        {"q": "xyzzy", "site": docs_url, "num": 3, "start": response["next_start"]}])
+
+    response, = result.json()
+    assert [doc["url"] for doc in response["results"]] == [f"{docs_url}/d", f"{docs_url}/e"]
+    assert response["next_start"] is None
+
+
+@pytest.mark.asyncio
+async def test_search_accepts_a_numeric_start_as_an_offset(monkeypatch, client):
+    docs_url = DOCS_PROD.url
+    redis = FakePagedRedis(docs_url, ["a"] * 10 + ["b", "c", "a", "d", "e"])
+    monkeypatch.setattr(search, "read_client", redis)
+    monkeypatch.setattr(search.result_cache, "max_size", 0)
+    monkeypatch.setattr(search.shared_cache, "ttl", 0)
+
+    result = await client.get(f'/search?q=xyzzy&site={docs_url}&num=3&start=10')
+
+    assert result.status_code == 200
+    assert [doc["url"] for doc in result.json()["results"]] == \
+        [f"{docs_url}/b", f"{docs_url}/c", f"{docs_url}/a"]
+    assert redis.limits[0] == (10, 9)
+
+
+@pytest.mark.asyncio
+async def test_deep_paging_keeps_the_cursor_small(monkeypatch, client):
+    docs_url = DOCS_PROD.url
+    paths = [f"p{i}" for i in range(MAX_PAGES * 2)]
+    monkeypatch.setattr(search, "read_client", FakePagedRedis(docs_url, paths))
+    monkeypatch.setattr(search.result_cache, "max_size", 0)
+    monkeypatch.setattr(search.shared_cache, "ttl", 0)
+
+    lengths = []
+    start = ""
+    while start is not None:
+        body = (await client.get(f'/search?q=xyzzy&site={docs_url}&num=100&start={start}')).json()
+        start = body["next_start"]
+        if start is not None:
+            lengths.append(len(start))
+
+    assert max(lengths) == len(SearchCursor(0, range(MAX_PAGES)).encode())
+
+
+@pytest.mark.asyncio
+async def test_search_rejects_a_start_that_is_not_a_cursor(client):
+    result = await client.get(f'/search?q=xyzzy&site={DOCS_PROD.url}&start=!')
+    assert result.status_code == 400
@@ -0,0 +1,61 @@
+import gzip
+
+from sitesearch.snapshot import SnapshotWriter, read_snapshot
+
+URL = "https://docs.redislabs.com/latest"
+
+
+def test_snapshot_round_trips_pages(tmp_path):
+    path = str(tmp_path / "site.snapshot.gz")
+    with SnapshotWriter(path) as snapshot:
+        snapshot.write(f"{URL}/one/", {"Etag": '"abc"'}, b"<html>One</html>")
+        snapshot.write(f"{URL}/two/", {}, b"")
+
+    pages = list(read_snapshot(path))
+
+    assert [(p.url, p.headers, p.body) for p in pages] == [
+        (f"{URL}/one/", {"Etag": '"abc"'}, b"<html>One</html>"),
+        (f"{URL}/two/", {}, b""),
+    ]
+    assert pages[0].header("ETag") == '"abc"'
+    assert pages[1].header("ETag") == ""
+
+
+def test_snapshot_keeps_the_last_record_of_a_url(tmp_path):
+    path = str(tmp_path / "site.snapshot.gz")
+    with SnapshotWriter(path) as snapshot:
+        snapshot.write(f"{URL}/one/", {}, b"old")
+        snapshot.write(f"{URL}/two/", {}, b"two")
+        snapshot.write(f"{URL}/one/", {}, b"new")
+
+    pages = {p.url: p.body for p in read_snapshot(path)}
+
+    assert pages == {f"{URL}/one/": b"new", f"{URL}/two/": b"two"}
+
+
+def test_snapshot_replays_only_the_latest_crawl(tmp_path):
+    path = str(tmp_path / "site.snapshot.gz")
+    with SnapshotWriter(path) as snapshot:
+        snapshot.write(f"{URL}/one/", {}, b"old")
+        snapshot.write(f"{URL}/two/", {}, b"two")
+    # The site removed /two/ before the next crawl.
+    with SnapshotWriter(path) as snapshot:
+        snapshot.write(f"{URL}/one/", {}, b"new")
+
+    pages = {p.url: p.body for p in read_snapshot(path)}
+
+    assert pages == {f"{URL}/one/": b"new"}
+
+
+def test_snapshot_stops_at_an_incomplete_record(tmp_path):
+    path = str(tmp_path / "site.snapshot.gz")
+    with SnapshotWriter(path) as snapshot:
+        snapshot.write(f"{URL}/one/", {}, b"one")
+        snapshot.write(f"{URL}/two/", {}, b"two" * 100)
+
+    with gzip.open(path, "rb") as f:
+        data = f.read()
+    with gzip.open(path, "wb") as f:
+        f.write(data[:-10])
+
+    assert [p.url for p in read_snapshot(path)] == [f"{URL}/one/"]
@@ -0,0 +1,36 @@
+import pytest
+
+from sitesearch.api import suggest
+
+
+class FakeRedis:
+    def __init__(self, result):
+        self.result = result
+        self.commands = []
+
+    async def execute_command(self, *args):
+        self.commands.append(args)
+        return self.result
+
+
+@pytest.mark.asyncio
+async def test_suggest(monkeypatch, client, app_config):
+    redis = FakeRedis(["Redis Enterprise Cloud", "https://docs.redis.com/latest/rc/",
+                       "Redis Enterprise Software", None])
+    monkeypatch.setattr(suggest, "read_client", redis)
+
+    result = await client.get('/suggest?q=redis%20ent*&num=2&site=https://docs.redis.com/latest')
+
+    assert result.status_code == 200
+    assert result.json() == {"results": [
+        {"text": "Redis Enterprise Cloud", "url": "https://docs.redis.com/latest/rc/"},
+        {"text": "Redis Enterprise Software", "url": ""}
+    ]}
+    key = app_config.keys.suggestions("https://docs.redis.com/latest")
+    assert redis.commands == [("FT.SUGGET", key, "redis ent", "WITHPAYLOADS", "MAX", 2)]
+
+
+@pytest.mark.asyncio
+async def test_suggest_requires_a_valid_site(client):
+    result = await client.get('/suggest?q=redis&site=https://example.com')
+    assert result.status_code == 400